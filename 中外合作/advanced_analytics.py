@@ -1,12 +1,14 @@
 import pandas as pd
 import numpy as np
-import mysql.connector
 from mysql.connector import Error
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from data_version import read_data_version
+from daily_rollup import RESOLUTIONS, read_rollup, resample_daily_stats
+from pipeline_metrics import CountingConnection, input_rows, instrument, result_rows, write_run_metrics
+from report_sections import STATUS_LABELS, compute_sections
+from storage_backend import backend_of, connect, database_url, date_expression
+from student_schema import DB_COLUMNS, DERIVED_DB_COLUMNS, apply_dtypes, ensure_derived_metrics, fill_category
 import os
+import hashlib
 
 # 数据库配置
 DB_CONFIG = {
@@ -18,44 +20,130 @@ DB_CONFIG = {
 }
 
 def connect_to_database():
-    """连接到MySQL数据库并返回连接对象"""
+    """连接到数据库并返回连接对象
+    
+    设置了 STUDENT_DB_URL 时连接其指定的存储后端（例如 sqlite:///student_management.db），
+    否则按 DB_CONFIG 连接MySQL。
+    """
     try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
-        )
+        # 统计数据库往返次数
+        conn = CountingConnection(connect(database_url(), **DB_CONFIG))
         
         if conn.is_connected():
-            print("成功连接到MySQL数据库")
+            print(f"成功连接到{backend_of(conn)}数据库")
             return conn
     
-    except Error as e:
+    except (Error, ValueError) as e:
         print(f"数据库连接错误: {e}")
         return None
 
-def load_data():
-    """从数据库加载数据"""
+# 本地快照缓存目录
+CACHE_DIR = '.cache'
+
+# 本次运行中已加载的数据，各分析函数共享同一份
+_loaded_snapshot = {'version': None, 'df': None}
+
+def reset_loaded_data():
+    """丢弃本次运行中已加载的数据，长期运行的进程在数据库更新后调用，下次 load_data 重新检查数据版本"""
+    _loaded_snapshot.update(version=None, df=None)
+
+def _data_version(conn):
+    """用导入时维护的数据版本号以及行数和最大id/时间戳生成缓存版本，数据变化时版本随之变化
+    
+    原地更新（补算派生指标、强制重新导入等）不改变行数和最大值，由数据版本号反映。
+    """
+    cursor = conn.cursor()
+    stored_version = read_data_version(conn, cursor)
+    cursor.execute("""
+    SELECT COUNT(*), MAX(id), MAX(import_date), MAX(snapshot_time), MAX(removed_at)
+    FROM student_courses
+    """)
+    # 不同存储后端的数据分别缓存
+    fingerprint = '|'.join(str(value) for value in (database_url(), stored_version, *cursor.fetchone()))
+    cursor.close()
+    return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+def _cache_path(version):
+    """返回指定数据版本的缓存文件路径，未安装pyarrow时退回pickle格式"""
+    try:
+        import pyarrow  # noqa: F401
+        return os.path.join(CACHE_DIR, f"student_courses_{version}.parquet")
+    except ImportError:
+        return os.path.join(CACHE_DIR, f"student_courses_{version}.pkl")
+
+def _read_cache(path):
+    """读取本地快照缓存"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+def _write_cache(df, path):
+    """写入本地快照缓存，并删除旧版本的缓存文件"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+    
+    for name in os.listdir(CACHE_DIR):
+        old_path = os.path.join(CACHE_DIR, name)
+        if name.startswith('student_courses_') and old_path != path:
+            os.remove(old_path)
+
+def _latest_cache():
+    """返回最近写入的缓存文件路径，没有缓存时返回None"""
+    if not os.path.isdir(CACHE_DIR):
+        return None
+    paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+             if name.startswith('student_courses_') and not name.endswith('.tmp')]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+@instrument(rows=result_rows)
+def load_data(use_cache=True):
+    """从数据库加载数据
+    
+    use_cache 为True时，同一次运行中的多次调用共享同一份数据；数据库中的数据没有变化时，
+    直接读取本地列式缓存而不重新查询整张表。
+    """
+    if use_cache and _loaded_snapshot['df'] is not None:
+        return _loaded_snapshot['df'].copy()
+    
     conn = connect_to_database()
     if conn is None:
-        return pd.DataFrame()
+        # 数据库不可用时退回最近一次的缓存
+        cache_path = _latest_cache() if use_cache else None
+        if cache_path is None:
+            return pd.DataFrame()
+        print(f"数据库不可用，使用本地缓存 {cache_path}")
+        df = apply_dtypes(_read_cache(cache_path))
+        _loaded_snapshot.update(version=None, df=df)
+        return df.copy()
     
     try:
+        version = _data_version(conn) if use_cache else None
+        cache_path = _cache_path(version) if use_cache else None
+        if cache_path is not None and os.path.exists(cache_path):
+            conn.close()
+            df = apply_dtypes(_read_cache(cache_path))
+            print(f"数据未变化，使用本地缓存 {cache_path}")
+            _loaded_snapshot.update(version=version, df=df)
+            return df.copy()
+        
         query = """
-        SELECT 
-            student_name, phone_relation, phone_number, class_name, 
-            course_name, course_type, purchased_amount, gifted_amount,
-            consumed_amount, returned_amount, remaining_amount, over_amount,
-            consumed_fee, remaining_fee, absent_count, follow_up_person,
-            tutor, gender, wechat_status, card_status, face_status,
-            grade, student_id, school
+        SELECT {}, import_date
         FROM student_courses
-        """
+        WHERE removed_at IS NULL
+        """.format(', '.join(DB_COLUMNS + DERIVED_DB_COLUMNS))
         
-        df = pd.read_sql(query, conn)
+        df = apply_dtypes(pd.read_sql(query, conn))
         conn.close()
+        
+        if use_cache:
+            _write_cache(df, cache_path)
+            _loaded_snapshot.update(version=version, df=df)
+            return df.copy()
         return df
     
     except Error as e:
@@ -63,62 +151,44 @@ def load_data():
         conn.close()
         return pd.DataFrame()
 
+@instrument(rows=result_rows)
 def clean_and_prepare_data(df):
     """清洗和准备数据"""
     # 复制数据，避免修改原始数据
     df_clean = df.copy()
     
-    # 处理缺失值
-    numeric_columns = ['purchased_amount', 'gifted_amount', 'consumed_amount', 
-                       'returned_amount', 'remaining_amount', 'over_amount',
-                       'consumed_fee', 'remaining_fee', 'absent_count']
-    
-    for col in numeric_columns:
-        df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-        df_clean[col].fillna(0, inplace=True)
+    # 处理缺失值，并转换为统一定义的紧凑类型
+    df_clean = apply_dtypes(df_clean)
     
     # 填充分类变量的缺失值
     categorical_columns = ['gender', 'class_name', 'course_name', 'school']
     for col in categorical_columns:
-        df_clean[col].fillna('未知', inplace=True)
+        df_clean[col] = fill_category(df_clean[col], '未知')
     
-    # 添加派生特征
-    df_clean['course_completion_rate'] = (df_clean['consumed_amount'] / (df_clean['purchased_amount'] + df_clean['gifted_amount'])) * 100
-    df_clean['course_completion_rate'] = df_clean['course_completion_rate'].clip(0, 100)  # 限制在0-100%之间
-    df_clean['consumption_efficiency'] = df_clean['consumed_amount'] / (df_clean['absent_count'] + 1)  # 避免除以零
-    
-    return df_clean
+    # 派生指标在导入时已计算并保存，只为旧数据补算
+    return ensure_derived_metrics(df_clean)
 
-def student_clustering(df):
-    """使用K-Means对学生进行聚类分析"""
-    # 选择用于聚类的特征
-    features = ['purchased_amount', 'consumed_amount', 'remaining_amount', 
-                'absent_count', 'course_completion_rate']
+@instrument(rows=input_rows)
+def student_clustering(df, method='elbow', refit=False, **fit_options):
+    """使用K-Means对学生进行聚类分析
     
-    # 提取特征
-    X = df[features].copy()
+    聚类数按 method（'elbow' 或 'silhouette'）自动选择，已训练的模型按特征哈希复用。
+    fit_options 传给 clustering_engine.fit_clusters，例如 sample_size、minibatch、n_jobs。
+    """
+    # scikit-learn 导入较慢，只在需要聚类时导入
+    from clustering_engine import CLUSTER_FEATURES, assign_clusters
     
-    # 标准化特征
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    # 确定最佳聚类数
-    inertia = []
-    k_range = range(1, 11)
-    for k in k_range:
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        kmeans.fit(X_scaled)
-        inertia.append(kmeans.inertia_)
-    
-    # 应用肘部法则选择最佳聚类数
-    elbow_point = 3  # 根据肘部法则选择
+    # 提取特征
+    X = df[CLUSTER_FEATURES].fillna(0)
     
-    # 执行KMeans聚类
-    kmeans = KMeans(n_clusters=elbow_point, random_state=42)
-    df['cluster'] = kmeans.fit_predict(X_scaled)
+    # 选择聚类数并分配聚类，特征未变化时复用已训练的模型
+    df['cluster'] = assign_clusters(X, method=method, refit=refit, **fit_options)
     
-    # 分析每个聚类的特征
-    cluster_analysis = df.groupby('cluster').agg({
+    return df, cluster_summary(df)
+
+def cluster_summary(df):
+    """分析每个聚类的特征：各聚类的平均课时、缺课次数、完成率和学生数"""
+    return df.groupby('cluster').agg({
         'purchased_amount': 'mean',
         'consumed_amount': 'mean',
         'remaining_amount': 'mean',
@@ -126,19 +196,9 @@ def student_clustering(df):
         'course_completion_rate': 'mean',
         'student_name': 'count'
     }).rename(columns={'student_name': 'student_count'})
-    
-    return df, cluster_analysis
 
-def course_analysis(df):
-    """分析课程的受欢迎程度和完成率"""
-    course_stats = df.groupby('course_name').agg({
-        'student_name': 'count',
-        'purchased_amount': 'sum',
-        'consumed_amount': 'sum',
-        'remaining_amount': 'sum',
-        'absent_count': 'sum'
-    }).rename(columns={'student_name': 'student_count'})
-    
+def _rank_courses(course_stats):
+    """由课程汇总计算完成率和平均缺课次数，并给出三种排序"""
     course_stats['completion_rate'] = (course_stats['consumed_amount'] / course_stats['purchased_amount']) * 100
     course_stats['average_absences'] = course_stats['absent_count'] / course_stats['student_count']
     
@@ -156,17 +216,63 @@ def course_analysis(df):
         'lowest_absence': lowest_absence.head(10)
     }
 
-def attendance_pattern_analysis(df):
-    """分析学生出勤模式与课程进度的关系"""
-    # 计算每个学生的出勤率
-    df['attendance_rate'] = 1 - (df['absent_count'] / (df['consumed_amount'] + df['absent_count'] + 0.1))
-    df['attendance_rate'] = df['attendance_rate'].clip(0, 1)  # 限制在0-100%之间
-    
-    # 按出勤率分组
-    attendance_bins = [0, 0.6, 0.8, 0.9, 1.0]
-    attendance_labels = ['低(<60%)', '中(60-80%)', '良好(80-90%)', '优秀(>90%)']
-    df['attendance_group'] = pd.cut(df['attendance_rate'], bins=attendance_bins, labels=attendance_labels)
+def course_stats_from_frame(df):
+    """在pandas中按课程汇总学生数和课时"""
+    return df.groupby('course_name', observed=True).agg({
+        'student_name': 'count',
+        'purchased_amount': 'sum',
+        'consumed_amount': 'sum',
+        'remaining_amount': 'sum',
+        'absent_count': 'sum'
+    }).rename(columns={'student_name': 'student_count'})
+
+def course_stats_from_sql(conn, min_students=0):
+    """在数据库中按课程汇总学生数和课时，只传回汇总结果"""
+    query = """
+    SELECT 
+        COALESCE(course_name, '未知') AS course_name,
+        COUNT(student_name) AS student_count,
+        SUM(purchased_amount) AS purchased_amount,
+        SUM(consumed_amount) AS consumed_amount,
+        SUM(remaining_amount) AS remaining_amount,
+        SUM(absent_count) AS absent_count
+    FROM student_courses
+    WHERE removed_at IS NULL
+    GROUP BY COALESCE(course_name, '未知')
+    HAVING COUNT(student_name) >= %s
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, (min_students,))
+    course_stats = pd.DataFrame(cursor.fetchall(), columns=[
+        'course_name', 'student_count', 'purchased_amount', 'consumed_amount',
+        'remaining_amount', 'absent_count'
+    ]).set_index('course_name')
+    cursor.close()
+    
+    # SUM返回DECIMAL，转换为数值类型
+    return course_stats.apply(pd.to_numeric)
+
+@instrument(rows=input_rows)
+def course_analysis(df):
+    """分析课程的受欢迎程度和完成率"""
+    return _rank_courses(course_stats_from_frame(df))
+
+@instrument()
+def course_analysis_pushdown():
+    """在数据库中完成课程汇总后分析课程的受欢迎程度和完成率"""
+    conn = connect_to_database()
+    if conn is None:
+        return None
     
+    try:
+        course_stats = course_stats_from_sql(conn, min_students=5)
+    finally:
+        conn.close()
+    return _rank_courses(course_stats)
+
+@instrument(rows=input_rows)
+def attendance_pattern_analysis(df):
+    """分析学生出勤模式与课程进度的关系，出勤率分组使用导入时保存的 attendance_group"""
     # 分析不同出勤率组的课程完成情况
     attendance_analysis = df.groupby('attendance_group').agg({
         'course_completion_rate': 'mean',
@@ -176,35 +282,21 @@ def attendance_pattern_analysis(df):
     
     return attendance_analysis
 
-def generate_insights():
-    """生成数据洞察报告"""
-    # 加载数据
-    df = load_data()
-    if df.empty:
-        return "无法加载数据，请检查数据库连接"
-    
-    # 清洗和准备数据
-    df_prepared = clean_and_prepare_data(df)
-    
-    # 学生聚类分析
-    df_clustered, cluster_analysis = student_clustering(df_prepared)
-    
-    # 课程分析
-    course_insights = course_analysis(df_prepared)
-    
-    # 出勤模式分析
-    attendance_analysis = attendance_pattern_analysis(df_prepared)
-    
-    # 生成报告
-    report = """
-    # 学生课程数据高级分析报告
-    
+def _cluster_section(features):
+    """学生分群：按聚类汇总各组的课时、缺课和完成率"""
+    _, cluster_analysis = student_clustering(features.copy())
+    return cluster_analysis, """
     ## 1. 学生分群分析
     
     根据购买课时、消耗课时、剩余课时、缺课次数和课程完成率等指标，学生可以被分为以下几个群体：
     
     {}
-    
+    """.format(cluster_analysis.to_string())
+
+def _course_section(course_stats):
+    """课程排名：最受欢迎、完成率最高和缺勤率最低的课程"""
+    course_insights = _rank_courses(course_stats)
+    return course_insights, """
     ## 2. 最受欢迎的课程（学生数量最多）
     
     {}
@@ -216,38 +308,113 @@ def generate_insights():
     ## 4. 缺勤率最低的课程
     
     {}
-    
+    """.format(
+        course_insights['popular_courses'][['student_count', 'purchased_amount', 'consumed_amount']].to_string(),
+        course_insights['highest_completion'][['completion_rate', 'student_count']].to_string(),
+        course_insights['lowest_absence'][['average_absences', 'student_count']].to_string()
+    )
+
+def _attendance_section(attendance_inputs):
+    """出勤模式：不同出勤率分组的完成率和学习效率"""
+    attendance_analysis = attendance_pattern_analysis(attendance_inputs.copy())
+    return attendance_analysis, """
     ## 5. 出勤模式与课程进度分析
     
     学生的出勤情况与课程完成率和学习效率存在明显关联：
     
     {}
-    
+    """.format(attendance_analysis.to_string())
+
+def _findings_section(cluster_analysis, course_insights, attendance_analysis):
+    """关键发现：由前面各部分的结果汇总"""
+    findings = {
+        'popular_course': course_insights['popular_courses'].index[0],
+        'best_completion_course': course_insights['highest_completion'].index[0],
+        'excellent_attendance_rate': attendance_analysis['course_completion_rate'].get('优秀(>90%)', 0),
+        'low_attendance_rate': attendance_analysis['course_completion_rate'].get('低(<60%)', 0),
+        'focus_cluster': cluster_analysis['remaining_amount'].idxmax()
+    }
+    return findings, """
     ## 6. 关键发现和建议
     
-    1. 课程类型 "{}" 最受欢迎，拥有最多的学生。
-    2. 完成率最高的课程是 "{}"，可以研究其成功因素。
-    3. 出勤率为优秀(>90%)的学生课程完成率平均为 {:.2f}%，而出勤率低(<60%)的学生完成率仅为 {:.2f}%。
-    4. 建议重点关注聚类组 "{}" 的学生，该组学生购买课时多但完成率低。
+    1. 课程类型 "{popular_course}" 最受欢迎，拥有最多的学生。
+    2. 完成率最高的课程是 "{best_completion_course}"，可以研究其成功因素。
+    3. 出勤率为优秀(>90%)的学生课程完成率平均为 {excellent_attendance_rate:.2f}%，而出勤率低(<60%)的学生完成率仅为 {low_attendance_rate:.2f}%。
+    4. 建议重点关注聚类组 "{focus_cluster}" 的学生，该组学生购买课时多但完成率低。
     5. 建议为出勤率低的学生提供额外的支持和鼓励，以提高其课程完成率。
-    """.format(
-        cluster_analysis.to_string(),
-        course_insights['popular_courses'][['student_count', 'purchased_amount', 'consumed_amount']].to_string(),
-        course_insights['highest_completion'][['completion_rate', 'student_count']].to_string(),
-        course_insights['lowest_absence'][['average_absences', 'student_count']].to_string(),
-        attendance_analysis.to_string(),
-        course_insights['popular_courses'].index[0],
-        course_insights['highest_completion'].index[0],
-        attendance_analysis.loc['优秀(>90%)', 'course_completion_rate'] if '优秀(>90%)' in attendance_analysis.index else 0,
-        attendance_analysis.loc['低(<60%)', 'course_completion_rate'] if '低(<60%)' in attendance_analysis.index else 0,
-        cluster_analysis['remaining_amount'].idxmax()
+    """.format(**findings)
+
+# 洞察报告的各部分，按依赖顺序排列；依赖为报告输入或前面的部分，依赖的哈希不变时复用上次的结果
+REPORT_SECTIONS = {
+    'clusters': {'title': '学生分群分析', 'deps': ['cluster_features'], 'compute': _cluster_section},
+    'courses': {'title': '课程排名', 'deps': ['course_stats'], 'compute': _course_section},
+    'attendance': {'title': '出勤模式分析', 'deps': ['attendance_inputs'], 'compute': _attendance_section},
+    'findings': {'title': '关键发现和建议', 'deps': ['clusters', 'courses', 'attendance'],
+                 'compute': _findings_section}
+}
+
+def report_inputs(df_prepared, pushdown=False):
+    """提取报告各部分依赖的输入：聚类特征矩阵、课程级汇总和出勤分析需要的列"""
+    from clustering_engine import CLUSTER_FEATURES
+    
+    if pushdown:
+        conn = connect_to_database()
+        if conn is None:
+            return None
+        try:
+            course_stats = course_stats_from_sql(conn, min_students=5)
+        finally:
+            conn.close()
+    else:
+        course_stats = course_stats_from_frame(df_prepared)
+    
+    return {
+        'cluster_features': df_prepared[CLUSTER_FEATURES + ['student_name']],
+        'course_stats': course_stats,
+        'attendance_inputs': df_prepared[['attendance_group', 'course_completion_rate', 'consumption_efficiency',
+                                          'student_name']]
+    }
+
+@instrument()
+def generate_insights(pushdown=False, force=False):
+    """生成数据洞察报告
+    
+    报告按 REPORT_SECTIONS 分部分计算，输入未变化的部分直接复用缓存；pushdown 为True时课程汇总在
+    数据库中完成，force 为True时重新计算所有部分。
+    """
+    # 加载数据
+    df = load_data()
+    if df.empty:
+        return "无法加载数据，请检查数据库连接"
+    
+    # 清洗和准备数据
+    df_prepared = clean_and_prepare_data(df)
+    
+    inputs = report_inputs(df_prepared, pushdown=pushdown)
+    if inputs is None:
+        return "无法加载数据，请检查数据库连接"
+    
+    _, markdown, summary = compute_sections(REPORT_SECTIONS, inputs, force=force)
+    
+    # 附上各部分的计算情况
+    status_lines = '\n'.join(
+        f"    - {REPORT_SECTIONS[name]['title']}：{STATUS_LABELS[info['status']]}，耗时 {info['seconds']:.2f} 秒"
+        for name, info in summary.items()
     )
+    report = """
+    # 学生课程数据高级分析报告
+    {}
+    ## 附：报告各部分的计算情况
+
+{}
+    """.format(''.join(markdown[name] for name in REPORT_SECTIONS), status_lines)
     
     return report
 
-def save_report_to_file():
+@instrument()
+def save_report_to_file(pushdown=False, force=False):
     """将分析报告保存到文件"""
-    report = generate_insights()
+    report = generate_insights(pushdown=pushdown, force=force)
     
     # 保存到文件
     with open('学生课程数据分析报告.md', 'w', encoding='utf-8') as f:
@@ -258,11 +425,15 @@ def save_report_to_file():
     # 生成可视化并保存
     create_visualizations()
 
-def create_visualizations():
-    """创建高级数据可视化并保存为图片"""
-    # 确保存在图片目录
-    if not os.path.exists('visualizations'):
-        os.makedirs('visualizations')
+@instrument()
+def create_visualizations(config=None, max_workers=None, force=False, plot_mode='auto'):
+    """创建高级数据可视化并保存为图片
+    
+    图表在多个进程中并行绘制，输入数据未变化的图表直接复用上次的结果。
+    config 可按图表覆盖分辨率和格式，例如 {'学生性别分布': {'dpi': 150, 'format': 'svg'}}。
+    plot_mode 见 chart_renderer.PLOT_MODES，数据量较大时散点图抽样或分箱、箱线图改用预先计算的分位数。
+    """
+    from chart_renderer import build_chart_inputs, render_charts
     
     # 加载数据
     df = load_data()
@@ -273,98 +444,19 @@ def create_visualizations():
     # 清洗和准备数据
     df_prepared = clean_and_prepare_data(df)
     
-    # 设置Seaborn样式
-    sns.set(style="whitegrid")
-    
-    # 1. 课程类型分布可视化
-    plt.figure(figsize=(12, 6))
-    course_type_counts = df_prepared['course_type'].value_counts().sort_values(ascending=False)
-    sns.barplot(x=course_type_counts.index, y=course_type_counts.values)
-    plt.title('课程类型分布', fontsize=16)
-    plt.xlabel('课程类型')
-    plt.ylabel('学生数量')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig('visualizations/课程类型分布.png', dpi=300)
-    plt.close()
-    
-    # 2. 课程完成率与缺课次数关系
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(data=df_prepared, x='absent_count', y='course_completion_rate', 
-                    hue='gender', size='purchased_amount', sizes=(20, 200), alpha=0.7)
-    plt.title('课程完成率与缺课次数关系', fontsize=16)
-    plt.xlabel('缺课次数')
-    plt.ylabel('课程完成率 (%)')
-    plt.tight_layout()
-    plt.savefig('visualizations/课程完成率与缺课次数关系.png', dpi=300)
-    plt.close()
-    
-    # 3. 聚类分析可视化
+    # 聚类结果（复用已训练的模型）
     df_clustered, _ = student_clustering(df_prepared)
     
-    plt.figure(figsize=(12, 8))
-    sns.scatterplot(data=df_clustered, x='consumed_amount', y='remaining_amount', 
-                  hue='cluster', size='purchased_amount', sizes=(20, 200), alpha=0.7, palette='viridis')
-    plt.title('学生消耗课时与剩余课时聚类分析', fontsize=16)
-    plt.xlabel('消耗课时')
-    plt.ylabel('剩余课时')
-    plt.tight_layout()
-    plt.savefig('visualizations/学生课时聚类分析.png', dpi=300)
-    plt.close()
-    
-    # 4. 出勤率与课程完成率的箱线图
-    plt.figure(figsize=(12, 6))
-    df_clustered['attendance_group'] = pd.cut(
-        1 - (df_clustered['absent_count'] / (df_clustered['consumed_amount'] + df_clustered['absent_count'] + 0.1)).clip(0, 1),
-        bins=[0, 0.6, 0.8, 0.9, 1.0],
-        labels=['低(<60%)', '中(60-80%)', '良好(80-90%)', '优秀(>90%)']
-    )
-    sns.boxplot(data=df_clustered, x='attendance_group', y='course_completion_rate')
-    plt.title('不同出勤率的课程完成率分布', fontsize=16)
-    plt.xlabel('出勤率分组')
-    plt.ylabel('课程完成率 (%)')
-    plt.tight_layout()
-    plt.savefig('visualizations/出勤率与课程完成率关系.png', dpi=300)
-    plt.close()
-    
-    # 5. 学生性别分布饼图
-    plt.figure(figsize=(8, 8))
-    gender_counts = df_prepared['gender'].value_counts()
-    plt.pie(gender_counts, labels=gender_counts.index, autopct='%1.1f%%', 
-           colors=sns.color_palette('pastel'), startangle=90)
-    plt.title('学生性别分布', fontsize=16)
-    plt.axis('equal')
-    plt.tight_layout()
-    plt.savefig('visualizations/学生性别分布.png', dpi=300)
-    plt.close()
+    # 提取各图表的输入并渲染
+    inputs = build_chart_inputs(df_prepared, df_clustered, plot_mode=plot_mode)
+    summary = render_charts(inputs, output_dir='visualizations', config=config,
+                            max_workers=max_workers, force=force)
     
-    # 6. 热力图：班级与课程类型的关系
-    plt.figure(figsize=(14, 10))
-    class_course_counts = pd.crosstab(df_prepared['class_name'], df_prepared['course_type'])
-    # 只保留主要班级和课程类型，避免图表过于复杂
-    main_classes = df_prepared['class_name'].value_counts().head(10).index
-    main_course_types = df_prepared['course_type'].value_counts().head(8).index
-    filtered_counts = class_course_counts.loc[main_classes, main_course_types]
-    
-    sns.heatmap(filtered_counts, annot=True, fmt='d', cmap='YlGnBu')
-    plt.title('班级与课程类型关系热力图', fontsize=16)
-    plt.xlabel('课程类型')
-    plt.ylabel('班级')
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    plt.savefig('visualizations/班级课程关系热力图.png', dpi=300)
-    plt.close()
-    
-    print(f"已生成6个高级数据可视化图表，保存在 'visualizations' 目录")
+    print(f"已生成{len(inputs)}个高级数据可视化图表（新绘制 {len(summary['rendered'])} 个，"
+          f"复用 {len(summary['reused'])} 个），保存在 'visualizations' 目录")
 
-def perform_time_series_analysis():
-    """执行时间序列分析，分析学生购课和消耗趋势"""
-    # 加载数据
-    df = load_data()
-    if df.empty:
-        print("无法加载数据，请检查数据库连接")
-        return
-    
+def daily_stats_from_frame(df):
+    """在pandas中按导入日期汇总并计算累计值"""
     # 将导入日期转换为日期类型
     df['import_date'] = pd.to_datetime(df['import_date'], errors='coerce')
     
@@ -375,18 +467,128 @@ def perform_time_series_analysis():
         'consumed_amount': 'sum'
     }).rename(columns={'student_name': 'student_count'})
     
-    # 计算累计值
+    return _add_cumulative_columns(daily_stats)
+
+def daily_stats_from_sql(conn):
+    """在数据库中按导入日期汇总，再计算累计值"""
+    import_day = date_expression(conn, 'import_date')
+    query = f"""
+    SELECT 
+        {import_day} AS import_date,
+        COUNT(student_name) AS student_count,
+        SUM(purchased_amount) AS purchased_amount,
+        SUM(consumed_amount) AS consumed_amount
+    FROM student_courses
+    WHERE removed_at IS NULL AND import_date IS NOT NULL
+    GROUP BY {import_day}
+    ORDER BY {import_day}
+    """
+    cursor = conn.cursor()
+    cursor.execute(query)
+    daily_stats = pd.DataFrame(cursor.fetchall(), columns=[
+        'import_date', 'student_count', 'purchased_amount', 'consumed_amount'
+    ])
+    cursor.close()
+    
+    daily_stats['import_date'] = pd.to_datetime(daily_stats['import_date']).dt.date
+    daily_stats = daily_stats.set_index('import_date').apply(pd.to_numeric)
+    return _add_cumulative_columns(daily_stats)
+
+def _add_cumulative_columns(daily_stats):
+    """计算累计学生数和累计课时"""
     daily_stats['cumulative_students'] = daily_stats['student_count'].cumsum()
     daily_stats['cumulative_purchased'] = daily_stats['purchased_amount'].cumsum()
     daily_stats['cumulative_consumed'] = daily_stats['consumed_amount'].cumsum()
+    return daily_stats
+
+def verify_pushdown(rtol=1e-9):
+    """校验数据库汇总与pandas汇总的结果是否一致"""
+    df = load_data()
+    conn = connect_to_database()
+    if df.empty or conn is None:
+        print("无法加载数据，请检查数据库连接")
+        return False
     
-    # 创建时间序列可视化
+    try:
+        checks = {
+            '课程汇总': (course_stats_from_frame(clean_and_prepare_data(df)), course_stats_from_sql(conn)),
+            '每日汇总': (daily_stats_from_frame(df), daily_stats_from_sql(conn)),
+            '每日汇总表': (daily_stats_from_frame(df), read_rollup(conn))
+        }
+    finally:
+        conn.close()
+    
+    consistent = True
+    for name, (frame_result, sql_result) in checks.items():
+        frame_result = frame_result.sort_index().astype(float)
+        sql_result = sql_result.reindex(index=frame_result.index, columns=frame_result.columns).astype(float)
+        same_keys = len(frame_result) == len(sql_result.dropna(how='all'))
+        same_values = np.allclose(frame_result.values, sql_result.values, rtol=rtol, equal_nan=True)
+        if same_keys and same_values:
+            print(f"{name}: 数据库汇总与pandas汇总一致 ({len(frame_result)} 组)")
+        else:
+            consistent = False
+            diff = (frame_result - sql_result).abs()
+            print(f"{name}: 数据库汇总与pandas汇总不一致")
+            print(diff[diff.gt(0).any(axis=1)].head(10).to_string())
+    
+    return consistent
+
+def daily_stats_from_rollup(resolution='D'):
+    """读取导入时维护的每日汇总表，汇总表不存在或为空时返回None"""
+    conn = connect_to_database()
+    if conn is None:
+        return None
+    try:
+        daily_stats = read_rollup(conn, resolution)
+    except Error as e:
+        print(f"读取每日汇总表时出错: {e}")
+        return None
+    finally:
+        conn.close()
+    return None if daily_stats.empty else daily_stats
+
+@instrument()
+def perform_time_series_analysis(pushdown=False, resolution='D', use_rollup=True):
+    """执行时间序列分析，分析学生购课和消耗趋势
+    
+    use_rollup 为True时只读取导入时维护的每日汇总表；汇总表不可用时，pushdown 为True在数据库中
+    按日汇总，否则读取全部明细在pandas中汇总。resolution 可选 'D'（按日）、'W'（按周）、'M'（按月）。
+    """
+    if resolution not in RESOLUTIONS:
+        print(f"未知的汇总粒度: {resolution}，可选: {', '.join(RESOLUTIONS)}")
+        return
+    _, resolution_label = RESOLUTIONS[resolution]
+    
+    # 优先读取每日汇总表，其大小只与天数有关
+    daily_stats = daily_stats_from_rollup(resolution) if use_rollup else None
+    if daily_stats is None:
+        if pushdown:
+            conn = connect_to_database()
+            if conn is None:
+                print("无法加载数据，请检查数据库连接")
+                return
+            try:
+                daily_stats = daily_stats_from_sql(conn)
+            finally:
+                conn.close()
+        else:
+            # 加载数据
+            df = load_data()
+            if df.empty:
+                print("无法加载数据，请检查数据库连接")
+                return
+            daily_stats = daily_stats_from_frame(df)
+        daily_stats = resample_daily_stats(daily_stats, resolution)
+    
+    # 创建时间序列可视化，matplotlib 只在绘图时导入
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(14, 8))
     
     # 学生累计增长曲线
     plt.subplot(2, 1, 1)
     plt.plot(daily_stats.index, daily_stats['cumulative_students'], marker='o', linestyle='-', label='累计学生数')
-    plt.title('学生累计增长趋势', fontsize=14)
+    plt.title(f'学生累计增长趋势（{resolution_label}）', fontsize=14)
     plt.ylabel('学生数量')
     plt.grid(True, linestyle='--', alpha=0.7)
     plt.legend()
@@ -395,7 +597,7 @@ def perform_time_series_analysis():
     plt.subplot(2, 1, 2)
     plt.plot(daily_stats.index, daily_stats['cumulative_purchased'], marker='s', linestyle='-', label='累计购买课时')
     plt.plot(daily_stats.index, daily_stats['cumulative_consumed'], marker='^', linestyle='-', label='累计消耗课时')
-    plt.title('课时购买与消耗趋势', fontsize=14)
+    plt.title(f'课时购买与消耗趋势（{resolution_label}）', fontsize=14)
     plt.ylabel('课时数量')
     plt.grid(True, linestyle='--', alpha=0.7)
     plt.legend()
@@ -403,11 +605,14 @@ def perform_time_series_analysis():
     plt.tight_layout()
     if not os.path.exists('visualizations'):
         os.makedirs('visualizations')
-    plt.savefig('visualizations/时间序列分析.png', dpi=300)
+    # 按日的图表沿用原文件名
+    output_path = 'visualizations/时间序列分析.png' if resolution == 'D' else f'visualizations/时间序列分析_{resolution_label}.png'
+    plt.savefig(output_path, dpi=300)
     plt.close()
     
-    print("时间序列分析已完成，图表保存在 'visualizations/时间序列分析.png'")
+    print(f"时间序列分析已完成，图表保存在 '{output_path}'")
 
 if __name__ == "__main__":
     save_report_to_file()
-    perform_time_series_analysis()
\ No newline at end of file
+    perform_time_series_analysis()
+    write_run_metrics()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import argparse
+import sys
+import time
+from contextlib import contextmanager
+from pipeline_metrics import stage, write_run_metrics
+
+# 进程启动的时间，用于计算各子命令的启动耗时
+_started = time.perf_counter()
+
+# 轻量子命令的启动耗时上限（秒），超过时给出提示；这些命令不应导入 seaborn 和 scikit-learn
+STARTUP_BUDGET = {'timeseries': 2.0, 'regions': 1.0}
+
+# 参数原样转交给对应模块 main() 的子命令，这些模块会自行保存运行指标
+FORWARDED_COMMANDS = ('import', 'watch', 'fanout', 'risk')
+
+# 与 chart_renderer.PLOT_MODES、daily_rollup.RESOLUTIONS 一致，解析参数时不导入 pandas
+PLOT_MODES = ('auto', 'full', 'sample', 'hexbin')
+RESOLUTIONS = ('D', 'W', 'M')
+
+@contextmanager
+def _startup(command):
+    """将子命令依赖的导入记录为 startup 阶段，并检查从进程启动到导入完成的耗时"""
+    with stage('startup') as record:
+        record['command'] = command
+        yield
+    elapsed = time.perf_counter() - _started
+    record['since_process_start'] = round(elapsed, 4)
+    budget = STARTUP_BUDGET.get(command)
+    if budget is not None and elapsed > budget:
+        print(f"提示: {command} 的启动耗时 {elapsed:.2f} 秒，超过预期的 {budget:.1f} 秒，请检查是否引入了较重的依赖")
+
+def run_import(args, extra):
+    """导入导出文件，参数原样交给 batch_import"""
+    with _startup('import'):
+        import batch_import
+    batch_import.main(extra)
+
+def run_watch(args, extra):
+    """监视导出目录并自动增量导入，参数原样交给 export_watcher"""
+    with _startup('watch'):
+        import export_watcher
+    export_watcher.main(extra)
+
+def run_fanout(args, extra):
+    """按学管师、跟进人和校区并行生成分组报告，参数原样交给 report_fanout"""
+    with _startup('fanout'):
+        import report_fanout
+    report_fanout.main(extra)
+
+def run_risk(args, extra):
+    """重新计算风险评分并列出需要关注的学生，参数原样交给 risk_scoring"""
+    with _startup('risk'):
+        import risk_scoring
+    risk_scoring.main(extra)
+
+def run_report(args, extra):
+    """生成分析报告，不绘制图表"""
+    with _startup('report'):
+        from advanced_analytics import generate_insights
+    report = generate_insights(pushdown=args.pushdown, force=args.force)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(report)
+    print(f"分析报告已保存到 '{args.output}'")
+
+def run_cluster(args, extra):
+    """对学生进行聚类并输出各聚类的汇总"""
+    with _startup('cluster'):
+        from advanced_analytics import clean_and_prepare_data, load_data, student_clustering
+    df = load_data()
+    if df.empty:
+        print("无法加载数据，请检查数据库连接")
+        return
+    fit_options = {'minibatch': args.minibatch}
+    if args.sample_size:
+        fit_options['sample_size'] = args.sample_size
+    _, cluster_analysis = student_clustering(clean_and_prepare_data(df), method=args.method,
+                                             refit=args.refit, **fit_options)
+    print(cluster_analysis.to_string())
+
+def run_charts(args, extra):
+    """绘制高级数据可视化图表"""
+    with _startup('charts'):
+        from advanced_analytics import create_visualizations
+    create_visualizations(max_workers=args.workers, force=args.force, plot_mode=args.plot_mode)
+
+def run_timeseries(args, extra):
+    """绘制学生购课和消耗的时间序列"""
+    with _startup('timeseries'):
+        from advanced_analytics import perform_time_series_analysis
+    perform_time_series_analysis(pushdown=args.pushdown, resolution=args.resolution,
+                                 use_rollup=not args.no_rollup)
+
+def run_regions(args, extra):
+    """统计中外合作办学机构的地区分布"""
+    with _startup('regions'):
+        import analyze_edu_data
+    analyze_edu_data.main(args.input, args.output)
+
+def build_parser():
+    """创建命令行解析器，各子命令的依赖在执行时才导入"""
+    parser = argparse.ArgumentParser(description='学生课程数据和中外合作办学数据的分析工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    # import 的参数与 batch_import.py 相同，直接转交
+    import_parser = subparsers.add_parser('import', add_help=False,
+                                          help='导入导出文件，参数同 batch_import.py（import --help 查看）')
+    import_parser.set_defaults(handler=run_import)
+    
+    report_parser = subparsers.add_parser('report', help='生成学生课程数据分析报告')
+    report_parser.add_argument('--output', default='学生课程数据分析报告.md',
+                               help='报告文件 (默认: 学生课程数据分析报告.md)')
+    report_parser.add_argument('--pushdown', action='store_true', help='课程汇总在数据库中完成')
+    report_parser.add_argument('--force', action='store_true', help='忽略缓存，重新计算报告的所有部分')
+    report_parser.set_defaults(handler=run_report)
+    
+    # watch 的参数与 export_watcher.py 相同，直接转交
+    watch_parser = subparsers.add_parser('watch', add_help=False,
+                                         help='监视导出目录，自动导入新快照并刷新报告（watch --help 查看）')
+    watch_parser.set_defaults(handler=run_watch)
+    
+    # fanout 的参数与 report_fanout.py 相同，直接转交
+    fanout_parser = subparsers.add_parser('fanout', add_help=False,
+                                          help='按学管师、跟进人和校区并行生成分组报告（fanout --help 查看）')
+    fanout_parser.set_defaults(handler=run_fanout)
+    
+    # risk 的参数与 risk_scoring.py 相同，直接转交
+    risk_parser = subparsers.add_parser('risk', add_help=False,
+                                        help='重新计算风险评分并列出需要关注的学生（risk --help 查看）')
+    risk_parser.set_defaults(handler=run_risk)
+    
+    cluster_parser = subparsers.add_parser('cluster', help='学生聚类分析')
+    cluster_parser.add_argument('--method', choices=['elbow', 'silhouette'], default='elbow',
+                                help='选择聚类数的方法 (默认: elbow)')
+    cluster_parser.add_argument('--refit', action='store_true', help='忽略已训练的模型，重新选择聚类数并训练')
+    cluster_parser.add_argument('--minibatch', action='store_true', help='使用MiniBatchKMeans')
+    cluster_parser.add_argument('--sample-size', type=int, default=None, help='选择聚类数时的抽样行数')
+    cluster_parser.set_defaults(handler=run_cluster)
+    
+    charts_parser = subparsers.add_parser('charts', help='绘制高级数据可视化图表')
+    charts_parser.add_argument('--plot-mode', choices=PLOT_MODES, default='auto',
+                               help='散点图和箱线图的绘图模式 (默认: auto)')
+    charts_parser.add_argument('--workers', type=int, default=None, help='绘图使用的进程数 (默认: CPU核数)')
+    charts_parser.add_argument('--force', action='store_true', help='忽略缓存，重新绘制所有图表')
+    charts_parser.set_defaults(handler=run_charts)
+    
+    timeseries_parser = subparsers.add_parser('timeseries', help='学生购课和消耗的时间序列分析')
+    timeseries_parser.add_argument('--resolution', choices=RESOLUTIONS, default='D',
+                                   help='汇总粒度，D 按日、W 按周、M 按月 (默认: D)')
+    timeseries_parser.add_argument('--pushdown', action='store_true', help='汇总表不可用时在数据库中按日汇总')
+    timeseries_parser.add_argument('--no-rollup', action='store_true', help='不读取每日汇总表')
+    timeseries_parser.set_defaults(handler=run_timeseries)
+    
+    regions_parser = subparsers.add_parser('regions', help='中外合作办学机构的地区统计')
+    regions_parser.add_argument('--input', default='中外合作办学机构数据.csv',
+                                help='机构数据CSV (默认: 中外合作办学机构数据.csv)')
+    regions_parser.add_argument('--output', default='中外合作办学机构统计.csv',
+                                help='统计结果CSV (默认: 中外合作办学机构统计.csv)')
+    regions_parser.set_defaults(handler=run_regions)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in FORWARDED_COMMANDS:
+        parser.error(f"无法识别的参数: {' '.join(extra)}")
+    args.handler(args, extra)
+    if args.command not in FORWARDED_COMMANDS:
+        write_run_metrics()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,246 @@
+import argparse
+import getpass
+import glob
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import mysql.connector
+from mysql.connector import Error, pooling
+from direct_mysql_import import (
+    campus_prefixes,
+    create_database_and_table,
+    delta_import,
+    import_to_mysql,
+    parse_snapshot_time,
+    process_csv_file,
+)
+from pipeline_metrics import CountingConnection, write_run_metrics
+from storage_backend import DATABASE_URL_ENV, LAYOUTS, EmbeddedPool, database_layout
+
+# 目录参数下匹配的导出文件名
+EXPORT_FILE_PATTERN = '学生报读课程*.csv'
+
+# mysql.connector 连接池允许的最大连接数
+MAX_POOL_SIZE = 32
+
+def resolve_export_files(paths):
+    """将目录或通配符参数展开为按快照时间排序的导出文件列表"""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            files.update(glob.glob(os.path.join(path, EXPORT_FILE_PATTERN)))
+        else:
+            files.update(match for match in glob.glob(path) if os.path.isfile(match))
+    return sorted(files, key=lambda f: (parse_snapshot_time(f), f))
+
+def _parse_file(path):
+    """在子进程中读取并清洗单个导出文件"""
+    start_time = time.perf_counter()
+    df = process_csv_file(path)
+    return df, time.perf_counter() - start_time
+
+def _write_file(path, df, pool, mode, batch_size):
+    """从连接池取出连接，将单个文件的数据写入数据库"""
+    start_time = time.perf_counter()
+    prefixes = campus_prefixes(df)
+    conn = CountingConnection(pool.get_connection())
+    cursor = conn.cursor()
+    try:
+        if mode == 'delta':
+            imported = delta_import(df, conn, cursor, parse_snapshot_time(path),
+                                    batch_size=batch_size, scope_prefixes=prefixes)
+        else:
+            imported = import_to_mysql(df, conn, cursor, batch_size=batch_size, mode=mode)
+    finally:
+        cursor.close()
+        conn.close()
+    return imported, prefixes, time.perf_counter() - start_time
+
+def _writable_files(files, campuses, submitted, finished, mode):
+    """返回现在可以提交写入的文件
+    
+    非增量模式下解析完成即可写入。增量模式下同一校区的快照必须按时间顺序逐个写入：按快照时间顺序检查，
+    更早的文件尚未解析完（校区未知）时停止；与更早且尚未写完的文件有相同校区的文件继续等待。
+    """
+    if mode != 'delta':
+        return [path for path in files if path in campuses and path not in submitted]
+    
+    ready = []
+    busy_campuses = set()
+    for path in files:
+        if path in finished:
+            continue
+        if path not in campuses:
+            break
+        if path not in submitted and not campuses[path] & busy_campuses:
+            ready.append(path)
+        busy_campuses |= campuses[path]
+    return ready
+
+def print_summary(results):
+    """输出每个文件的导入汇总"""
+    print("\n导入汇总：")
+    print(f"{'文件':<40} {'校区':<16} {'行数':>8} {'解析(秒)':>10} {'写入(秒)':>10} {'行/秒':>10}  状态")
+    for result in results:
+        rows_per_sec = result['rows'] / result['write_seconds'] if result['write_seconds'] > 0 else 0
+        campuses = ','.join(prefix for prefix in result['campuses'] if prefix) or '-'
+        print(f"{os.path.basename(result['file']):<40} {campuses:<16} "
+              f"{result['rows']:>8} {result['parse_seconds']:>10.2f} {result['write_seconds']:>10.2f} "
+              f"{rows_per_sec:>10.0f}  {result['status']}")
+
+def run_batch_import(files, pool, mode='batch', workers=None, writers=4, batch_size=1000):
+    """用进程池解析清洗文件，再通过连接池并行写入数据库，返回每个文件的结果
+    
+    files 需按快照时间排序（见 resolve_export_files），增量模式下同一校区的快照按此顺序写入。
+    """
+    results = {path: {'file': path, 'campuses': [], 'rows': 0, 'parse_seconds': 0.0,
+                      'write_seconds': 0.0, 'status': '未处理'} for path in files}
+    
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=writers) as write_pool:
+        parse_futures = {parse_pool.submit(_parse_file, path): path for path in files}
+        write_futures = {}
+        # 已解析、等待写入的数据及其校区，写完后释放
+        parsed, campuses = {}, {}
+        submitted, finished = set(), set()
+        pending = set(parse_futures)
+        
+        # 文件解析完成后尽快提交写入，解析与写入并行进行
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parse_futures:
+                    path = parse_futures[future]
+                    try:
+                        df, parse_seconds = future.result()
+                    except Exception as e:
+                        results[path]['status'] = f"解析失败: {e}"
+                        finished.add(path)
+                        continue
+                    
+                    results[path]['parse_seconds'] = parse_seconds
+                    if df is None:
+                        results[path]['status'] = "解析失败"
+                        finished.add(path)
+                        continue
+                    results[path]['rows'] = len(df)
+                    parsed[path] = df
+                    campuses[path] = set(campus_prefixes(df))
+                    continue
+                
+                path = write_futures[future]
+                finished.add(path)
+                del parsed[path], campuses[path]
+                try:
+                    imported, prefixes, write_seconds = future.result()
+                except Exception as e:
+                    results[path]['status'] = f"写入失败: {e}"
+                    continue
+                results[path]['campuses'] = prefixes
+                results[path]['write_seconds'] = write_seconds
+                if not imported:
+                    results[path]['status'] = "写入失败"
+                elif mode == 'delta' and imported['skipped']:
+                    results[path]['status'] = "跳过: 已导入更新的快照"
+                else:
+                    results[path]['status'] = "成功"
+            
+            for path in _writable_files(files, campuses, submitted, finished, mode):
+                submitted.add(path)
+                future = write_pool.submit(_write_file, path, parsed[path], pool, mode, batch_size)
+                write_futures[future] = path
+                pending.add(future)
+    
+    return [results[path] for path in files]
+
+def _run_and_report(files, pool, args, writers):
+    """运行批量导入并输出汇总和运行指标"""
+    start_time = time.perf_counter()
+    results = run_batch_import(files, pool, mode=args.mode, workers=args.workers,
+                               writers=writers, batch_size=args.batch_size)
+    print_summary(results)
+    
+    total_rows = sum(result['rows'] for result in results)
+    elapsed = time.perf_counter() - start_time
+    print(f"\n共导入 {total_rows} 条记录，总耗时 {elapsed:.2f} 秒")
+    write_run_metrics()
+
+def create_pool(url, writers, mode='batch', host='localhost', port=3306, user='root', password=None,
+                database='student_management', layout=None):
+    """创建数据库和表，返回 (连接池, 实际可用的写入连接数)；失败时返回 (None, 0)"""
+    if url:
+        # 嵌入式数据库同一时间只允许一个写入者
+        pool = EmbeddedPool(url)
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        created = create_database_and_table(conn, cursor, database, layout)
+        cursor.close()
+        conn.close()
+        return (pool, 1) if created else (None, 0)
+    
+    writers = max(1, min(writers, MAX_POOL_SIZE))
+    try:
+        # 先用单独的连接创建数据库和表
+        conn = mysql.connector.connect(host=host, port=port, user=user, password=password)
+        cursor = conn.cursor()
+        created = create_database_and_table(conn, cursor, database, layout)
+        cursor.close()
+        conn.close()
+        if not created:
+            return None, 0
+        
+        pool = pooling.MySQLConnectionPool(
+            pool_name='student_courses_import',
+            pool_size=writers,
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            database=database,
+            allow_local_infile=(mode == 'infile')
+        )
+    except Error as e:
+        print(f"连接MySQL时出错: {e}")
+        return None, 0
+    return pool, writers
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并行导入多个校区/多天的学生报读课程导出文件')
+    parser.add_argument('paths', nargs='+', help='导出文件所在目录或通配符，例如 exports/ 或 "exports/学生报读课程2025*.csv"')
+    parser.add_argument('--url', default=os.environ.get(DATABASE_URL_ENV),
+                        help='嵌入式数据库地址，例如 sqlite:///student_management.db (默认: 连接MySQL)')
+    parser.add_argument('--host', default='localhost', help='MySQL主机地址 (默认: localhost)')
+    parser.add_argument('--port', type=int, default=3306, help='MySQL端口 (默认: 3306)')
+    parser.add_argument('--user', default='root', help='MySQL用户名 (默认: root)')
+    parser.add_argument('--database', default='student_management', help='数据库名 (默认: student_management)')
+    parser.add_argument('--layout', choices=LAYOUTS, default=database_layout(),
+                        help='存储布局，normalized 拆分为学员/课程班级/报读记录三张表 (默认: 沿用数据库现有布局)')
+    parser.add_argument('--mode', choices=['row', 'batch', 'infile', 'delta'], default='batch',
+                        help='导入模式 (默认: batch)')
+    parser.add_argument('--workers', type=int, default=None, help='解析清洗使用的进程数 (默认: CPU核数)')
+    parser.add_argument('--writers', type=int, default=4, help='并行写入的数据库连接数 (默认: 4)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数 (默认: 1000)')
+    args = parser.parse_args(argv)
+    
+    files = resolve_export_files(args.paths)
+    if not files:
+        print("错误: 没有找到需要导入的导出文件")
+        return
+    print(f"共找到 {len(files)} 个导出文件")
+    
+    if args.url:
+        password = None
+    else:
+        # 密码优先从环境变量读取，便于无人值守运行
+        password = os.environ.get('MYSQL_PWD') or getpass.getpass("请输入MySQL密码: ")
+    
+    pool, writers = create_pool(args.url, args.writers, mode=args.mode, host=args.host, port=args.port,
+                                user=args.user, password=password, database=args.database,
+                                layout=args.layout)
+    if pool is None:
+        return
+    
+    _run_and_report(files, pool, args, writers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+import clustering_engine
+from advanced_analytics import clean_and_prepare_data, course_analysis, student_clustering
+from chart_renderer import PLOT_MODES, build_chart_inputs, render_charts
+from direct_mysql_import import create_database_and_table, import_to_mysql, process_csv_file
+from risk_scoring import refresh_risk_scores, score_frame
+from storage_backend import EMBEDDED_BACKENDS, LAYOUTS, connect
+from student_schema import DB_COLUMNS, DERIVED_DB_COLUMNS, apply_dtypes
+from synthetic_data import generate_export, parse_size, synthetic_export_path
+
+# 基准测试结果目录
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+# 与基准结果相比，吞吐量下降超过该比例视为性能回退
+DEFAULT_TOLERANCE = 0.2
+
+def measure_stage(results, name, rows, func, *args, **kwargs):
+    """运行一个阶段并记录耗时、吞吐量和峰值内存"""
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start_time
+    peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+    
+    rows = rows(result) if callable(rows) else rows
+    results[name] = {
+        'seconds': round(elapsed, 4),
+        'rows': rows,
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else None,
+        'peak_memory_mb': round(peak_memory / 1024 / 1024, 2)
+    }
+    print(f"  {name:<24} {elapsed:>9.2f} 秒 {results[name]['rows_per_sec'] or 0:>12.0f} 行/秒 "
+          f"{results[name]['peak_memory_mb']:>9.1f} MB")
+    return result
+
+def _load_from_database(conn):
+    """从嵌入式数据库读取数据，等同于 load_data 的查询"""
+    columns = ', '.join(DB_COLUMNS + DERIVED_DB_COLUMNS)
+    query = f"SELECT {columns}, import_date FROM student_courses WHERE removed_at IS NULL"
+    return apply_dtypes(pd.read_sql(query, conn))
+
+def run_pipeline(csv_path, workdir, cluster_sample=None, backend='sqlite', layout='wide', plot_mode='auto'):
+    """在一份导出文件上依次运行各阶段，返回 (每个阶段的测量结果, 导入后数据库文件的字节数)"""
+    results = {}
+    database_path = os.path.join(workdir, 'student_management.' + backend)
+    conn = connect(f"{backend}:///{database_path}")
+    cursor = conn.cursor()
+    create_database_and_table(conn, cursor, None, layout)
+    clustering_engine.MODEL_DIR = os.path.join(workdir, 'clustering')
+    
+    df = measure_stage(results, 'process_csv_file', len, process_csv_file, csv_path)
+    measure_stage(results, 'import_to_mysql', len(df), import_to_mysql, df, conn, cursor,
+                  batch_size=5000, mode='batch')
+    del df
+    conn.commit()
+    database_bytes = os.path.getsize(database_path)
+    print(f"  {'database_size':<24} {database_bytes / 1024 / 1024:>9.2f} MB ({layout})")
+    
+    measure_stage(results, 'refresh_risk_scores', lambda count: count, refresh_risk_scores, conn, cursor)
+    
+    df = measure_stage(results, 'load_data', len, _load_from_database, conn)
+    measure_stage(results, 'score_frame', len(df), score_frame, df)
+    df_prepared = measure_stage(results, 'clean_and_prepare_data', len, clean_and_prepare_data, df)
+    df_clustered, _ = measure_stage(results, 'student_clustering', len(df_prepared), student_clustering,
+                                    df_prepared, refit=True, sample_size=cluster_sample)
+    measure_stage(results, 'course_analysis', len(df_prepared), course_analysis, df_prepared)
+    measure_stage(results, 'create_visualizations', len(df_prepared), lambda: render_charts(
+        build_chart_inputs(df_prepared, df_clustered, plot_mode=plot_mode),
+        output_dir=os.path.join(workdir, 'visualizations'), force=True))
+    
+    cursor.close()
+    conn.close()
+    return results, database_bytes
+
+def compare_with_baseline(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基准结果比较各阶段吞吐量，返回回退的阶段列表"""
+    regressions = []
+    for size, stages in current['sizes'].items():
+        for stage, metrics in stages.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if not previous or not previous.get('rows_per_sec') or not metrics.get('rows_per_sec'):
+                continue
+            change = metrics['rows_per_sec'] / previous['rows_per_sec'] - 1
+            if change < -tolerance:
+                regressions.append((size, stage, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='学生数据处理流程的端到端基准测试')
+    parser.add_argument('--sizes', nargs='+', default=['10k', '100k'],
+                        help='数据规模，例如 10k 100k 1M 10M (默认: 10k 100k)')
+    parser.add_argument('--data-dir', default=os.path.join('benchmarks', 'data'), help='合成数据目录')
+    parser.add_argument('--output', default=None, help='结果JSON文件路径 (默认: benchmarks/results/ 下按时间命名)')
+    parser.add_argument('--baseline', default=None, help='用于比较的基准结果JSON文件')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='允许的吞吐量下降比例 (默认: 0.2)')
+    parser.add_argument('--cluster-sample', type=int, default=None, help='选择k时的抽样行数')
+    parser.add_argument('--backend', choices=EMBEDDED_BACKENDS, default='sqlite',
+                        help='导入和查询使用的嵌入式数据库 (默认: sqlite)')
+    parser.add_argument('--layout', choices=LAYOUTS, default='wide',
+                        help='存储布局，normalized 拆分为学员/课程班级/报读记录三张表 (默认: wide)')
+    parser.add_argument('--plot-mode', choices=PLOT_MODES, default='auto',
+                        help='散点图和箱线图的绘图模式，sample/hexbin 的耗时与数据量无关 (默认: auto)')
+    args = parser.parse_args()
+    
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'layout': args.layout,
+        'plot_mode': args.plot_mode,
+        'database_bytes': {},
+        'sizes': {}
+    }
+    
+    tracemalloc.start()
+    for size in args.sizes:
+        # 合成数据已存在时直接复用
+        csv_path = synthetic_export_path(args.data_dir, size)
+        if not os.path.exists(csv_path):
+            generate_export(csv_path, parse_size(size))
+        
+        print(f"\n规模 {size}:")
+        with tempfile.TemporaryDirectory(prefix='student_benchmark_') as workdir:
+            report['sizes'][size], report['database_bytes'][size] = run_pipeline(
+                csv_path, workdir, cluster_sample=args.cluster_sample, backend=args.backend, layout=args.layout,
+                plot_mode=args.plot_mode)
+    tracemalloc.stop()
+    
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark_{datetime.now():%Y%m%d%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n基准测试结果已保存到 {output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        for size, stage, change in regressions:
+            print(f"性能回退: 规模 {size} 阶段 {stage} 吞吐量下降 {-change:.0%}")
+        if regressions:
+            sys.exit(1)
+        print("与基准结果相比没有性能回退")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from pipeline_metrics import input_rows, instrument
+
+# 图表输出目录和渲染记录文件
+OUTPUT_DIR = 'visualizations'
+MANIFEST_NAME = '.render_manifest.json'
+
+# 每个图表的分辨率和输出格式，可按图表单独调整
+CHART_CONFIG = {
+    '课程类型分布': {'dpi': 300, 'format': 'png'},
+    '课程完成率与缺课次数关系': {'dpi': 300, 'format': 'png'},
+    '学生课时聚类分析': {'dpi': 300, 'format': 'png'},
+    '出勤率与课程完成率关系': {'dpi': 300, 'format': 'png'},
+    '学生性别分布': {'dpi': 300, 'format': 'png'},
+    '班级课程关系热力图': {'dpi': 300, 'format': 'png'}
+}
+
+# 大数据量绘图模式：auto 按行数选择，full 绘制全部数据，sample 分层抽样，hexbin 二维分箱
+PLOT_MODES = ('auto', 'full', 'sample', 'hexbin')
+
+# auto 模式下超过该行数时改为抽样绘制散点图、用分位数绘制箱线图
+LARGE_DATA_ROWS = 50000
+
+# 分层抽样的目标行数和二维分箱的网格数，绘图耗时只与它们有关，与总行数无关
+SAMPLE_SIZE = 5000
+HEXBIN_GRIDSIZE = 40
+
+def stratified_sample(data, column, sample_size=SAMPLE_SIZE, random_state=0):
+    """按 column 分层抽样，各层按行数比例分配样本，抽不到样本的小层至少保留一行"""
+    if len(data) <= sample_size:
+        return data
+    fraction = sample_size / len(data)
+    sample = data.groupby(column, observed=True, group_keys=False).sample(frac=fraction, random_state=random_state)
+    missing = data[~data[column].isin(sample[column].unique())].drop_duplicates(column)
+    return pd.concat([sample, missing])
+
+def binned_counts(data, x, y, gridsize=HEXBIN_GRIDSIZE):
+    """在 gridsize×gridsize 的网格上统计二维直方图，只返回非空格子的中心坐标和行数"""
+    counts, x_edges, y_edges = np.histogram2d(data[x].astype('float64'), data[y].astype('float64'), bins=gridsize)
+    x_index, y_index = np.nonzero(counts)
+    return pd.DataFrame({
+        x: (x_edges[x_index] + x_edges[x_index + 1]) / 2,
+        y: (y_edges[y_index] + y_edges[y_index + 1]) / 2,
+        'count': counts[x_index, y_index].astype('int64')
+    })
+
+def box_statistics(data, group, value):
+    """按分组预先计算箱线图所需的分位数和须线端点（1.5倍四分位距内的最值），不保留明细"""
+    grouped = data.groupby(group, observed=True)[value]
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'med', 'q3']
+    iqr = stats['q3'] - stats['q1']
+    limits = pd.DataFrame({'lower': stats['q1'] - 1.5 * iqr, 'upper': stats['q3'] + 1.5 * iqr})
+    bounds = data[[group, value]].join(limits, on=group)
+    inside = bounds[(bounds[value] >= bounds['lower']) & (bounds[value] <= bounds['upper'])]
+    stats['whislo'] = inside.groupby(group, observed=True)[value].min()
+    stats['whishi'] = inside.groupby(group, observed=True)[value].max()
+    stats['count'] = grouped.size()
+    return stats.reset_index()
+
+def _sampled_input(data, column, mode, x, y, sample_size):
+    """按绘图模式把散点图的明细数据换成抽样或分箱结果，并附上图中标注的说明"""
+    if mode == 'hexbin':
+        return {'method': 'hexbin', 'data': binned_counts(data, x, y),
+                'note': f"二维分箱 {HEXBIN_GRIDSIZE}×{HEXBIN_GRIDSIZE}，共 {len(data):,} 行"}
+    sample = stratified_sample(data, column, sample_size)
+    return {'method': 'sample', 'data': sample,
+            'note': f"按 {column} 分层抽样 {len(sample):,} / {len(data):,} 行"}
+
+def _annotate(plt, note):
+    """在图表右下角标注抽样或聚合方式"""
+    plt.gcf().text(0.99, 0.01, note, ha='right', va='bottom', fontsize=9, color='gray')
+
+def _draw_points(plt, sns, data, x, y, hue, palette=None):
+    """绘制散点图：明细或抽样数据按原样式绘制，分箱数据按格子行数绘制六边形分箱图"""
+    if isinstance(data, dict) and data['method'] == 'hexbin':
+        binned = data['data']
+        plt.hexbin(binned[x], binned[y], C=binned['count'], reduce_C_function=np.sum,
+                   gridsize=HEXBIN_GRIDSIZE, cmap='viridis', mincnt=1)
+        plt.colorbar(label='行数')
+    else:
+        points = data['data'] if isinstance(data, dict) else data
+        sns.scatterplot(data=points, x=x, y=y, hue=hue, size='purchased_amount', sizes=(20, 200), alpha=0.7,
+                        palette=palette)
+    if isinstance(data, dict):
+        _annotate(plt, data['note'])
+
+def draw_course_type_distribution(plt, sns, course_type_counts):
+    """1. 课程类型分布可视化"""
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x=course_type_counts.index, y=course_type_counts.values)
+    plt.title('课程类型分布', fontsize=16)
+    plt.xlabel('课程类型')
+    plt.ylabel('学生数量')
+    plt.xticks(rotation=45, ha='right')
+
+def draw_completion_vs_absence(plt, sns, data):
+    """2. 课程完成率与缺课次数关系"""
+    plt.figure(figsize=(10, 6))
+    _draw_points(plt, sns, data, 'absent_count', 'course_completion_rate', 'gender')
+    plt.title('课程完成率与缺课次数关系', fontsize=16)
+    plt.xlabel('缺课次数')
+    plt.ylabel('课程完成率 (%)')
+
+def draw_cluster_scatter(plt, sns, data):
+    """3. 聚类分析可视化"""
+    plt.figure(figsize=(12, 8))
+    _draw_points(plt, sns, data, 'consumed_amount', 'remaining_amount', 'cluster', palette='viridis')
+    plt.title('学生消耗课时与剩余课时聚类分析', fontsize=16)
+    plt.xlabel('消耗课时')
+    plt.ylabel('剩余课时')
+
+def draw_attendance_boxplot(plt, sns, data):
+    """4. 出勤率与课程完成率的箱线图"""
+    plt.figure(figsize=(12, 6))
+    if isinstance(data, dict):
+        # 由预先计算的分位数绘制，不显示离群点
+        stats = data['data']
+        plt.gca().bxp([{'label': row['attendance_group'], 'q1': row['q1'], 'med': row['med'], 'q3': row['q3'],
+                        'whislo': row['whislo'], 'whishi': row['whishi'], 'fliers': []}
+                       for _, row in stats.iterrows()], showfliers=False, patch_artist=True,
+                      boxprops={'facecolor': sns.color_palette()[0]})
+        _annotate(plt, data['note'])
+    else:
+        sns.boxplot(data=data, x='attendance_group', y='course_completion_rate')
+    plt.title('不同出勤率的课程完成率分布', fontsize=16)
+    plt.xlabel('出勤率分组')
+    plt.ylabel('课程完成率 (%)')
+
+def draw_gender_pie(plt, sns, gender_counts):
+    """5. 学生性别分布饼图"""
+    plt.figure(figsize=(8, 8))
+    plt.pie(gender_counts, labels=gender_counts.index, autopct='%1.1f%%',
+            colors=sns.color_palette('pastel'), startangle=90)
+    plt.title('学生性别分布', fontsize=16)
+    plt.axis('equal')
+
+def draw_class_course_heatmap(plt, sns, filtered_counts):
+    """6. 热力图：班级与课程类型的关系"""
+    plt.figure(figsize=(14, 10))
+    sns.heatmap(filtered_counts, annot=True, fmt='d', cmap='YlGnBu')
+    plt.title('班级与课程类型关系热力图', fontsize=16)
+    plt.xlabel('课程类型')
+    plt.ylabel('班级')
+    plt.xticks(rotation=45, ha='right')
+
+# 图表名称 -> 绘图函数
+CHARTS = {
+    '课程类型分布': draw_course_type_distribution,
+    '课程完成率与缺课次数关系': draw_completion_vs_absence,
+    '学生课时聚类分析': draw_cluster_scatter,
+    '出勤率与课程完成率关系': draw_attendance_boxplot,
+    '学生性别分布': draw_gender_pie,
+    '班级课程关系热力图': draw_class_course_heatmap
+}
+
+def resolve_plot_mode(rows, mode='auto'):
+    """auto 模式下数据量超过 LARGE_DATA_ROWS 时改为分层抽样"""
+    if mode not in PLOT_MODES:
+        raise ValueError(f"未知的绘图模式: {mode}，可选: {', '.join(PLOT_MODES)}")
+    if mode == 'auto':
+        return 'sample' if rows > LARGE_DATA_ROWS else 'full'
+    return mode
+
+@instrument(rows=input_rows)
+def build_chart_inputs(df_prepared, df_clustered, plot_mode='auto', sample_size=SAMPLE_SIZE):
+    """从分析数据中提取每个图表需要的最小输入
+    
+    plot_mode 为 sample/hexbin（或 auto 且数据量较大）时，散点图只接收分层抽样或二维分箱的结果，
+    箱线图只接收各组的分位数，传给绘图进程的数据量与总行数无关。
+    """
+    # 出勤率分组在导入时已按统一定义保存
+    attendance = df_clustered[['course_completion_rate', 'attendance_group']]
+    
+    # 只保留主要班级和课程类型，避免图表过于复杂
+    class_course_counts = pd.crosstab(df_prepared['class_name'], df_prepared['course_type'])
+    main_classes = df_prepared['class_name'].value_counts().head(10).index
+    main_course_types = df_prepared['course_type'].value_counts().head(8).index
+    
+    # category列的value_counts会包含计数为0的类别
+    course_type_counts = df_prepared['course_type'].value_counts()
+    gender_counts = df_prepared['gender'].value_counts()
+    
+    completion = df_prepared[['absent_count', 'course_completion_rate', 'gender', 'purchased_amount']]
+    clusters = df_clustered[['consumed_amount', 'remaining_amount', 'cluster', 'purchased_amount']]
+    plot_mode = resolve_plot_mode(len(df_prepared), plot_mode)
+    if plot_mode != 'full':
+        completion = _sampled_input(completion, 'gender', plot_mode, 'absent_count', 'course_completion_rate',
+                                    sample_size)
+        clusters = _sampled_input(clusters, 'cluster', plot_mode, 'consumed_amount', 'remaining_amount', sample_size)
+        attendance = {'method': 'quantiles',
+                      'data': box_statistics(attendance, 'attendance_group', 'course_completion_rate'),
+                      'note': f"基于 {len(attendance):,} 行预先计算的分位数，未显示离群点"}
+    
+    return {
+        '课程类型分布': course_type_counts[course_type_counts > 0].sort_values(ascending=False),
+        '课程完成率与缺课次数关系': completion,
+        '学生课时聚类分析': clusters,
+        '出勤率与课程完成率关系': attendance,
+        '学生性别分布': gender_counts[gender_counts > 0],
+        '班级课程关系热力图': class_course_counts.loc[main_classes, main_course_types]
+    }
+
+def input_hash(data, config):
+    """计算图表输入数据和输出配置的哈希；抽样或聚合后的输入连同方法和说明一起参与哈希"""
+    if isinstance(data, dict):
+        config = {**config, 'method': data['method'], 'note': data['note']}
+        data = data['data']
+    digest = hashlib.md5(json.dumps(config, sort_keys=True).encode('utf-8'))
+    if isinstance(data, pd.DataFrame):
+        digest.update(','.join(map(str, data.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+def _init_worker():
+    """工作进程使用无界面后端"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+def _render_chart(name, data, path, dpi, fmt):
+    """在工作进程中绘制并保存单个图表，返回耗时"""
+    start_time = time.perf_counter()
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    # 设置Seaborn样式
+    sns.set(style="whitegrid")
+    CHARTS[name](plt, sns, data)
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, format=fmt)
+    plt.close()
+    return time.perf_counter() - start_time
+
+def _load_manifest(output_dir):
+    """读取上次渲染时记录的输入哈希"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_manifest(output_dir, manifest):
+    """保存本次渲染的输入哈希"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+def _record_failure(name, error, manifest, summary):
+    """记录绘制失败的图表，下次运行时重新绘制"""
+    print(f"绘制图表 {name} 时出错: {error}")
+    manifest.pop(name, None)
+    summary['failed'].append(name)
+
+@instrument()
+def render_charts(inputs, output_dir=OUTPUT_DIR, config=None, max_workers=None, force=False, verbose=True):
+    """在多个进程中并行渲染图表，输入未变化的图表直接复用上次的结果
+    
+    max_workers 为1时在当前进程中依次绘制，供已经运行在工作进程中的调用方使用；verbose 为False时不输出
+    复用和重新绘制的图表。
+    返回 {'rendered': [...], 'reused': [...], 'failed': [...]}。
+    """
+    config = {name: {**defaults, **(config or {}).get(name, {})} for name, defaults in CHART_CONFIG.items()}
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    summary = {'rendered': [], 'reused': [], 'failed': []}
+    
+    pending = {}
+    for name, data in inputs.items():
+        chart_config = config[name]
+        path = os.path.join(output_dir, f"{name}.{chart_config['format']}")
+        digest = input_hash(data, chart_config)
+        previous = manifest.get(name, {})
+        if not force and previous.get('hash') == digest and os.path.exists(path):
+            summary['reused'].append(name)
+        else:
+            pending[name] = (data, path, chart_config, digest)
+    
+    if pending and max_workers == 1:
+        _init_worker()
+        for name, (data, path, chart_config, digest) in pending.items():
+            try:
+                elapsed = _render_chart(name, data, path, chart_config['dpi'], chart_config['format'])
+            except Exception as e:
+                _record_failure(name, e, manifest, summary)
+                continue
+            manifest[name] = {'hash': digest, 'path': path, 'seconds': round(elapsed, 3)}
+            summary['rendered'].append(name)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(_render_chart, name, data, path, chart_config['dpi'], chart_config['format']): name
+                for name, (data, path, chart_config, digest) in pending.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                data, path, chart_config, digest = pending[name]
+                try:
+                    elapsed = future.result()
+                except Exception as e:
+                    _record_failure(name, e, manifest, summary)
+                    continue
+                manifest[name] = {'hash': digest, 'path': path, 'seconds': round(elapsed, 3)}
+                summary['rendered'].append(name)
+    
+    _save_manifest(output_dir, manifest)
+    
+    if verbose and summary['reused']:
+        print(f"输入未变化，复用 {len(summary['reused'])} 个图表: {', '.join(summary['reused'])}")
+    if verbose and summary['rendered']:
+        print(f"重新绘制 {len(summary['rendered'])} 个图表: {', '.join(summary['rendered'])}")
+    return summary
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+from pipeline_metrics import input_rows, instrument
+
+# 用于聚类的特征
+CLUSTER_FEATURES = ['purchased_amount', 'consumed_amount', 'remaining_amount',
+                    'absent_count', 'course_completion_rate']
+
+# 已训练模型的保存目录
+MODEL_DIR = os.path.join('.cache', 'clustering')
+LATEST_MODEL = 'latest.joblib'
+
+# 按特征哈希保存的模型文件最多保留的个数，超出时删除最久未使用的
+MAX_SAVED_MODELS = 20
+
+# 特征分布摘要使用的分位点
+SKETCH_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+# 各特征的均值或分位数偏移超过该倍数的标准差时重新训练，否则沿用已有模型直接预测
+REFIT_THRESHOLD = 0.2
+
+# 计算轮廓系数时的最大抽样行数，轮廓系数的计算量随行数平方增长
+SILHOUETTE_SAMPLE_SIZE = 5000
+
+# 本次运行中已加载或训练的模型，按特征哈希索引
+_models = {}
+
+def feature_hash(X):
+    """计算特征矩阵的哈希，特征数据不变时哈希不变"""
+    digest = hashlib.md5(','.join(X.columns).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(X, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+def feature_sketch(X):
+    """计算特征分布摘要：每个特征的均值和若干分位数，行为特征、列为统计量"""
+    sketch = X.quantile(SKETCH_QUANTILES).T
+    sketch.columns = [f"q{quantile:g}" for quantile in SKETCH_QUANTILES]
+    sketch.insert(0, 'mean', X.mean())
+    return sketch
+
+def sketch_drift(fitted, X):
+    """按训练时的标准差计算特征分布摘要的最大偏移，特征不同或模型没有摘要时返回None"""
+    sketch = fitted.get('sketch')
+    if sketch is None or list(sketch.index) != list(X.columns):
+        return None
+    scale = pd.Series(fitted['scaler'].scale_, index=sketch.index)
+    return float((feature_sketch(X) - sketch).abs().div(scale, axis=0).to_numpy().max())
+
+def fit_settings(method='elbow', k_range=range(1, 11), n_jobs=-1, sample_size=None, minibatch=False,
+                 random_state=42):
+    """返回影响训练结果的选项，参数与 fit_clusters 一致；n_jobs 只影响速度，不计入"""
+    return {'method': method, 'k_range': list(k_range), 'sample_size': sample_size, 'minibatch': minibatch,
+            'random_state': random_state}
+
+def model_key(X, settings):
+    """模型文件的键：特征哈希加上训练选项，同一份数据用不同选项训练的模型分别保存"""
+    digest = hashlib.md5(feature_hash(X).encode('utf-8'))
+    digest.update(repr(sorted(settings.items())).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def _make_kmeans(k, minibatch, random_state):
+    """创建KMeans或MiniBatchKMeans模型"""
+    if minibatch:
+        return MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3)
+    return KMeans(n_clusters=k, random_state=random_state)
+
+def _evaluate_k(X_scaled, k, minibatch, random_state):
+    """训练单个k值的模型，返回惯性和轮廓系数"""
+    model = _make_kmeans(k, minibatch, random_state)
+    labels = model.fit_predict(X_scaled)
+    silhouette = np.nan
+    if 1 < k < len(X_scaled) and len(np.unique(labels)) > 1:
+        silhouette = silhouette_score(X_scaled, labels,
+                                      sample_size=min(SILHOUETTE_SAMPLE_SIZE, len(X_scaled)),
+                                      random_state=random_state)
+    return k, model.inertia_, silhouette
+
+def sweep_k(X_scaled, k_range=range(1, 11), n_jobs=-1, sample_size=None, minibatch=False, random_state=42):
+    """并行训练一组k值的模型，返回包含惯性和轮廓系数的DataFrame"""
+    if sample_size is not None and len(X_scaled) > sample_size:
+        rng = np.random.default_rng(random_state)
+        X_scaled = X_scaled[rng.choice(len(X_scaled), size=sample_size, replace=False)]
+    
+    k_values = [k for k in k_range if k <= len(X_scaled)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_evaluate_k)(X_scaled, k, minibatch, random_state) for k in k_values
+    )
+    return pd.DataFrame(results, columns=['k', 'inertia', 'silhouette']).set_index('k')
+
+def elbow_k(sweep):
+    """用肘部法则选择k：惯性曲线上距首尾连线最远的点"""
+    if len(sweep) < 3:
+        return int(sweep.index[-1])
+    k = sweep.index.to_numpy(dtype=float)
+    inertia = sweep['inertia'].to_numpy(dtype=float)
+    
+    # 归一化到[0, 1]后计算各点到首尾连线的距离
+    k_norm = (k - k[0]) / (k[-1] - k[0])
+    span = inertia[0] - inertia[-1]
+    if span <= 0:
+        return int(sweep.index[0])
+    inertia_norm = (inertia - inertia[-1]) / span
+    distance = np.abs(k_norm + inertia_norm - 1) / np.sqrt(2)
+    return int(sweep.index[int(np.argmax(distance))])
+
+def select_k(sweep, method='elbow'):
+    """按肘部法则或轮廓系数自动选择聚类数"""
+    if method == 'silhouette' and sweep['silhouette'].notna().any():
+        return int(sweep['silhouette'].idxmax())
+    return elbow_k(sweep)
+
+@instrument(rows=input_rows)
+def fit_clusters(X, method='elbow', k_range=range(1, 11), n_jobs=-1, sample_size=None,
+                 minibatch=False, random_state=42):
+    """标准化特征、选择k并训练最终模型，返回模型信息"""
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    
+    sweep = sweep_k(X_scaled, k_range, n_jobs=n_jobs, sample_size=sample_size,
+                    minibatch=minibatch, random_state=random_state)
+    k = select_k(sweep, method)
+    
+    model = _make_kmeans(k, minibatch, random_state)
+    model.fit(X_scaled)
+    print(f"聚类数选择 ({method}): k={k}")
+    
+    return {
+        'scaler': scaler,
+        'model': model,
+        'k': k,
+        'method': method,
+        'sweep': sweep,
+        'settings': fit_settings(method, k_range, n_jobs, sample_size, minibatch, random_state),
+        'n_rows': len(X),
+        'sketch': feature_sketch(X),
+        'feature_hash': feature_hash(X)
+    }
+
+def save_model(fitted, key):
+    """按模型键保存模型并记录为最近一次训练的模型，只保留最近使用的 MAX_SAVED_MODELS 个模型文件"""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    path = os.path.join(MODEL_DIR, f"{key}.joblib")
+    joblib.dump(fitted, path)
+    joblib.dump(fitted, os.path.join(MODEL_DIR, LATEST_MODEL))
+    
+    saved = [os.path.join(MODEL_DIR, name) for name in os.listdir(MODEL_DIR)
+             if name.endswith('.joblib') and name != LATEST_MODEL]
+    for old_path in sorted(saved, key=os.path.getmtime, reverse=True)[MAX_SAVED_MODELS:]:
+        os.remove(old_path)
+    return path
+
+def load_model(key=None):
+    """按模型键加载模型，key为None时加载最近一次训练的模型；加载的模型文件记为最近使用"""
+    name = LATEST_MODEL if key is None else f"{key}.joblib"
+    path = os.path.join(MODEL_DIR, name)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return joblib.load(path)
+
+def predict_clusters(fitted, X):
+    """用已训练的模型为数据分配聚类"""
+    return fitted['model'].predict(fitted['scaler'].transform(X))
+
+@instrument(rows=input_rows)
+def assign_clusters(X, method='elbow', refit=False, **fit_options):
+    """为特征矩阵分配聚类，尽量复用已训练的模型
+    
+    特征哈希和训练选项与已保存模型一致时直接复用；训练选项相同且各特征的均值和分位数与最近的模型相比
+    偏移很小时，用最近的模型预测；否则（或 refit 为True时）重新选择k并训练。
+    """
+    settings = fit_settings(method, **fit_options)
+    key = model_key(X, settings)
+    fitted = None if refit else (_models.get(key) or load_model(key))
+    if fitted is not None:
+        print(f"复用已训练的聚类模型 (k={fitted['k']})")
+        _models[key] = fitted
+        return predict_clusters(fitted, X)
+    
+    latest = None if refit else load_model()
+    if latest is not None and latest.get('settings') == settings:
+        drift = sketch_drift(latest, X)
+        if drift is not None and drift <= REFIT_THRESHOLD:
+            print(f"特征分布变化较小 (最大偏移 {drift:.2f} 个标准差)，用已有模型为记录分配聚类 (k={latest['k']})")
+            _models[key] = latest
+            return predict_clusters(latest, X)
+    
+    fitted = fit_clusters(X, method=method, **fit_options)
+    save_model(fitted, key)
+    _models[key] = fitted
+    return predict_clusters(fitted, X)
@@ -0,0 +1,231 @@
+import argparse
+import codecs
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+# 输出的中外合作办学机构数据，analyze_edu_data.py 读取该文件
+OUTPUT_CSV = '中外合作办学机构数据.csv'
+OUTPUT_COLUMNS = ['地区', '类型', '名称', '链接', '标记']
+
+# 已解析页面的缓存目录，按页面内容哈希保存解析结果
+CACHE_DIR = os.path.join('.cache', 'crs')
+
+# 每次送入解析器的字节数，页面不会整体读入内存
+READ_CHUNK_SIZE = 64 * 1024
+
+# 审批详情链接，例如 https://www.crs.jsj.edu.cn/aproval/detail/105
+DETAIL_PATTERN = re.compile(r'aproval/detail/(\d+)')
+
+# 名单中使用的标记：▲ 条例批准、● 暂行规定批准后复核通过、■ 同属本科和硕士研究生教育
+MARKERS = ('▲', '●', '■')
+
+class CRSListParser(HTMLParser):
+    """流式解析CRS名单页面，每遇到一个审批详情条目就产生一条记录，不构建完整的DOM"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self.region = ''
+        self.type = ''
+        self._cells = []
+        self._cell_text = None
+        self._cell_has_list = False
+        self._entry = None
+        self._in_link = False
+        self._in_marker = False
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._cells = []
+        elif tag == 'td':
+            self._cell_text = []
+            self._cell_has_list = False
+        elif tag == 'ol':
+            # 名称列之前的单元格依次为地区（跨行时省略）和类型；名单为空时同样需要更新
+            self._cell_has_list = True
+            if len(self._cells) >= 2:
+                self.region, self.type = self._cells[-2], self._cells[-1]
+            elif self._cells:
+                self.type = self._cells[-1]
+        elif tag == 'li':
+            self._entry = {'link': '', 'name': [], 'markers': []}
+        elif tag == 'a' and self._entry is not None:
+            href = dict(attrs).get('href') or ''
+            if DETAIL_PATTERN.search(href):
+                self._entry['link'] = href.strip()
+                self._in_link = True
+        elif tag == 'font' and self._entry is not None:
+            self._in_marker = True
+    
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._in_link = False
+        elif tag == 'font':
+            self._in_marker = False
+        elif tag == 'li' and self._entry is not None:
+            self._finish_entry()
+        elif tag == 'td' and self._cell_text is not None:
+            if not self._cell_has_list:
+                self._cells.append(''.join(self._cell_text).strip())
+            self._cell_text = None
+    
+    def handle_data(self, data):
+        if self._entry is not None:
+            if self._in_link:
+                self._entry['name'].append(data)
+            elif self._in_marker:
+                self._entry['markers'].extend(char for char in data if char in MARKERS)
+        elif self._cell_text is not None:
+            self._cell_text.append(data)
+    
+    def _finish_entry(self):
+        """保存当前条目，没有审批详情链接的条目忽略"""
+        entry, self._entry = self._entry, None
+        self._in_link = self._in_marker = False
+        if not entry['link']:
+            return
+        self.records.append({
+            '地区': self.region,
+            '类型': self.type,
+            '名称': ''.join(entry['name']).strip(),
+            '链接': entry['link'],
+            '标记': ', '.join(entry['markers'])
+        })
+
+def parse_page(path):
+    """分块读取并解析一个保存的CRS页面，返回 (内容哈希, 记录列表)"""
+    parser = CRSListParser()
+    digest = hashlib.md5()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return digest.hexdigest(), parser.records
+
+def page_hash(path):
+    """计算页面内容的哈希"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_file(digest):
+    """页面解析结果的缓存文件"""
+    return os.path.join(CACHE_DIR, f"{digest}.json")
+
+def _read_cached_records(digest):
+    """读取相同内容页面上次的解析结果，没有时返回None"""
+    path = _cache_file(digest)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_cached_records(digest, records):
+    """保存页面的解析结果"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_file(digest)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+def dedupe_records(records):
+    """按审批详情编号去重，保留最先出现的记录"""
+    seen = set()
+    unique = []
+    for record in records:
+        detail_id = DETAIL_PATTERN.search(record['链接']).group(1)
+        if detail_id in seen:
+            continue
+        seen.add(detail_id)
+        unique.append(record)
+    return unique
+
+def parse_pages(paths, workers=None, force=False):
+    """并行解析多个页面，内容未变化的页面直接使用缓存的解析结果
+    
+    返回 (按页面顺序合并并去重后的记录, 重新解析的页面列表, 复用缓存的页面列表)。
+    """
+    page_records = {}
+    reused = []
+    pending = []
+    for path in paths:
+        cached = None if force else _read_cached_records(page_hash(path))
+        if cached is not None:
+            page_records[path] = cached
+            reused.append(path)
+        else:
+            pending.append(path)
+    
+    if len(pending) == 1:
+        results = [parse_page(pending[0])]
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(parse_page, pending))
+    else:
+        results = []
+    
+    for path, (digest, records) in zip(pending, results):
+        _write_cached_records(digest, records)
+        page_records[path] = records
+    
+    records = [record for path in paths for record in page_records[path]]
+    return dedupe_records(records), pending, reused
+
+def write_records(records, output_path=OUTPUT_CSV):
+    """写出与原数据格式一致的CSV（带BOM的UTF-8，便于Excel打开）"""
+    with open(output_path + '.tmp', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    os.replace(output_path + '.tmp', output_path)
+
+def resolve_pages(paths):
+    """展开目录和通配符，返回页面文件列表"""
+    pages = []
+    for path in paths:
+        if os.path.isdir(path):
+            pages.extend(sorted(glob.glob(os.path.join(path, '*.html'))))
+        else:
+            pages.extend(sorted(glob.glob(path)) or [path])
+    return list(dict.fromkeys(pages))
+
+def main():
+    parser = argparse.ArgumentParser(description='从保存的CRS名单页面重建中外合作办学机构数据')
+    parser.add_argument('paths', nargs='*', default=['crs_page.html'],
+                        help='页面文件、目录或通配符 (默认: crs_page.html)')
+    parser.add_argument('--output', default=OUTPUT_CSV, help=f'输出CSV文件 (默认: {OUTPUT_CSV})')
+    parser.add_argument('--workers', type=int, default=None, help='解析使用的进程数 (默认: CPU核数)')
+    parser.add_argument('--force', action='store_true', help='忽略缓存，重新解析所有页面')
+    args = parser.parse_args()
+    
+    pages = resolve_pages(args.paths)
+    missing = [path for path in pages if not os.path.exists(path)]
+    if missing:
+        print(f"错误: 找不到页面文件 {', '.join(missing)}")
+        return
+    
+    start_time = time.perf_counter()
+    records, parsed, reused = parse_pages(pages, workers=args.workers, force=args.force)
+    if reused:
+        print(f"内容未变化，复用 {len(reused)} 个页面的解析结果")
+    if parsed:
+        print(f"重新解析 {len(parsed)} 个页面")
+    
+    write_records(records, args.output)
+    elapsed = time.perf_counter() - start_time
+    print(f"共提取 {len(records)} 条记录，已保存到 {args.output}，耗时 {elapsed:.2f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from storage_backend import backend_of, date_expression
+
+# 每日汇总表，导入时在同一事务中维护，时间序列分析只读取这张小表
+ROLLUP_TABLE = 'daily_rollup'
+
+# 每日汇总的指标及对应的累计列
+ROLLUP_METRICS = {
+    'student_count': 'cumulative_students',
+    'purchased_amount': 'cumulative_purchased',
+    'consumed_amount': 'cumulative_consumed'
+}
+
+# 汇总表中按顺序排列的指标列和累计列
+ROLLUP_COLUMNS = list(ROLLUP_METRICS) + list(ROLLUP_METRICS.values())
+
+# 计算增量需要的明细列
+ROLLUP_SOURCE_COLUMNS = ['import_date', 'student_name', 'purchased_amount', 'consumed_amount']
+
+# 时间序列的汇总粒度：名称 -> (pandas 频率, 说明)
+RESOLUTIONS = {
+    'D': ('D', '按日'),
+    'W': ('W', '按周'),
+    'M': ('ME', '按月')
+}
+
+def create_rollup_table(conn, cursor):
+    """创建每日汇总表；明细表已有数据而汇总表为空时（例如旧版本创建的库）一次性回填"""
+    metric_columns = ',\n        '.join(f"{col} BIGINT NOT NULL DEFAULT 0" for col in ROLLUP_COLUMNS)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        import_day DATE PRIMARY KEY,
+        {metric_columns}
+    )
+    """)
+    
+    cursor.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("SELECT COUNT(*) FROM student_courses WHERE removed_at IS NULL")
+        if cursor.fetchone()[0] > 0:
+            rebuild_rollup(conn, cursor)
+
+def rebuild_rollup(conn, cursor):
+    """从明细表重新计算整张每日汇总表"""
+    import_day = date_expression(conn, 'import_date')
+    cursor.execute(f"""
+    SELECT {import_day}, COUNT(student_name), SUM(purchased_amount), SUM(consumed_amount)
+    FROM student_courses
+    WHERE removed_at IS NULL AND import_date IS NOT NULL
+    GROUP BY {import_day}
+    ORDER BY {import_day}
+    """)
+    daily = pd.DataFrame(cursor.fetchall(), columns=['import_day'] + list(ROLLUP_METRICS))
+    daily[list(ROLLUP_METRICS)] = daily[list(ROLLUP_METRICS)].apply(pd.to_numeric).fillna(0).astype('int64')
+    for metric, cumulative in ROLLUP_METRICS.items():
+        daily[cumulative] = daily[metric].cumsum()
+    
+    cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    columns = ['import_day'] + ROLLUP_COLUMNS
+    rows = [(pd.Timestamp(row[0]).date(), *map(int, row[1:])) for row in daily[columns].itertuples(index=False)]
+    if rows:
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor.executemany(f"INSERT INTO {ROLLUP_TABLE} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    print(f"每日汇总表已重建，共 {len(rows)} 天")
+
+def rollup_deltas(frame, sign=1):
+    """按导入日期汇总一批明细记录对每日汇总的增量，sign 为 -1 时表示移除这些记录"""
+    if len(frame) == 0 or 'import_date' not in frame.columns:
+        return pd.DataFrame(columns=list(ROLLUP_METRICS), dtype='int64')
+    
+    days = pd.to_datetime(frame['import_date'], errors='coerce')
+    deltas = pd.DataFrame({
+        'student_count': frame['student_name'].notna().astype('int64') if 'student_name' in frame.columns else 0,
+        'purchased_amount': pd.to_numeric(frame.get('purchased_amount', 0), errors='coerce'),
+        'consumed_amount': pd.to_numeric(frame.get('consumed_amount', 0), errors='coerce')
+    }, index=frame.index).fillna(0)
+    
+    # 与 SUM 一致，导入日期为空的记录不计入汇总
+    deltas = deltas[days.notna()].groupby(days[days.notna()].dt.date).sum()
+    return (deltas * sign).round().astype('int64')
+
+def lock_rollup(conn, cursor):
+    """MySQL 中锁定整张汇总表（包括表中尚不存在的日期），并行写入的事务依次维护汇总，直到提交或回滚
+    
+    嵌入式数据库的写入语句本身持有整个数据库的写锁，不需要额外加锁。
+    """
+    if backend_of(conn) == 'mysql':
+        cursor.execute(f"SELECT import_day FROM {ROLLUP_TABLE} FOR UPDATE")
+        cursor.fetchall()
+
+def _insert_day_sql(conn):
+    """插入新日期的SQL：累计值在同一条语句中取自前一天，日期已被其他写入者插入时不做任何改动"""
+    cumulative_columns = list(ROLLUP_METRICS.values())
+    seeds = ', '.join(f"COALESCE(MAX({col}), 0)" for col in cumulative_columns)
+    sql = (f"INSERT INTO {ROLLUP_TABLE} (import_day, {', '.join(cumulative_columns)}) "
+           f"SELECT %s, {seeds} FROM (SELECT {', '.join(cumulative_columns)} FROM {ROLLUP_TABLE} "
+           f"WHERE import_day < %s ORDER BY import_day DESC LIMIT 1) previous")
+    if backend_of(conn) == 'mysql':
+        return f"{sql} ON DUPLICATE KEY UPDATE import_day = import_day"
+    # SQLite 要求 INSERT ... SELECT 带有 WHERE 子句，才能与后面的 ON CONFLICT 区分
+    return f"{sql} WHERE TRUE ON CONFLICT (import_day) DO NOTHING"
+
+def apply_rollup_deltas(conn, cursor, *deltas):
+    """将每日增量累加到汇总表，并把累计值的变化顺延到之后的每一天"""
+    deltas = [delta for delta in deltas if len(delta)]
+    if not deltas:
+        return
+    combined = pd.concat(deltas).groupby(level=0).sum().sort_index()
+    combined = combined[(combined != 0).any(axis=1)]
+    if combined.empty:
+        return
+    
+    lock_rollup(conn, cursor)
+    days = list(combined.index)
+    placeholders = ', '.join(['%s'] * len(days))
+    cursor.execute(f"SELECT import_day FROM {ROLLUP_TABLE} WHERE import_day IN ({placeholders})", days)
+    existing_days = {pd.Timestamp(row[0]).date() for row in cursor.fetchall()}
+    
+    # 新出现的日期先以前一天的累计值插入，再统一累加增量
+    insert_sql = _insert_day_sql(conn)
+    for day in days:
+        if day not in existing_days:
+            cursor.execute(insert_sql, (day, day))
+    
+    # 当天累加增量，当天及之后各天的累计值同样累加
+    cumulative_columns = list(ROLLUP_METRICS.values())
+    daily_assignments = ', '.join(f"{metric} = {metric} + %s" for metric in ROLLUP_METRICS)
+    cumulative_assignments = ', '.join(f"{col} = {col} + %s" for col in cumulative_columns)
+    for day, row in combined.iterrows():
+        values = [int(value) for value in row[list(ROLLUP_METRICS)]]
+        cursor.execute(f"UPDATE {ROLLUP_TABLE} SET {daily_assignments} WHERE import_day = %s", (*values, day))
+        cursor.execute(f"UPDATE {ROLLUP_TABLE} SET {cumulative_assignments} WHERE import_day >= %s", (*values, day))
+
+def refresh_rollup_days(conn, cursor, days):
+    """从明细表重新汇总指定日期，将与汇总表的差额累加进去（用于无法逐行确定写入结果的装载方式）"""
+    # 先加锁再读取汇总表中的现有值，差额不会与其他写入者的增量重复计算
+    lock_rollup(conn, cursor)
+    current = []
+    for day in sorted(set(days)):
+        start = datetime.combine(day, datetime.min.time())
+        cursor.execute(
+            "SELECT COUNT(student_name), SUM(purchased_amount), SUM(consumed_amount) FROM student_courses "
+            "WHERE removed_at IS NULL AND import_date >= %s AND import_date < %s",
+            (start, start + timedelta(days=1))
+        )
+        actual = [int(value or 0) for value in cursor.fetchone()]
+        cursor.execute(f"SELECT {', '.join(ROLLUP_METRICS)} FROM {ROLLUP_TABLE} WHERE import_day = %s", (day,))
+        recorded = cursor.fetchone() or (0,) * len(ROLLUP_METRICS)
+        current.append([a - int(r) for a, r in zip(actual, recorded)])
+    
+    deltas = pd.DataFrame(current, index=sorted(set(days)), columns=list(ROLLUP_METRICS))
+    apply_rollup_deltas(conn, cursor, deltas)
+
+def read_rollup(conn, resolution='D'):
+    """读取每日汇总表，按日/周/月粒度返回各期数值和期末累计值"""
+    cursor = conn.cursor()
+    columns = ['import_day'] + ROLLUP_COLUMNS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {ROLLUP_TABLE} ORDER BY import_day")
+    rollup = pd.DataFrame(cursor.fetchall(), columns=columns)
+    cursor.close()
+    
+    rollup['import_day'] = pd.to_datetime(rollup['import_day'])
+    rollup = rollup.set_index('import_day').apply(pd.to_numeric)
+    # 只剩已删除记录的日期不再显示
+    rollup = rollup[rollup['student_count'] != 0]
+    return resample_daily_stats(rollup, resolution)
+
+def resample_daily_stats(daily_stats, resolution='D'):
+    """将按日汇总的结果转换为日/周/月粒度：各期数值求和，累计值取期末值"""
+    freq, _ = RESOLUTIONS[resolution]
+    daily_stats = daily_stats.copy()
+    daily_stats.index = pd.to_datetime(daily_stats.index)
+    if resolution == 'D' or daily_stats.empty:
+        daily_stats.index = daily_stats.index.date
+        daily_stats.index.name = 'import_date'
+        return daily_stats
+    
+    aggregations = {metric: 'sum' for metric in ROLLUP_METRICS}
+    aggregations.update({cumulative: 'last' for cumulative in ROLLUP_METRICS.values()})
+    resampled = daily_stats.resample(freq).agg(aggregations)
+    resampled[list(ROLLUP_METRICS.values())] = resampled[list(ROLLUP_METRICS.values())].ffill()
+    resampled = resampled.fillna(0).astype('int64')
+    resampled.index.name = 'import_date'
+    return resampled
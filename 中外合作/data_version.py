@@ -0,0 +1,22 @@
+from storage_backend import table_exists
+
+# 数据版本表：只有一行，每个修改报读记录的事务在提交前把版本号加一，分析端据此判断本地缓存是否过期
+DATA_VERSION_TABLE = 'data_version'
+
+def create_data_version_table(conn, cursor):
+    """创建数据版本表并写入初始的一行"""
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (version BIGINT NOT NULL)")
+    cursor.execute(f"SELECT COUNT(*) FROM {DATA_VERSION_TABLE}")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"INSERT INTO {DATA_VERSION_TABLE} (version) VALUES (0)")
+
+def bump_data_version(cursor):
+    """在修改报读记录的事务中把数据版本号加一，与修改一起提交或回滚"""
+    cursor.execute(f"UPDATE {DATA_VERSION_TABLE} SET version = version + 1")
+
+def read_data_version(conn, cursor):
+    """返回当前的数据版本号，旧版本创建的库没有版本表时返回None"""
+    if not table_exists(conn, cursor, DATA_VERSION_TABLE):
+        return None
+    cursor.execute(f"SELECT MAX(version) FROM {DATA_VERSION_TABLE}")
+    return cursor.fetchone()[0]
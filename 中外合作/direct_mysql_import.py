@@ -1,95 +1,251 @@
 import pandas as pd
-import mysql.connector
 from mysql.connector import Error
 import getpass
+import hashlib
+import re
 import sys
 import os
+import queue
+import tempfile
+import threading
+import time
 from datetime import datetime
+from data_version import bump_data_version, create_data_version_table
+from daily_rollup import ROLLUP_SOURCE_COLUMNS, apply_rollup_deltas, create_rollup_table, refresh_rollup_days, rollup_deltas
+from normalized_store import create_normalized_tables, fact_table, storage_layout, update_enrollments, write_enrollments
+from pipeline_metrics import CountingConnection, input_rows, instrument, result_rows, write_run_metrics
+from risk_scoring import create_risk_table, delete_scores, last_enrollment_id, save_import_scores, score_import_frame
+from storage_backend import (DATABASE_URL_ENV, EMBEDDED_BACKENDS, LAYOUTS, backend_of, connect, database_layout,
+                             parse_database_url, table_exists)
+from student_schema import (COLUMNS, COLUMN_MAPPING, DATE_COLUMNS, DERIVED_COLUMNS, DERIVED_DB_COLUMNS,
+                            DERIVED_SOURCE_COLUMNS, FEE_COLUMNS, INT_COLUMNS, NUMERIC_CSV_COLUMNS, SELECTED_COLUMNS,
+                            TRACKING_COLUMNS, apply_csv_dtypes, compute_derived_metrics, parse_typed_columns)
 
-def create_database_and_table(conn, cursor, database_name):
-    """创建数据库和表结构"""
+@instrument()
+def create_database_and_table(conn, cursor, database_name, layout=None):
+    """创建数据库和表结构
+    
+    layout 为 'normalized' 时使用学员/课程班级/报读记录三张表（已有宽表会被迁移），为None时读取
+    STUDENT_DB_LAYOUT 环境变量；数据库已是规范化布局时保持不变。
+    """
+    layout = layout or database_layout() or 'wide'
+    if layout not in LAYOUTS:
+        print(f"未知的存储布局: {layout}，可选: {', '.join(LAYOUTS)}")
+        return False
+    
     try:
-        # 创建数据库（如果不存在）
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database_name}")
-        cursor.execute(f"USE {database_name}")
-        
-        # 创建学生报读课程表
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS student_courses (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            student_name VARCHAR(100),
-            phone_relation VARCHAR(50),
-            phone_number VARCHAR(20),
-            class_name VARCHAR(100),
-            course_name VARCHAR(100),
-            course_type VARCHAR(50),
-            purchased_amount INT,
-            gifted_amount INT,
-            consumed_amount INT,
-            returned_amount INT,
-            remaining_amount INT,
-            over_amount INT,
-            consumed_fee DECIMAL(10,2),
-            remaining_fee DECIMAL(10,2),
-            absent_count INT,
-            follow_up_person VARCHAR(50),
-            tutor VARCHAR(50),
-            gender VARCHAR(10),
-            wechat_status VARCHAR(20),
-            card_status VARCHAR(20),
-            face_status VARCHAR(20),
-            grade VARCHAR(50),
-            student_id VARCHAR(50),
-            school VARCHAR(100),
-            import_date DATETIME
-        )
-        """)
+        if backend_of(conn) not in EMBEDDED_BACKENDS:
+            # 创建数据库（如果不存在）
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database_name}")
+            cursor.execute(f"USE {database_name}")
+        
+        if storage_layout(conn, cursor) == 'normalized' and layout == 'wide':
+            print("数据库已使用规范化布局，保持不变")
+            layout = 'normalized'
+        
+        # 数据版本表，迁移和补算等修改记录的步骤都会更新版本号
+        create_data_version_table(conn, cursor)
+        
+        # 宽表（包括待迁移的旧宽表）先补齐后来增加的列
+        if layout == 'wide' or table_exists(conn, cursor, 'student_courses'):
+            if backend_of(conn) in EMBEDDED_BACKENDS:
+                # 嵌入式数据库文件本身就是数据库，只需创建表
+                create_embedded_table(cursor, backend_of(conn))
+            else:
+                create_wide_table(cursor, database_name)
+        if layout == 'normalized':
+            create_normalized_tables(conn, cursor)
+        
+        # 旧版本导入的记录没有派生指标，按统一定义补算一次
+        if backfill_derived_metrics(conn, cursor, layout):
+            bump_data_version(cursor)
         
+        # 每日汇总表，供时间序列分析使用
+        create_rollup_table(conn, cursor)
+        
+        # 风险评分表，供学管师的看板读取
+        create_risk_table(conn, cursor)
         conn.commit()
-        print(f"数据库 {database_name} 和表 student_courses 创建成功")
+        
+        location = f"数据库文件 {conn.path}" if backend_of(conn) in EMBEDDED_BACKENDS else f"数据库 {database_name}"
+        tables = 'students/course_classes/enrollments' if layout == 'normalized' else 'student_courses'
+        print(f"{location} 和表 {tables} 创建成功")
         return True
     except Error as e:
         print(f"创建数据库和表时出错: {e}")
         return False
 
-def process_csv_file(filename):
-    """处理CSV文件，清洗数据"""
+def create_wide_table(cursor, database_name):
+    """在MySQL中创建学生报读课程宽表，并补齐后来增加的列和索引"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS student_courses (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        {},
+        import_date DATETIME,
+        row_hash CHAR(32),
+        snapshot_time DATETIME,
+        removed_at DATETIME NULL,
+        KEY idx_natural_key (student_id, course_name, class_name),
+        KEY idx_course_name (course_name),
+        KEY idx_class_name (class_name),
+        KEY idx_import_date (import_date),
+        KEY idx_student_id (student_id)
+    )
+    """.format(',\n        '.join(f"{db_name} {sql_type}" for db_name, sql_type in table_columns().items())))
+    
+    # 为旧版本创建的表补齐后来增加的列和索引
+    upgrade_student_courses_table(cursor, database_name)
+
+def upgrade_student_courses_table(cursor, database_name):
+    """为已存在的 student_courses 表补齐后来增加的列和索引"""
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'student_courses'",
+        (database_name,)
+    )
+    existing_columns = {row[0] for row in cursor.fetchall()}
+    for column, definition in added_columns().items():
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE student_courses ADD COLUMN {column} {definition}")
+    
+    cursor.execute(
+        "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'student_courses'",
+        (database_name,)
+    )
+    existing_indexes = {row[0] for row in cursor.fetchall()}
+    for index_name, columns in TABLE_INDEXES.items():
+        if index_name not in existing_indexes:
+            cursor.execute(f"ALTER TABLE student_courses ADD INDEX {index_name} ({columns})")
+
+def table_columns():
+    """宽表中按顺序排列的业务列和派生指标列及其数据库类型"""
+    columns = {db_name: sql_type for _, db_name, _, sql_type in COLUMNS}
+    columns.update({db_name: sql_type for db_name, _, sql_type in DERIVED_COLUMNS})
+    return columns
+
+def added_columns():
+    """旧版本创建的表可能缺少的列：后来加入统一定义的字段、派生指标和增量导入使用的列"""
+    columns = table_columns()
+    columns.update(DELTA_COLUMNS)
+    return columns
+
+def backfill_derived_metrics(conn, cursor, layout, batch_size=1000):
+    """为派生指标为空的记录（派生列加入之前导入的数据）计算并写入派生指标"""
+    cursor.execute(f"SELECT id, {', '.join(DERIVED_SOURCE_COLUMNS)} FROM student_courses WHERE attendance_rate IS NULL")
+    rows = cursor.fetchall()
+    if not rows:
+        return 0
+    
+    stale = pd.DataFrame(rows, columns=['id'] + DERIVED_SOURCE_COLUMNS)
+    derived = derived_metric_values(compute_derived_metrics(stale))
+    derived['id'] = stale['id'].astype('int64')
+    table = fact_table(layout)
+    if backend_of(conn) == 'duckdb':
+        conn.update_frame(table, derived, 'id')
+    else:
+        assignments = ', '.join(f"{col} = %s" for col in DERIVED_DB_COLUMNS)
+        rows = _frame_to_rows(derived[DERIVED_DB_COLUMNS + ['id']])
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(f"UPDATE {table} SET {assignments} WHERE id = %s", rows[i:i + batch_size])
+    print(f"已为 {len(derived)} 条记录补算派生指标")
+    return len(derived)
+
+def derived_metric_values(derived):
+    """将派生指标转换为可写入数据库的值，缺失值写入NULL"""
+    return pd.DataFrame({col: derived[col].astype(object).where(derived[col].notna(), None) for col in derived.columns},
+                        index=derived.index)
+
+def create_embedded_table(cursor, backend):
+    """在 SQLite / DuckDB 数据库文件中创建表，并补齐后来增加的列和索引"""
+    if backend == 'duckdb':
+        # DuckDB 没有自增列，使用序列生成id
+        cursor.execute("CREATE SEQUENCE IF NOT EXISTS student_courses_id_seq")
+        id_column = "id INTEGER PRIMARY KEY DEFAULT nextval('student_courses_id_seq')"
+    else:
+        id_column = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS student_courses (
+        {},
+        {},
+        import_date DATETIME,
+        row_hash CHAR(32),
+        snapshot_time DATETIME,
+        removed_at DATETIME NULL
+    )
+    """.format(id_column, ',\n        '.join(f"{db_name} {sql_type}" for db_name, sql_type in table_columns().items())))
+    
+    cursor.execute("SELECT * FROM student_courses LIMIT 0")
+    existing_columns = {column[0] for column in cursor.description}
+    for column, definition in added_columns().items():
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE student_courses ADD COLUMN {column} {definition}")
+    
+    # DuckDB 依靠列存的区间统计过滤数据，二级索引只会拖慢写入
+    if backend == 'sqlite':
+        for index_name, columns in TABLE_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON student_courses ({columns})")
+
+@instrument(rows=result_rows)
+def clean_frame(df, rejections=None):
+    """按统一规则清洗一份原始数据（完整文件或其中一个数据块）
+    
+    数值列和日期列按 student_schema 中的定义解析，无法解析的单元格追加到 rejections。
+    """
+    # 处理列名，去除前后空格
+    df.columns = df.columns.str.strip()
+    
+    # 解析带单位的数值列和日期列
+    df = parse_typed_columns(df, rejections)
+    
+    # 文本列的空值处理为空字符串
+    text_columns = [col for col in df.columns if col not in NUMERIC_CSV_COLUMNS and col not in DATE_COLUMNS]
+    df[text_columns] = df[text_columns].fillna('')
+    
+    # 转换为统一定义的紧凑类型，只保留存在的列
+    df = apply_csv_dtypes(df)
+    existing_columns = [col for col in SELECTED_COLUMNS if col in df.columns]
+    return df[existing_columns]
+
+def read_export_csv(filename, chunksize=None):
+    """读取导出文件，所有列先按字符串读取，类型转换统一由 clean_frame 完成"""
+    return pd.read_csv(filename, encoding='utf-8', dtype=str, chunksize=chunksize)
+
+def rejection_report_path(filename):
+    """导出文件对应的校验报告路径"""
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}_校验报告.csv"
+
+def report_rejections(rejections, filename):
+    """输出无法解析的单元格统计，并将明细写入校验报告"""
+    report_path = rejection_report_path(filename)
+    if not rejections:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return None
+    
+    report = pd.DataFrame(rejections, columns=['行号', '列', '原始值', '原因'])
+    report.to_csv(report_path, index=False, encoding='utf-8-sig')
+    counts = ', '.join(f"{col} {count} 个" for col, count in report['列'].value_counts().items())
+    print(f"校验发现 {len(report)} 个无法解析的单元格（{counts}），数值记为0、日期记为空，明细见 {report_path}")
+    return report_path
+
+@instrument(rows=result_rows)
+def process_csv_file(filename, rejections=None):
+    """处理CSV文件，清洗数据；rejections 为None时将校验报告写到导出文件旁"""
     try:
         # 读取CSV文件
-        df = pd.read_csv(filename, encoding='utf-8', low_memory=False)
+        df = read_export_csv(filename)
         
         # 显示前几行数据
         print("原始数据预览：")
         print(df.head(2))
         
-        # 处理列名，去除前后空格
-        df.columns = df.columns.str.strip()
-        
-        # 处理空值
-        df = df.fillna('')
-        
-        # 处理数字列中的非数字字符
-        numeric_columns = ['购买数量', '赠送数量', '消耗数量', '退转数量', '剩余数量', '超上数量', 
-                           '课消金额', '剩余课消金额', '缺课次数', '年龄']
-        
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace('课时', '').str.replace('岁', '')
-                # 尝试转换为数值，失败则设为0
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        # 选择最重要的列，简化CSV
-        selected_columns = [
-            '学员姓名', '手机号身份', '手机号', '所在班级', '课程名称', '课程类型',
-            '购买数量', '赠送数量', '消耗数量', '退转数量', '剩余数量', '超上数量',
-            '课消金额', '剩余课消金额', '缺课次数', '跟进人', '学管师',
-            '性别', '微信绑定状态', '绑卡状态', '人脸采集状态',
-            '年级', '学号', '学校'
-        ]
-        
-        # 只保留存在的列
-        existing_columns = [col for col in selected_columns if col in df.columns]
-        df_selected = df[existing_columns]
+        collected = [] if rejections is None else rejections
+        df_selected = clean_frame(df, collected)
+        if rejections is None:
+            report_rejections(collected, filename)
         
         print("数据清洗完成，共处理 {} 行记录".format(len(df_selected)))
         return df_selected
@@ -98,101 +254,502 @@ def process_csv_file(filename):
         print(f"处理CSV文件时出错: {e}")
         return None
 
-def import_to_mysql(df, conn, cursor, batch_size=100):
-    """将DataFrame数据导入MySQL"""
+# 增量导入使用的自然键和附加列
+NATURAL_KEY = ['student_id', 'course_name', 'class_name']
+DELTA_COLUMNS = {col: definition for col, definition in TRACKING_COLUMNS.items() if col != 'import_date'}
+
+# student_courses 表的二级索引，支持增量导入和聚合查询
+TABLE_INDEXES = {
+    'idx_natural_key': 'student_id, course_name, class_name',
+    'idx_course_name': 'course_name',
+    'idx_class_name': 'class_name',
+    'idx_import_date': 'import_date',
+    'idx_student_id': 'student_id'
+}
+
+# 导出文件名中的快照时间戳，例如 学生报读课程20250506141730.csv
+SNAPSHOT_TIME_PATTERN = re.compile(r'(\d{14})')
+
+# 校区前缀：学员姓名以两位校区代码开头，例如 QL刘咏坦 -> QL
+CAMPUS_PREFIX_PATTERN = r'^([A-Z]{2})'
+
+# 可选的导入模式：row 逐行插入，batch 多行批量插入，infile 通过 LOAD DATA LOCAL INFILE 装载
+IMPORT_MODES = ('row', 'batch', 'infile')
+
+@instrument(rows=result_rows)
+def prepare_import_frame(df, import_time):
+    """按整列完成类型转换，返回列名已映射为数据库列名的DataFrame"""
+    prepared = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        if col not in COLUMN_MAPPING:
+            continue
+        if col in INT_COLUMNS:
+            prepared[COLUMN_MAPPING[col]] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
+        elif col in FEE_COLUMNS:
+            prepared[COLUMN_MAPPING[col]] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('float64')
+        elif col in DATE_COLUMNS:
+            # 缺失的日期写入NULL
+            dates = pd.to_datetime(df[col], errors='coerce')
+            prepared[COLUMN_MAPPING[col]] = dates.dt.strftime('%Y-%m-%d').astype(object).where(dates.notna(), None)
+        else:
+            prepared[COLUMN_MAPPING[col]] = df[col].astype(str)
+    
+    # 派生指标在导入时按统一定义计算一次，分析时直接读取
+    derived = derived_metric_values(compute_derived_metrics(prepared))
+    prepared[DERIVED_DB_COLUMNS] = derived
+    
+    # 添加导入时间
+    prepared['import_date'] = import_time
+    return prepared
+
+def _frame_to_rows(prepared):
+    """将DataFrame转换为由Python原生类型组成的行元组列表"""
+    columns = [prepared[col].tolist() for col in prepared.columns]
+    return list(zip(*columns))
+
+def _insert_rows_individually(write_row, count, offset, failed_positions=None):
+    """逐行插入，用于批量插入失败后定位出错的行；failed_positions 不为None时记录出错行的位置
+    
+    write_row 接收行在本批次中的位置并写入该行。
+    """
+    insert_count = 0
+    error_count = 0
+    for position in range(count):
+        try:
+            write_row(position)
+            insert_count += 1
+        except Error as e:
+            error_count += 1
+            if failed_positions is not None:
+                failed_positions.append(position)
+            print(f"插入第 {offset + position + 1} 行数据时出错: {e}")
+    return insert_count, error_count
+
+def _escape_infile_value(value):
+    """按 LOAD DATA 默认的转义规则处理字段值，None 写为 \\N（NULL）"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+@instrument(rows=input_rows)
+def _load_data_infile(prepared, conn, cursor):
+    """将数据写入临时文件后通过 LOAD DATA LOCAL INFILE 一次性装载"""
+    rows = _frame_to_rows(prepared)
+    columns_str = ', '.join(prepared.columns)
+    
+    scores = score_import_frame(prepared)
+    
+    fd, staged_path = tempfile.mkstemp(suffix='.tsv', prefix='student_courses_')
     try:
-        # 获取列映射
-        column_mapping = {
-            '学员姓名': 'student_name',
-            '手机号身份': 'phone_relation',
-            '手机号': 'phone_number',
-            '所在班级': 'class_name',
-            '课程名称': 'course_name',
-            '课程类型': 'course_type',
-            '购买数量': 'purchased_amount',
-            '赠送数量': 'gifted_amount',
-            '消耗数量': 'consumed_amount',
-            '退转数量': 'returned_amount',
-            '剩余数量': 'remaining_amount',
-            '超上数量': 'over_amount',
-            '课消金额': 'consumed_fee',
-            '剩余课消金额': 'remaining_fee',
-            '缺课次数': 'absent_count',
-            '跟进人': 'follow_up_person',
-            '学管师': 'tutor',
-            '性别': 'gender',
-            '微信绑定状态': 'wechat_status',
-            '绑卡状态': 'card_status',
-            '人脸采集状态': 'face_status',
-            '年级': 'grade',
-            '学号': 'student_id',
-            '学校': 'school'
-        }
+        last_id = last_enrollment_id(cursor)
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            for values in rows:
+                f.write('\t'.join(_escape_infile_value(v) for v in values))
+                f.write('\n')
+        
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE student_courses "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' "
+            f"LINES TERMINATED BY '\\n' ({columns_str})",
+            (staged_path,)
+        )
+        loaded = cursor.rowcount
+        
+        # LOAD DATA 不会因单行问题中断，逐条输出警告以定位出错的行
+        cursor.execute("SHOW WARNINGS")
+        warnings = cursor.fetchall()
+        for level, code, message in warnings:
+            print(f"装载数据时出现{level} ({code}): {message}")
+        
+        # 无法确定哪些行装载失败，按导入日期从明细表重新汇总
+        refresh_rollup_days(conn, cursor, pd.to_datetime(prepared['import_date']).dt.date.unique())
+        save_import_scores(conn, cursor, scores, after_id=last_id)
+        bump_data_version(cursor)
+        conn.commit()
+        return loaded, len(rows) - loaded
+    finally:
+        os.remove(staged_path)
+
+@instrument(rows=input_rows)
+def _write_rows(prepared, conn, cursor, batch_size, mode, offset=0, report_progress=True):
+    """按批次写入已转换的数据并逐批提交，返回成功和失败的行数"""
+    placeholders = ', '.join(['%s'] * len(prepared.columns))
+    columns_str = ', '.join(prepared.columns)
+    sql = f"INSERT INTO student_courses ({columns_str}) VALUES ({placeholders})"
+    rows = _frame_to_rows(prepared)
+    total_rows = len(rows)
+    insert_count = 0
+    error_count = 0
+    # 规范化布局先写入学员和课程班级，再写入引用它们的报读记录
+    normalized = storage_layout(conn, cursor) == 'normalized'
+    # DuckDB 逐行绑定参数很慢，批量模式下直接从DataFrame写入
+    frame_insert = backend_of(conn) == 'duckdb' and mode == 'batch'
+    
+    for i in range(0, total_rows, batch_size):
+        last_id = last_enrollment_id(cursor, fact_table('normalized' if normalized else 'wide'))
+        batch_rows = rows[i:i + batch_size]
+        batch_frame = prepared.iloc[i:i + batch_size]
+        # 写入前为本批记录评分，逐行模式下逐行调用 score_record
+        scores = score_import_frame(batch_frame, per_record=(mode == 'row'))
+        failed_positions = []
+        if normalized:
+            write_row = lambda position: write_enrollments(conn, cursor, batch_frame.iloc[[position]])
+        else:
+            write_row = lambda position: cursor.execute(sql, batch_rows[position])
+        
+        if mode == 'batch':
+            try:
+                if normalized:
+                    write_enrollments(conn, cursor, batch_frame, batch_size)
+                elif frame_insert:
+                    conn.insert_frame('student_courses', batch_frame)
+                else:
+                    # executemany 会将INSERT改写为一条多行VALUES语句
+                    cursor.executemany(sql, batch_rows)
+                insert_count += len(batch_rows)
+            except Error as e:
+                print(f"批量插入第 {offset + i + 1}-{offset + i + len(batch_rows)} 行时出错，改为逐行插入: {e}")
+                conn.rollback()
+                inserted, failed = _insert_rows_individually(write_row, len(batch_rows), offset + i, failed_positions)
+                insert_count += inserted
+                error_count += failed
+        else:
+            inserted, failed = _insert_rows_individually(write_row, len(batch_rows), offset + i, failed_positions)
+            insert_count += inserted
+            error_count += failed
         
+        # 在同一事务中把写入成功的行计入每日汇总并保存其评分，每批次提交一次
+        apply_rollup_deltas(conn, cursor, rollup_deltas(batch_frame.drop(batch_frame.index[failed_positions])))
+        save_import_scores(conn, cursor, scores.drop(scores.index[failed_positions]), after_id=last_id,
+                           table=fact_table('normalized' if normalized else 'wide'))
+        bump_data_version(cursor)
+        conn.commit()
+        if report_progress:
+            print(f"已处理 {min(i+batch_size, total_rows)}/{total_rows} 条记录")
+    
+    return insert_count, error_count
+
+def resolve_import_mode(conn, cursor, mode):
+    """嵌入式数据库和规范化布局不支持 LOAD DATA LOCAL INFILE，改用批量插入"""
+    if mode == 'infile' and backend_of(conn) in EMBEDDED_BACKENDS:
+        print(f"{backend_of(conn)} 不支持 LOAD DATA LOCAL INFILE，改用批量插入")
+        return 'batch'
+    if mode == 'infile' and storage_layout(conn, cursor) == 'normalized':
+        # 报读记录需要先解析学员和课程班级的代理键，无法直接装载导出的宽表行
+        print("规范化布局不支持 LOAD DATA LOCAL INFILE，改用批量插入")
+        return 'batch'
+    return mode
+
+@instrument(rows=input_rows)
+def import_to_mysql(df, conn, cursor, batch_size=100, mode='row'):
+    """将DataFrame数据导入MySQL
+    
+    mode 可选 'row'（逐行插入）、'batch'（多行批量插入）或 'infile'（LOAD DATA LOCAL INFILE）。
+    """
+    if mode not in IMPORT_MODES:
+        print(f"未知的导入模式: {mode}，可选: {', '.join(IMPORT_MODES)}")
+        return False
+    mode = resolve_import_mode(conn, cursor, mode)
+    
+    try:
         # 获取当前时间
         import_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        start_time = time.perf_counter()
         
-        # 准备批量插入
-        total_rows = len(df)
+        # 按整列完成类型转换
+        prepared = prepare_import_frame(df, import_time)
+        total_rows = len(prepared)
         insert_count = 0
         error_count = 0
         
-        for i in range(0, total_rows, batch_size):
-            batch_df = df.iloc[i:min(i+batch_size, total_rows)]
-            
-            for _, row in batch_df.iterrows():
-                try:
-                    # 准备列和值
-                    columns = []
-                    values = []
-                    
-                    for col in df.columns:
-                        if col in column_mapping:
-                            columns.append(column_mapping[col])
-                            
-                            # 根据类型处理值
-                            if col in ['购买数量', '赠送数量', '消耗数量', '退转数量', '剩余数量', '超上数量', '缺课次数']:
-                                values.append(int(float(row[col])))
-                            elif col in ['课消金额', '剩余课消金额']:
-                                values.append(float(row[col]))
-                            else:
-                                values.append(str(row[col]))
-                    
-                    # 添加导入时间
-                    columns.append('import_date')
-                    values.append(import_time)
-                    
-                    # 构建插入SQL语句
-                    placeholders = ', '.join(['%s'] * len(columns))
-                    columns_str = ', '.join(columns)
-                    sql = f"INSERT INTO student_courses ({columns_str}) VALUES ({placeholders})"
-                    
-                    # 执行插入
-                    cursor.execute(sql, values)
-                    insert_count += 1
-                    
-                except Error as e:
-                    error_count += 1
-                    print(f"插入数据时出错: {e}")
-                    continue
-            
-            # 每批次提交一次
-            conn.commit()
-            print(f"已处理 {min(i+batch_size, total_rows)}/{total_rows} 条记录")
+        if mode == 'infile':
+            insert_count, error_count = _load_data_infile(prepared, conn, cursor)
+            print(f"已处理 {total_rows}/{total_rows} 条记录")
+        else:
+            insert_count, error_count = _write_rows(prepared, conn, cursor, batch_size, mode)
         
+        elapsed = time.perf_counter() - start_time
+        rows_per_sec = total_rows / elapsed if elapsed > 0 else float('inf')
         print(f"数据导入完成。成功: {insert_count} 条，失败: {error_count} 条")
+        print(f"导入模式: {mode}，耗时 {elapsed:.2f} 秒，速度 {rows_per_sec:.0f} 行/秒")
         return True
     
     except Error as e:
         print(f"导入数据时出错: {e}")
         return False
 
+def import_chunk(df, conn, cursor, import_time, batch_size=1000, mode='batch', offset=0):
+    """写入一块已清洗的数据并逐批提交，返回成功和失败的行数；mode 需已按后端确定"""
+    prepared = prepare_import_frame(df, import_time)
+    if mode == 'infile':
+        return _load_data_infile(prepared, conn, cursor)
+    return _write_rows(prepared, conn, cursor, batch_size, mode, offset=offset, report_progress=False)
+
+@instrument()
+def stream_import(filename, conn, cursor, chunksize=10000, queue_size=4, batch_size=1000, mode='batch'):
+    """分块读取并清洗CSV，由写入线程经有界队列并行写入数据库，内存占用与文件大小无关"""
+    if mode not in IMPORT_MODES:
+        print(f"未知的导入模式: {mode}，可选: {', '.join(IMPORT_MODES)}")
+        return False
+    mode = resolve_import_mode(conn, cursor, mode)
+    
+    import_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    start_time = time.perf_counter()
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    stats = {'rows': 0, 'inserted': 0, 'failed': 0, 'error': None}
+    rejections = []
+    
+    def writer():
+        chunk_number = 0
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is None:
+                break
+            chunk_number += 1
+            # 写入出错后继续取出剩余数据块，避免读取线程阻塞在队列上
+            if stats['error'] is not None:
+                continue
+            try:
+                inserted, failed = import_chunk(chunk, conn, cursor, import_time, batch_size=batch_size,
+                                                mode=mode, offset=stats['rows'])
+                stats['rows'] += len(chunk)
+                stats['inserted'] += inserted
+                stats['failed'] += failed
+                elapsed = time.perf_counter() - start_time
+                print(f"已写入第 {chunk_number} 块 ({len(chunk)} 行)，累计 {stats['rows']} 条记录，"
+                      f"速度 {stats['rows'] / elapsed:.0f} 行/秒")
+            except Exception as e:
+                stats['error'] = e
+    
+    writer_thread = threading.Thread(target=writer, name='student-courses-writer')
+    writer_thread.start()
+    
+    try:
+        # 所有列按字符串读取，避免不同数据块推断出不同的类型
+        reader = read_export_csv(filename, chunksize=chunksize)
+        for chunk in reader:
+            if stats['error'] is not None:
+                break
+            # 队列已满时阻塞，限制同时驻留内存的数据块数量
+            chunk_queue.put(clean_frame(chunk, rejections))
+    except Exception as e:
+        print(f"读取CSV文件时出错: {e}")
+        stats['error'] = stats['error'] or e
+    finally:
+        chunk_queue.put(None)
+        writer_thread.join()
+    report_rejections(rejections, filename)
+    
+    if stats['error'] is not None:
+        print(f"流式导入数据时出错: {stats['error']}")
+        return False
+    
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = stats['rows'] / elapsed if elapsed > 0 else float('inf')
+    print(f"流式导入完成。成功: {stats['inserted']} 条，失败: {stats['failed']} 条")
+    print(f"导入模式: {mode}，耗时 {elapsed:.2f} 秒，速度 {rows_per_sec:.0f} 行/秒")
+    return True
+
+def parse_snapshot_time(filename):
+    """从导出文件名中解析快照时间，文件名不含时间戳时使用文件修改时间"""
+    match = SNAPSHOT_TIME_PATTERN.search(os.path.basename(filename))
+    if match:
+        return datetime.strptime(match.group(1), '%Y%m%d%H%M%S')
+    return datetime.fromtimestamp(os.path.getmtime(filename))
+
+@instrument(rows=result_rows)
+def compute_row_hashes(prepared):
+    """计算每行业务内容的MD5哈希，用于判断记录是否发生变化"""
+    # 派生指标由业务列决定，不参与哈希，加入派生列前保存的哈希仍然有效
+    content_columns = [col for col in prepared.columns
+                       if col not in ('import_date', 'snapshot_time') and col not in DERIVED_DB_COLUMNS]
+    # 缺失的日期按空字符串参与哈希
+    joined = prepared[content_columns[0]].fillna('').astype(str)
+    for col in content_columns[1:]:
+        joined = joined + '\x1f' + prepared[col].fillna('').astype(str)
+    return pd.Series([hashlib.md5(value.encode('utf-8')).hexdigest() for value in joined],
+                     index=prepared.index)
+
+def campus_of(names):
+    """由学员姓名推断每行所属的校区前缀，没有前缀的记录归为空字符串"""
+    return names.astype(str).str.extract(CAMPUS_PREFIX_PATTERN, expand=False).fillna('')
+
+def campus_prefixes(df):
+    """返回数据中出现的校区前缀（例如 QL）"""
+    if '学员姓名' not in df.columns:
+        return []
+    return sorted(campus_of(df['学员姓名']).unique().tolist())
+
+# 增量导入时读取的已有记录的汇总相关列，与 ROLLUP_SOURCE_COLUMNS 一一对应
+EXISTING_ROLLUP_COLUMNS = ['existing_import_date', 'existing_name', 'existing_purchased', 'existing_consumed']
+
+def _existing_rollup_values(frame):
+    """取出已有记录写入前的汇总相关列，列名与明细表一致"""
+    return frame[EXISTING_ROLLUP_COLUMNS].set_axis(ROLLUP_SOURCE_COLUMNS, axis=1)
+
+@instrument(rows=input_rows)
+def delta_import(df, conn, cursor, snapshot_time, batch_size=1000, force=False, scope_prefixes=None):
+    """按自然键增量导入快照：只插入新记录、更新变化的记录、标记消失的记录
+    
+    scope_prefixes 为校区前缀列表时，只与这些校区的已有记录比较，其他校区的记录不受影响。
+    成功时返回新增、更新、标记删除和未变化的记录数以及是否因已导入更新的快照而跳过（跳过时各记录数均为0），
+    失败时返回None。
+    """
+    try:
+        start_time = time.perf_counter()
+        snapshot_str = snapshot_time.strftime('%Y-%m-%d %H:%M:%S')
+        
+        # 读取当前有效记录的自然键和哈希，以及维护每日汇总需要的旧值
+        cursor.execute(
+            "SELECT id, student_id, course_name, class_name, row_hash, student_name, snapshot_time, "
+            "import_date, purchased_amount, consumed_amount "
+            "FROM student_courses WHERE removed_at IS NULL"
+        )
+        existing = pd.DataFrame(cursor.fetchall(),
+                                columns=['id'] + NATURAL_KEY + ['existing_hash', 'student_name', 'snapshot_time']
+                                + ['existing_import_date', 'existing_purchased', 'existing_consumed'])
+        
+        # 按校区前缀限定比较范围
+        if scope_prefixes is not None:
+            existing = existing[campus_of(existing['student_name']).isin(scope_prefixes)]
+        
+        # 已导入过更新的快照时跳过，保证重复执行不会产生写入
+        latest_snapshot = pd.to_datetime(existing['snapshot_time']).max()
+        if pd.notna(latest_snapshot) and pd.Timestamp(snapshot_time) <= latest_snapshot and not force:
+            print(f"快照 {snapshot_str} 不晚于已导入的快照 {latest_snapshot}，跳过导入")
+            return {'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': 0, 'skipped': True}
+        
+        import_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        prepared = prepare_import_frame(df, import_time)
+        missing_keys = [col for col in NATURAL_KEY if col not in prepared.columns]
+        if missing_keys:
+            print(f"快照缺少自然键列: {', '.join(missing_keys)}")
+            return None
+        
+        prepared['row_hash'] = compute_row_hashes(prepared)
+        prepared['snapshot_time'] = snapshot_str
+        
+        # 同一快照内自然键重复时保留最后一条
+        duplicated = prepared.duplicated(NATURAL_KEY, keep='last')
+        if duplicated.any():
+            print(f"快照中有 {int(duplicated.sum())} 条记录的自然键重复，仅保留最后一条")
+            prepared = prepared[~duplicated]
+        
+        existing = existing.assign(existing_name=existing['student_name'])
+        existing = existing[['id'] + NATURAL_KEY + ['existing_hash'] + EXISTING_ROLLUP_COLUMNS].copy()
+        existing[NATURAL_KEY] = existing[NATURAL_KEY].fillna('').astype(str)
+        
+        # 旧的追加导入可能留下重复记录，只保留id最大的一条作为当前记录
+        existing = existing.sort_values('id')
+        stale = existing[existing.duplicated(NATURAL_KEY, keep='last')]
+        stale_ids = stale['id'].tolist()
+        existing = existing.drop_duplicates(NATURAL_KEY, keep='last')
+        
+        merged = prepared.merge(existing, on=NATURAL_KEY, how='outer', indicator=True)
+        new_rows = merged[merged['_merge'] == 'left_only']
+        matched = merged[merged['_merge'] == 'both']
+        changed_rows = matched[matched['row_hash'] != matched['existing_hash']]
+        removed = merged[merged['_merge'] == 'right_only']
+        removed_ids = removed['id'].astype(int).tolist() + stale_ids
+        
+        data_columns = list(prepared.columns)
+        layout = storage_layout(conn, cursor)
+        last_id = last_enrollment_id(cursor, fact_table(layout))
+        # 写入前为新增和变化的记录评分
+        new_scores = score_import_frame(new_rows[data_columns])
+        changed_scores = score_import_frame(changed_rows[data_columns])
+        
+        # 插入新记录
+        if len(new_rows) and layout == 'normalized':
+            write_enrollments(conn, cursor, new_rows[data_columns], batch_size)
+        elif len(new_rows):
+            placeholders = ', '.join(['%s'] * len(data_columns))
+            sql = f"INSERT INTO student_courses ({', '.join(data_columns)}) VALUES ({placeholders})"
+            rows = _frame_to_rows(new_rows[data_columns])
+            if backend_of(conn) == 'duckdb':
+                conn.insert_frame('student_courses', new_rows[data_columns])
+            else:
+                for i in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[i:i + batch_size])
+        
+        # 更新变化的记录，保留原始导入时间
+        update_columns = [col for col in data_columns if col not in NATURAL_KEY and col != 'import_date']
+        if len(changed_rows):
+            assignments = ', '.join(f"{col} = %s" for col in update_columns)
+            sql = f"UPDATE student_courses SET {assignments} WHERE id = %s"
+            changed_rows = changed_rows.assign(id=changed_rows['id'].astype(int))
+            if layout == 'normalized':
+                # 学员和班级列用于写入维度表并取得代理键
+                keyed_columns = [col for col in data_columns if col != 'import_date']
+                update_enrollments(conn, cursor, changed_rows[keyed_columns + ['id']], batch_size)
+            elif backend_of(conn) == 'duckdb':
+                conn.update_frame('student_courses', changed_rows[update_columns + ['id']], 'id')
+            else:
+                rows = _frame_to_rows(changed_rows[update_columns + ['id']])
+                for i in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[i:i + batch_size])
+        
+        # 标记快照中已消失的记录
+        if removed_ids:
+            sql = f"UPDATE {fact_table(layout)} SET removed_at = %s WHERE id = %s"
+            if backend_of(conn) == 'duckdb':
+                conn.update_frame(fact_table(layout), pd.DataFrame({'removed_at': snapshot_str, 'id': removed_ids}), 'id')
+            else:
+                rows = [(snapshot_str, row_id) for row_id in removed_ids]
+                for i in range(0, len(rows), batch_size):
+                    cursor.executemany(sql, rows[i:i + batch_size])
+        
+        # 每日汇总：新记录计入今天；变化和消失的记录按原导入日期减去旧值，变化的记录再加上新值
+        apply_rollup_deltas(
+            conn, cursor,
+            rollup_deltas(new_rows),
+            rollup_deltas(changed_rows[['existing_import_date', 'student_name', 'purchased_amount', 'consumed_amount']]
+                          .set_axis(ROLLUP_SOURCE_COLUMNS, axis=1)),
+            rollup_deltas(_existing_rollup_values(changed_rows), sign=-1),
+            rollup_deltas(_existing_rollup_values(removed), sign=-1),
+            rollup_deltas(_existing_rollup_values(stale), sign=-1)
+        )
+        
+        # 保存新增和变化的记录的评分，删除已消失记录的评分
+        save_import_scores(conn, cursor, new_scores, after_id=last_id, table=fact_table(layout))
+        save_import_scores(conn, cursor, changed_scores, ids=changed_rows['id'].astype(int).tolist())
+        delete_scores(cursor, removed_ids)
+        
+        # 整个快照在一个事务中提交
+        bump_data_version(cursor)
+        conn.commit()
+        
+        elapsed = time.perf_counter() - start_time
+        unchanged_count = len(matched) - len(changed_rows)
+        print(f"增量导入完成。新增: {len(new_rows)} 条，更新: {len(changed_rows)} 条，"
+              f"标记删除: {len(removed_ids)} 条，未变化: {unchanged_count} 条")
+        print(f"快照时间: {snapshot_str}，耗时 {elapsed:.2f} 秒")
+        return {'inserted': len(new_rows), 'updated': len(changed_rows), 'removed': len(removed_ids),
+                'unchanged': unchanged_count, 'skipped': False}
+    
+    except Error as e:
+        conn.rollback()
+        print(f"增量导入数据时出错: {e}")
+        return None
+
 def main():
-    # 获取MySQL连接信息
-    host = input("请输入MySQL主机地址 (默认: localhost): ") or "localhost"
-    user = input("请输入MySQL用户名 (默认: root): ") or "root"
-    password = getpass.getpass("请输入MySQL密码: ")
-    database = "student_management"
+    # 数据库地址，例如 sqlite:///student_management.db 可导入本地数据库文件，不需要MySQL服务器
+    url = os.environ.get(DATABASE_URL_ENV) or input(
+        "请输入数据库地址，例如 sqlite:///student_management.db (默认: MySQL): ")
+    options = parse_database_url(url) if url else {'backend': 'mysql'}
+    if options['backend'] == 'mysql':
+        # 获取MySQL连接信息，地址中已包含的部分不再询问
+        host = options.get('host') or input("请输入MySQL主机地址 (默认: localhost): ") or "localhost"
+        port = options.get('port', 3306)
+        user = options.get('user') or input("请输入MySQL用户名 (默认: root): ") or "root"
+        password = options.get('password') or getpass.getpass("请输入MySQL密码: ")
+        database = options.get('database', "student_management")
+        url = None
+    else:
+        host, port, user, password = None, None, None, None
+        database = options['path']
+    mode = input("请选择导入模式 row/batch/infile/delta/stream (默认: batch): ") or "batch"
     
     # CSV文件路径
     csv_file = '学生报读课程20250506141730.csv'
@@ -203,35 +760,52 @@ def main():
         return
     
     try:
-        # 连接到MySQL
-        print(f"正在连接到MySQL服务器 {host}...")
-        conn = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password
-        )
+        # 连接到数据库
+        print(f"正在连接到数据库 {url or host}...")
+        if url:
+            conn = CountingConnection(connect(url))
+        else:
+            conn = CountingConnection(connect(
+                host=host,
+                port=port,
+                user=user,
+                password=password,
+                allow_local_infile=(mode == 'infile')
+            ))
         
         if conn.is_connected():
-            print("MySQL连接成功")
+            print("数据库连接成功")
             cursor = conn.cursor()
             
             # 创建数据库和表
             if create_database_and_table(conn, cursor, database):
-                # 处理CSV文件
-                df = process_csv_file(csv_file)
-                
-                if df is not None:
-                    # 导入数据到MySQL
-                    if import_to_mysql(df, conn, cursor):
+                if mode == 'stream':
+                    # 分块读取、清洗并写入，不在内存中保留完整文件
+                    if stream_import(csv_file, conn, cursor):
                         print(f"成功将数据导入到 {database}.student_courses 表")
+                else:
+                    # 处理CSV文件
+                    df = process_csv_file(csv_file)
+                    
+                    if df is not None:
+                        # 导入数据到MySQL
+                        if mode == 'delta':
+                            imported = delta_import(df, conn, cursor, parse_snapshot_time(csv_file))
+                        else:
+                            imported = import_to_mysql(df, conn, cursor, batch_size=1000, mode=mode)
+                        if imported:
+                            print(f"成功将数据导入到 {database}.student_courses 表")
             
             # 关闭连接
             cursor.close()
             conn.close()
-            print("MySQL连接已关闭")
-        
+            print("数据库连接已关闭")
+    
     except Error as e:
-        print(f"连接MySQL时出错: {e}")
+        print(f"连接数据库时出错: {e}")
+    
+    # 保存本次运行各阶段的指标
+    write_run_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
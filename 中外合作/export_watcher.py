@@ -0,0 +1,264 @@
+import argparse
+import getpass
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from mysql.connector import Error
+from batch_import import EXPORT_FILE_PATTERN, create_pool
+from direct_mysql_import import campus_prefixes, delta_import, parse_snapshot_time, process_csv_file
+from pipeline_metrics import CountingConnection, write_run_metrics
+from storage_backend import DATABASE_URL_ENV, LAYOUTS, database_layout, mysql_url
+
+# 默认监视的导出目录（相对于 中外合作 目录）
+EXPORT_DIR = os.path.join('..', '招生简章')
+
+# 已处理导出文件的记录，重启后据此跳过已导入的快照
+LEDGER_FILE = '已导入快照.json'
+
+# 两次扫描目录的间隔（秒）
+POLL_SECONDS = 15
+
+# 文件大小和修改时间保持不变超过该时间（秒）才视为写入完成，避免读取复制到一半的文件
+SETTLE_SECONDS = 10
+
+# 导出文件通常以换行结尾；保持不变但最后一个字节不是换行的文件可能停在某一行的中间，再多等待该时间（秒）
+COMPLETE_SUFFIX = b'\n'
+NEWLINE_GRACE_SECONDS = 30
+
+# 只运行一次时，文件出现后超过该时间（秒）仍未写入完成则放弃
+MAX_WAIT_SECONDS = 300
+
+# 读取文件计算哈希的块大小
+READ_CHUNK_SIZE = 64 * 1024
+
+def load_ledger(path=LEDGER_FILE):
+    """读取已处理文件的记录 {'files': {文件名: 记录}}，文件不存在时返回空记录"""
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_ledger(ledger, path=LEDGER_FILE):
+    """先写入临时文件并落盘，再替换原文件，中断时不会留下不完整的记录"""
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(ledger, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def file_md5(path):
+    """分块计算文件内容的MD5"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ends_with_newline(path):
+    """检查文件最后一个字节是否为换行，写入到一半的文件通常停在某一行的中间"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == COMPLETE_SUFFIX
+
+def scan_exports(directory, ledger, pending, settle_seconds=SETTLE_SECONDS, now=None,
+                 newline_grace=NEWLINE_GRACE_SECONDS):
+    """扫描导出目录，返回已经写入完成且未处理过的文件（按快照时间排序）
+    
+    pending 记录每个候选文件最近一次观察到的 (大小, 修改时间)、开始保持不变的时间和第一次发现的时间；
+    大小或修改时间变化时重新计时，保持不变 settle_seconds 秒即视为写入完成。不以换行结尾的文件再多等待
+    newline_grace 秒，仍未变化时给出警告并照常导入。记录中大小和修改时间都未变化的文件直接跳过，不再计算哈希。
+    """
+    now = time.time() if now is None else now
+    paths = glob.glob(os.path.join(directory, EXPORT_FILE_PATTERN))
+    for path in set(pending) - set(paths):
+        del pending[path]
+    
+    ready = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint = [stat.st_size, stat.st_mtime_ns]
+        entry = ledger['files'].get(os.path.basename(path))
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            continue
+        observed = pending.get(path)
+        if observed is None or observed['fingerprint'] != fingerprint:
+            first_seen = now if observed is None else observed['first_seen']
+            pending[path] = {'fingerprint': fingerprint, 'since': now, 'first_seen': first_seen}
+            continue
+        
+        stable = now - observed['since']
+        if stable < settle_seconds:
+            continue
+        if ends_with_newline(path):
+            ready.append(path)
+        elif stable >= settle_seconds + newline_grace:
+            print(f"警告: {os.path.basename(path)} 已 {stable:.0f} 秒未变化但不以换行结尾，按完整文件导入")
+            ready.append(path)
+        elif not observed.get('unterminated'):
+            observed['unterminated'] = True
+            print(f"{os.path.basename(path)} 不以换行结尾，可能仍在写入，最多再等待 {newline_grace:.0f} 秒")
+    return sorted(ready, key=lambda path: (parse_snapshot_time(path), path))
+
+def find_duplicate(ledger, name, entry):
+    """返回内容相同且导入后不会改变数据库的已导入文件名：最近一次导入的快照，或快照时间相同的文件"""
+    imported = {other: recorded for other, recorded in ledger['files'].items()
+                if recorded['status'] == '已导入' and other != name}
+    latest = max(imported, key=lambda other: imported[other]['snapshot_time'], default=None)
+    return next((other for other, recorded in imported.items() if recorded['md5'] == entry['md5']
+                 and (other == latest or recorded['snapshot_time'] == entry['snapshot_time'])), None)
+
+def ingest_export(path, conn, cursor, ledger, batch_size=1000):
+    """增量导入一个导出文件并写入记录，返回是否有新数据写入数据库
+    
+    内容与最近一次导入的快照（或快照时间相同的已导入文件）相同的副本和无法解析的文件也会写入记录，
+    文件再次变化后才重新处理；与更早的快照内容相同的文件照常导入，数据库回到该快照的状态。
+    写入数据库失败的文件不写入记录，下次扫描时重试。已导入的文件导出后又被改写时，按同一快照重新导入。
+    """
+    name = os.path.basename(path)
+    previous = ledger['files'].get(name)
+    rewritten = previous is not None and previous['status'] == '已导入'
+    stat = os.stat(path)
+    entry = {'fingerprint': [stat.st_size, stat.st_mtime_ns], 'md5': file_md5(path),
+             'snapshot_time': parse_snapshot_time(path).isoformat(timespec='seconds')}
+    
+    duplicate = find_duplicate(ledger, name, entry)
+    if duplicate is not None:
+        print(f"{name} 与已导入的 {duplicate} 内容相同，跳过")
+        entry['status'] = f"与 {duplicate} 相同"
+        imported = False
+    else:
+        df = process_csv_file(path)
+        if df is None:
+            entry['status'] = '解析失败'
+            imported = False
+        else:
+            if rewritten:
+                print(f"{name} 在导入后被改写，重新导入该快照")
+            if not delta_import(df, conn, cursor, parse_snapshot_time(path), batch_size=batch_size, force=rewritten,
+                                scope_prefixes=campus_prefixes(df)):
+                print(f"{name} 导入失败，将在下次扫描时重试")
+                return False
+            entry.update(status='已导入', rows=len(df))
+            imported = True
+    
+    entry['processed_at'] = datetime.now().isoformat(timespec='seconds')
+    ledger['files'][name] = entry
+    return imported
+
+def refresh_outputs(fanout=False):
+    """重新生成报告、图表和时间序列；输入未变化的报告部分和图表直接复用上次的结果"""
+    import advanced_analytics
+    advanced_analytics.reset_loaded_data()
+    advanced_analytics.save_report_to_file()
+    advanced_analytics.perform_time_series_analysis()
+    if fanout:
+        from report_fanout import run_fanout
+        run_fanout()
+
+def watch(directory, pool, ledger_path=LEDGER_FILE, poll_seconds=POLL_SECONDS, settle_seconds=SETTLE_SECONDS,
+          batch_size=1000, fanout=False, once=False, max_wait=MAX_WAIT_SECONDS):
+    """轮询导出目录，增量导入新的快照，有数据写入时刷新报告输出
+    
+    once 为True时处理完当前目录中已有的文件后返回；发现后超过 max_wait 秒仍在变化的文件不再等待。
+    """
+    ledger = load_ledger(ledger_path)
+    pending = {}
+    attempted = set()
+    print(f"开始监视 {directory}，已记录 {len(ledger['files'])} 个处理过的文件")
+    while True:
+        ready = scan_exports(directory, ledger, pending, settle_seconds)
+        if ready:
+            imported = False
+            conn = CountingConnection(pool.get_connection())
+            cursor = conn.cursor()
+            try:
+                for path in ready:
+                    print(f"发现新的导出文件 {os.path.basename(path)}")
+                    imported = ingest_export(path, conn, cursor, ledger, batch_size=batch_size) or imported
+                    pending.pop(path, None)
+                    attempted.add(path)
+                    save_ledger(ledger, ledger_path)
+            except Error as e:
+                print(f"导入时出错: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+            
+            if imported:
+                start_time = time.perf_counter()
+                try:
+                    refresh_outputs(fanout=fanout)
+                except Exception as e:
+                    print(f"刷新报告时出错: {e}")
+                else:
+                    print(f"报告已刷新，耗时 {time.perf_counter() - start_time:.2f} 秒")
+            write_run_metrics()
+        
+        if once:
+            # 只运行一次时，导入失败的文件不再重试，一直在变化的文件等待 max_wait 秒后放弃
+            for path, observed in pending.items():
+                if path not in attempted and time.time() - observed['first_seen'] >= max_wait:
+                    print(f"警告: {os.path.basename(path)} 在 {max_wait:.0f} 秒内没有写入完成，本次不再等待")
+                    attempted.add(path)
+            if not set(pending) - attempted:
+                return
+        time.sleep(poll_seconds)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='监视导出目录，自动增量导入新的学生报读课程快照并刷新报告')
+    parser.add_argument('directory', nargs='?', default=EXPORT_DIR, help=f'导出文件所在目录 (默认: {EXPORT_DIR})')
+    parser.add_argument('--url', default=os.environ.get(DATABASE_URL_ENV),
+                        help='嵌入式数据库地址，例如 sqlite:///student_management.db (默认: 连接MySQL)')
+    parser.add_argument('--host', default='localhost', help='MySQL主机地址 (默认: localhost)')
+    parser.add_argument('--port', type=int, default=3306, help='MySQL端口 (默认: 3306)')
+    parser.add_argument('--user', default='root', help='MySQL用户名 (默认: root)')
+    parser.add_argument('--database', default='student_management', help='数据库名 (默认: student_management)')
+    parser.add_argument('--layout', choices=LAYOUTS, default=database_layout(),
+                        help='存储布局，normalized 拆分为学员/课程班级/报读记录三张表 (默认: 沿用数据库现有布局)')
+    parser.add_argument('--ledger', default=LEDGER_FILE, help=f'已处理文件的记录 (默认: {LEDGER_FILE})')
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help=f'扫描间隔秒数 (默认: {POLL_SECONDS})')
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help=f'文件保持不变多少秒后才导入 (默认: {SETTLE_SECONDS})')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数 (默认: 1000)')
+    parser.add_argument('--fanout', action='store_true', help='刷新时同时重新生成分组报告')
+    parser.add_argument('--once', action='store_true', help='处理完目录中现有的文件后退出')
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT_SECONDS,
+                        help=f'--once 时等待文件写入完成的最长秒数 (默认: {MAX_WAIT_SECONDS})')
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.directory):
+        print(f"错误: 找不到导出目录 {args.directory}")
+        return
+    
+    if args.url:
+        password = None
+    else:
+        # 监视进程无人值守运行，密码优先从环境变量读取
+        password = os.environ.get('MYSQL_PWD') or getpass.getpass("请输入MySQL密码: ")
+    
+    # 刷新报告时 advanced_analytics 和分组报告的工作进程按 STUDENT_DB_URL 读取刚写入的同一个数据库，
+    # 不使用其中默认的 DB_CONFIG
+    os.environ[DATABASE_URL_ENV] = args.url or mysql_url(args.host, args.port, args.user, password, args.database)
+    
+    pool, _ = create_pool(args.url, 1, mode='delta', host=args.host, port=args.port, user=args.user,
+                          password=password, database=args.database, layout=args.layout)
+    if pool is None:
+        return
+    
+    try:
+        watch(args.directory, pool, ledger_path=args.ledger, poll_seconds=args.poll, settle_seconds=args.settle,
+              batch_size=args.batch_size, fanout=args.fanout, once=args.once, max_wait=args.max_wait)
+    except KeyboardInterrupt:
+        print("\n已停止监视导出目录")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+import argparse
+import asyncio
+import getpass
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+from batch_import import create_pool
+from direct_mysql_import import (
+    campus_prefixes,
+    clean_frame,
+    delta_import,
+    import_chunk,
+    parse_snapshot_time,
+    process_csv_file,
+    resolve_import_mode,
+)
+from pipeline_metrics import CountingConnection, write_run_metrics
+from storage_backend import DATABASE_URL_ENV, LAYOUTS, database_layout
+
+# 服务支持的导入模式；delta 需要完整快照，其余模式分块流式写入
+SERVICE_MODES = ('row', 'batch', 'infile', 'delta')
+
+# 上传文件的临时目录，任务完成后删除
+UPLOAD_DIR = os.path.join('.cache', 'uploads')
+
+# 读取上传内容的块大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# 队列已满时建议客户端重试的间隔（秒）
+RETRY_AFTER_SECONDS = 5
+
+# 任务状态中展示的无法解析单元格示例数
+REJECTION_SAMPLES = 20
+
+# 任务结束后在内存中保留的任务数，超出后丢弃最早结束的任务
+MAX_FINISHED_JOBS = 500
+
+class IngestService:
+    """接收导出CSV上传的本地导入服务
+    
+    上传内容异步写入临时文件后进入有界队列，由工作线程分块清洗并通过连接池写入数据库。
+    写入按数据块申请写入槽，大文件不会长时间独占数据库连接，其他校区的上传可以穿插写入。
+    """
+    
+    def __init__(self, pool, writers=4, workers=4, queue_size=8, mode='batch', batch_size=1000,
+                 chunksize=10000, upload_dir=UPLOAD_DIR, max_upload_bytes=None):
+        self.pool = pool
+        self.workers = workers
+        self.queue_size = queue_size
+        self.mode = mode
+        self.batch_size = batch_size
+        self.chunksize = chunksize
+        self.upload_dir = upload_dir
+        self.max_upload_bytes = max_upload_bytes
+        self.jobs = {}
+        self._queue = None
+        self._reserved = 0
+        self._running = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest-worker')
+        # 同时写入数据库的数据块数量不超过连接池大小
+        self._write_slots = threading.BoundedSemaphore(writers)
+        self._campus_locks = {}
+        self._campus_locks_guard = threading.Lock()
+    
+    def _new_job(self, filename, mode):
+        """创建任务记录"""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'file': filename,
+            'mode': mode,
+            'state': 'uploading',
+            'campuses': set(),
+            'bytes': 0,
+            'estimated_rows': 0,
+            'rows': 0,
+            'inserted': 0,
+            'updated': 0,
+            'removed': 0,
+            'failed': 0,
+            'error': None,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'finished_at': None,
+            'path': os.path.join(self.upload_dir, job_id, os.path.basename(filename)),
+            'metrics': {
+                'upload_seconds': 0.0,
+                'queue_seconds': 0.0,
+                'parse_seconds': 0.0,
+                'write_seconds': 0.0,
+                'total_seconds': 0.0,
+                'rows_per_sec': None,
+                'db_round_trips': 0
+            },
+            '_created': time.perf_counter(),
+            '_queued': None,
+            '_rejections': []
+        }
+        self.jobs[job_id] = job
+        return job
+    
+    def job_status(self, job):
+        """返回可序列化的任务状态"""
+        status = {key: value for key, value in job.items() if not key.startswith('_') and key != 'path'}
+        status['campuses'] = sorted(prefix for prefix in job['campuses'] if prefix)
+        status['metrics'] = dict(job['metrics'])
+        status['rejected_cells'] = len(job['_rejections'])
+        status['rejection_samples'] = job['_rejections'][:REJECTION_SAMPLES]
+        if job['state'] == 'done':
+            status['progress'] = 1.0
+        elif job['estimated_rows']:
+            status['progress'] = round(min(job['rows'] / job['estimated_rows'], 0.99), 3)
+        else:
+            status['progress'] = 0.0
+        return status
+    
+    def service_metrics(self):
+        """汇总所有任务的服务级指标"""
+        states = {}
+        for job in self.jobs.values():
+            states[job['state']] = states.get(job['state'], 0) + 1
+        finished = [job for job in self.jobs.values() if job['state'] == 'done']
+        write_seconds = sum(job['metrics']['write_seconds'] for job in finished)
+        rows = sum(job['rows'] for job in finished)
+        return {
+            'jobs': states,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'queue_size': self.queue_size,
+            'running': self._running,
+            'workers': self.workers,
+            'rows': rows,
+            'inserted': sum(job['inserted'] for job in finished),
+            'updated': sum(job['updated'] for job in finished),
+            'removed': sum(job['removed'] for job in finished),
+            'failed': sum(job['failed'] for job in finished),
+            'bytes': sum(job['bytes'] for job in finished),
+            'db_round_trips': sum(job['metrics']['db_round_trips'] for job in self.jobs.values()),
+            'rejected_cells': sum(len(job['_rejections']) for job in self.jobs.values()),
+            'write_rows_per_sec': round(rows / write_seconds, 1) if write_seconds > 0 else None
+        }
+    
+    def _forget_finished_jobs(self):
+        """只保留最近结束的任务，避免长时间运行时任务记录无限增长"""
+        finished = [job for job in self.jobs.values() if job['finished_at']]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job['id']]
+    
+    async def serve(self, host='127.0.0.1', port=8765):
+        """启动HTTP服务和工作协程，直到被中断"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"导入服务已启动: http://{host}:{port}  (工作线程 {self.workers}，队列长度 {self.queue_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+    
+    async def _worker(self):
+        """从队列取出任务，在线程池中执行，事件循环只负责收发数据"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            self._reserved -= 1
+            self._running += 1
+            try:
+                await loop.run_in_executor(self._executor, self._run_job, job)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+                self._forget_finished_jobs()
+    
+    def _run_job(self, job):
+        """执行一个导入任务（在工作线程中运行）"""
+        job['state'] = 'running'
+        job['metrics']['queue_seconds'] = round(time.perf_counter() - job['_queued'], 4)
+        try:
+            if job['mode'] == 'delta':
+                self._run_delta_job(job)
+            else:
+                self._run_stream_job(job)
+            job['state'] = 'done'
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+            print(f"导入任务 {job['id']} ({job['file']}) 失败: {e}")
+        finally:
+            metrics = job['metrics']
+            metrics['total_seconds'] = round(time.perf_counter() - job['_created'], 4)
+            for key in ('parse_seconds', 'write_seconds'):
+                metrics[key] = round(metrics[key], 4)
+            if metrics['write_seconds'] > 0:
+                metrics['rows_per_sec'] = round(job['rows'] / metrics['write_seconds'], 1)
+            job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            shutil.rmtree(os.path.dirname(job['path']), ignore_errors=True)
+    
+    def _connection(self, job):
+        """从连接池取出连接，往返次数同时计入任务指标"""
+        return CountingConnection(self.pool.get_connection(), job['metrics'])
+    
+    def _run_stream_job(self, job):
+        """分块读取、清洗并写入，每块写入后更新进度"""
+        import_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        mode = job['mode']
+        # 所有列按字符串读取，避免不同数据块推断出不同的类型
+        reader = pd.read_csv(job['path'], encoding='utf-8', dtype=str, chunksize=self.chunksize)
+        for chunk in reader:
+            start_time = time.perf_counter()
+            df = clean_frame(chunk, job['_rejections'])
+            # 整体替换集合，查询状态的线程不会遇到迭代中被修改的集合
+            job['campuses'] = job['campuses'] | set(campus_prefixes(df))
+            job['metrics']['parse_seconds'] += time.perf_counter() - start_time
+            
+            # 每块单独申请写入槽，块与块之间让出连接给其他任务
+            with self._write_slots:
+                start_time = time.perf_counter()
+                conn = self._connection(job)
+                cursor = conn.cursor()
+                try:
+                    mode = resolve_import_mode(conn, cursor, mode)
+                    job['mode'] = mode
+                    inserted, failed = import_chunk(df, conn, cursor, import_time, batch_size=self.batch_size,
+                                                    mode=mode, offset=job['rows'])
+                finally:
+                    cursor.close()
+                    conn.close()
+                job['metrics']['write_seconds'] += time.perf_counter() - start_time
+            
+            job['rows'] += len(df)
+            job['inserted'] += inserted
+            job['failed'] += failed
+    
+    def _campus_lock_list(self, prefixes):
+        """按前缀排序返回校区锁，同一校区的增量导入串行执行"""
+        with self._campus_locks_guard:
+            return [self._campus_locks.setdefault(prefix, threading.Lock()) for prefix in sorted(prefixes)]
+    
+    def _run_delta_job(self, job):
+        """增量导入需要完整快照，整个文件在一个写入槽内完成"""
+        start_time = time.perf_counter()
+        df = process_csv_file(job['path'], job['_rejections'])
+        job['metrics']['parse_seconds'] += time.perf_counter() - start_time
+        if df is None:
+            raise ValueError("解析CSV文件失败")
+        prefixes = campus_prefixes(df)
+        job['campuses'] = set(prefixes)
+        
+        locks = self._campus_lock_list(prefixes)
+        for lock in locks:
+            lock.acquire()
+        try:
+            with self._write_slots:
+                start_time = time.perf_counter()
+                conn = self._connection(job)
+                cursor = conn.cursor()
+                try:
+                    counts = delta_import(df, conn, cursor, parse_snapshot_time(job['path']),
+                                          batch_size=self.batch_size, scope_prefixes=prefixes)
+                finally:
+                    cursor.close()
+                    conn.close()
+                job['metrics']['write_seconds'] += time.perf_counter() - start_time
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        if counts is None:
+            raise ValueError("增量导入失败")
+        job['rows'] = len(df)
+        # 整个快照在一个事务中提交，成功时没有写入失败的记录
+        job['inserted'] = counts['inserted']
+        job['updated'] = counts['updated']
+        job['removed'] = counts['removed']
+    
+    async def _handle_connection(self, reader, writer):
+        """处理一个HTTP请求（每个连接一个请求）"""
+        extra_headers = {}
+        try:
+            # 请求行按UTF-8解码，查询参数中未经百分号编码的中文文件名不会乱码；无法解码时返回400
+            request_line = (await reader.readline()).decode('utf-8').strip()
+            method, target, _ = request_line.split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            status, body, extra_headers = await self._route(method.upper(), url.path.rstrip('/'),
+                                                            parse_qs(url.query), headers, reader, writer)
+        except ValueError as e:
+            status, body = HTTPStatus.BAD_REQUEST, {'error': f"请求格式错误: {e}"}
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            status, body = HTTPStatus.BAD_REQUEST, {'error': f"上传中断: {e}"}
+        
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+        head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                'Content-Type: application/json; charset=utf-8',
+                f"Content-Length: {len(payload)}",
+                'Connection: close']
+        head.extend(f"{name}: {value}" for name, value in extra_headers.items())
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    
+    async def _route(self, method, path, query, headers, reader, writer):
+        """按路径分发请求，返回 (状态码, 响应内容, 附加响应头)"""
+        if method == 'POST' and path == '/imports':
+            return await self._accept_upload(query, headers, reader, writer)
+        if method == 'GET' and path == '/imports':
+            return HTTPStatus.OK, [self.job_status(job) for job in self.jobs.values()], {}
+        if method == 'GET' and path.startswith('/imports/'):
+            job = self.jobs.get(path.rsplit('/', 1)[-1])
+            if job is None:
+                return HTTPStatus.NOT_FOUND, {'error': '任务不存在'}, {}
+            return HTTPStatus.OK, self.job_status(job), {}
+        if method == 'GET' and path == '/metrics':
+            return HTTPStatus.OK, self.service_metrics(), {}
+        if method == 'GET' and path in ('', '/health'):
+            return HTTPStatus.OK, {'status': 'ok', 'queued': self._queue.qsize(), 'running': self._running}, {}
+        return HTTPStatus.NOT_FOUND, {'error': f"未知的请求: {method} {path}"}, {}
+    
+    def _check_upload(self, query, headers):
+        """检查上传请求，可以接收时返回None，否则返回拒绝的响应"""
+        mode = query.get('mode', [self.mode])[0]
+        if mode not in SERVICE_MODES:
+            return HTTPStatus.BAD_REQUEST, {'error': f"未知的导入模式: {mode}，可选: {', '.join(SERVICE_MODES)}"}, {}
+        if mode == 'infile' and self.mode != 'infile':
+            # 只有以 infile 模式启动时，MySQL连接池才允许 LOAD DATA LOCAL INFILE
+            return HTTPStatus.BAD_REQUEST, {'error': "服务未以 infile 模式启动，不支持 infile 导入"}, {}
+        if 'content-length' not in headers:
+            return HTTPStatus.LENGTH_REQUIRED, {'error': '需要 Content-Length 请求头'}, {}
+        length = int(headers['content-length'])
+        if self.max_upload_bytes and length > self.max_upload_bytes:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f"上传文件超过 {self.max_upload_bytes} 字节"}, {}
+        
+        # 正在上传和排队的任务总数不超过队列长度，超出时返回503，而不是无限缓存上传内容
+        if self._reserved >= self.queue_size:
+            return (HTTPStatus.SERVICE_UNAVAILABLE, {'error': '导入队列已满，请稍后重试'},
+                    {'Retry-After': str(RETRY_AFTER_SECONDS)})
+        return None
+    
+    async def _accept_upload(self, query, headers, reader, writer):
+        """接收上传的导出文件并加入队列；队列已满时直接拒绝，由客户端稍后重试"""
+        expects_continue = headers.get('expect', '').lower() == '100-continue'
+        rejection = self._check_upload(query, headers)
+        if rejection is not None:
+            # 客户端已在等待 100 Continue 时不会发送内容；否则读完并丢弃内容，客户端才能收到响应
+            if not expects_continue and headers.get('content-length', '').isdigit():
+                await self._discard_body(reader, int(headers['content-length']))
+            return rejection
+        
+        self._reserved += 1
+        if expects_continue:
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+        
+        filename = os.path.basename(query.get('filename', ['upload.csv'])[0]) or 'upload.csv'
+        mode = query.get('mode', [self.mode])[0]
+        length = int(headers['content-length'])
+        job = self._new_job(filename, mode)
+        try:
+            await self._receive_upload(reader, length, job)
+        except BaseException:
+            self._reserved -= 1
+            job['state'] = 'failed'
+            job['error'] = '上传中断'
+            job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            shutil.rmtree(os.path.dirname(job['path']), ignore_errors=True)
+            raise
+        
+        job['state'] = 'queued'
+        job['_queued'] = time.perf_counter()
+        self._queue.put_nowait(job)
+        return HTTPStatus.ACCEPTED, self.job_status(job), {'Location': f"/imports/{job['id']}"}
+    
+    async def _discard_body(self, reader, length):
+        """读取并丢弃被拒绝的上传内容"""
+        remaining = length
+        while remaining > 0:
+            chunk = await reader.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+    
+    async def _receive_upload(self, reader, length, job):
+        """分块读取上传内容写入临时文件，同时按换行数估算行数用于进度显示"""
+        start_time = time.perf_counter()
+        os.makedirs(os.path.dirname(job['path']), exist_ok=True)
+        newlines = 0
+        remaining = length
+        with open(job['path'], 'wb') as f:
+            while remaining > 0:
+                chunk = await reader.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ConnectionError(f"还有 {remaining} 字节未收到")
+                f.write(chunk)
+                remaining -= len(chunk)
+                newlines += chunk.count(b'\n')
+                job['bytes'] += len(chunk)
+        # 第一行为表头
+        job['estimated_rows'] = max(newlines - 1, 0)
+        job['metrics']['upload_seconds'] = round(time.perf_counter() - start_time, 4)
+
+def main():
+    parser = argparse.ArgumentParser(description='学生报读课程导出文件的本地导入服务')
+    parser.add_argument('--listen', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--http-port', type=int, default=8765, help='监听端口 (默认: 8765)')
+    parser.add_argument('--url', default=os.environ.get(DATABASE_URL_ENV),
+                        help='嵌入式数据库地址，例如 sqlite:///student_management.db (默认: 连接MySQL)')
+    parser.add_argument('--host', default='localhost', help='MySQL主机地址 (默认: localhost)')
+    parser.add_argument('--port', type=int, default=3306, help='MySQL端口 (默认: 3306)')
+    parser.add_argument('--user', default='root', help='MySQL用户名 (默认: root)')
+    parser.add_argument('--database', default='student_management', help='数据库名 (默认: student_management)')
+    parser.add_argument('--layout', choices=LAYOUTS, default=database_layout(),
+                        help='存储布局，normalized 拆分为学员/课程班级/报读记录三张表 (默认: 沿用数据库现有布局)')
+    parser.add_argument('--mode', choices=SERVICE_MODES, default='batch', help='默认导入模式 (默认: batch)')
+    parser.add_argument('--workers', type=int, default=4, help='同时处理的任务数 (默认: 4)')
+    parser.add_argument('--writers', type=int, default=4, help='并行写入的数据库连接数 (默认: 4)')
+    parser.add_argument('--queue-size', type=int, default=8, help='等待处理的任务上限 (默认: 8)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的行数 (默认: 1000)')
+    parser.add_argument('--chunksize', type=int, default=10000, help='每个数据块的行数 (默认: 10000)')
+    parser.add_argument('--max-upload-mb', type=int, default=512, help='单个上传文件的大小上限 (默认: 512MB)')
+    args = parser.parse_args()
+    
+    if args.url:
+        password = None
+    else:
+        # 服务无人值守运行，密码优先从环境变量读取
+        password = os.environ.get('MYSQL_PWD') or getpass.getpass("请输入MySQL密码: ")
+    
+    pool, writers = create_pool(args.url, args.writers, mode=args.mode, host=args.host, port=args.port,
+                                user=args.user, password=password, database=args.database,
+                                layout=args.layout)
+    if pool is None:
+        return
+    
+    service = IngestService(pool, writers=writers, workers=max(1, args.workers), queue_size=max(1, args.queue_size),
+                            mode=args.mode, batch_size=args.batch_size, chunksize=args.chunksize,
+                            max_upload_bytes=args.max_upload_mb * 1024 * 1024)
+    try:
+        asyncio.run(service.serve(args.listen, args.http_port))
+    except KeyboardInterrupt:
+        print("\n导入服务已停止")
+    finally:
+        write_run_metrics()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+import argparse
+import csv
+import os
+import re
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+# CRS名单数据，每行一个合作办学机构或项目
+CATALOG_CSV = '中外合作办学机构数据.csv'
+
+# 国际生招生相关的CSV，按学校名称合并到同一条记录
+RECOMMENDED_CSV = '中外合作办学_国际高中生推荐院校.csv'
+SCORE_REQUIREMENT_CSV = '中外合作办学_国际高中生申请成绩要求.csv'
+FOUR_PLUS_ZERO_CSV = '中外合作办学项目4+0国际生自主招生要求.csv'
+ADMISSION_SUMMARY_CSV = '中外合作办学招生要求汇总.csv'
+
+# 认可的成绩类型
+CREDENTIALS = ('SAT', 'ACT', 'AP', 'IB', 'A-level')
+
+# 有分数线的考试，查询时按"申请人成绩 >= 学校最低要求"筛选
+SCORED_TESTS = ('SAT', 'IB', 'A-level', '雅思', '托福')
+
+# 表示不接受/不要求该成绩的取值
+NOT_ACCEPTED_VALUES = ('', '不作要求', '不要求', '否', '无')
+
+# A-level 等级按 UCAS Tariff 折算，"至少BBB" 即 40*3 = 120 分
+ALEVEL_POINTS = {'A*': 56, 'A': 48, 'B': 40, 'C': 32, 'D': 24, 'E': 16}
+ALEVEL_GRADES_PATTERN = re.compile(r'(?:A\*|[A-E]){2,4}')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+# 建立倒排索引的字段
+INDEXED_FIELDS = ('地区', '类型', '标记', '成绩类型', '外方院校', '学制模式')
+
+# 同一学校在不同数据源中的简称 -> 统一名称
+NAME_ALIASES = {
+    '北京师范-香港浸会联合国际学院': '北京师范大学-香港浸会大学联合国际学院'
+}
+
+# 名称后附带的英文名，例如 西交利物浦大学（Xi’an Jiaotong-Liverpool University）
+ENGLISH_NAME_PATTERN = re.compile(r'^(.*?)\s*\(([^()]*[A-Za-z][^()]*)\)\s*$')
+
+def normalize_text(text):
+    """统一全角/半角字符和大小写，用于名称比较"""
+    return unicodedata.normalize('NFKC', str(text or '')).strip().lower()
+
+def split_name(name):
+    """拆分中文名称和括号中的英文名称"""
+    normalized = unicodedata.normalize('NFKC', str(name or '')).strip()
+    match = ENGLISH_NAME_PATTERN.match(normalized)
+    if match and match.group(1):
+        return match.group(1).strip(), match.group(2).strip()
+    return normalized, ''
+
+def alevel_points(grades):
+    """将 A-level 等级组合（如 AAB、A*AA）折算为 UCAS Tariff 分数"""
+    points = 0
+    for grade in re.findall(r'A\*|[A-E]', grades):
+        points += ALEVEL_POINTS[grade]
+    return points
+
+def parse_threshold(text, test=None):
+    """将 "7.5+"、"6.5分以上"、"至少BBB"、"30-36" 等要求解析为最低分数；没有具体分数线时返回None"""
+    text = unicodedata.normalize('NFKC', str(text or '')).strip()
+    if not text or text in NOT_ACCEPTED_VALUES:
+        return None
+    
+    if test == 'A-level':
+        # 区间（如 AAB-BBC）无论先写哪一端，都取折算分数最低的一个
+        matches = ALEVEL_GRADES_PATTERN.findall(text.upper())
+        return float(min(alevel_points(grades) for grades in matches)) if matches else None
+    
+    match = NUMBER_PATTERN.search(text)
+    return float(match.group(0)) if match else None
+
+def is_accepted(text):
+    """判断某项成绩要求的取值是否表示接受该成绩"""
+    return normalize_text(text) not in NOT_ACCEPTED_VALUES
+
+def split_values(text, separator='/'):
+    """拆分 "SAT/ACT/AP/IB" 这类多值字段"""
+    return [value.strip() for value in str(text or '').split(separator) if value.strip()]
+
+def read_csv_rows(path):
+    """读取CSV为字典列表，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [{key.strip(): (value or '').strip() for key, value in row.items() if key} for row in csv.DictReader(f)]
+
+def name_bigrams(text):
+    """名称的字符二元组，用于模糊搜索"""
+    text = re.sub(r'[\s\-\(\)（）·,，]', '', normalize_text(text))
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+class InstitutionCatalog:
+    """进程内的中外合作办学目录：一次加载，建立倒排索引后在内存中查询"""
+    
+    def __init__(self, data_dir='.'):
+        self.data_dir = data_dir
+        self.records = []
+        self._by_name = {}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self._scores = {}
+        self._name_keys = []
+        self._bigrams = {}
+        self._fuzzy_keys = []
+        self._load()
+        self._build_indexes()
+    
+    def _path(self, filename):
+        return os.path.join(self.data_dir, filename)
+    
+    def _record_for(self, name):
+        """按中文名称找到已有记录，不存在时新建"""
+        chinese_name, english_name = split_name(name)
+        chinese_name = NAME_ALIASES.get(chinese_name, chinese_name)
+        key = normalize_text(chinese_name)
+        record_id = self._by_name.get(key)
+        if record_id is not None:
+            record = self.records[record_id]
+            if english_name and not record['英文名称']:
+                record['英文名称'] = english_name
+            return record
+        
+        record = {
+            'id': len(self.records),
+            '名称': chinese_name,
+            '英文名称': english_name,
+            '地区': '',
+            '类型': '',
+            '标记': [],
+            '链接': '',
+            '学制模式': '',
+            '成绩类型': set(),
+            '外方院校': set(),
+            '专业方向': '',
+            '官网': '',
+            '招生链接': [],
+            '申请途径': '',
+            '成绩要求': {},
+            '分数线': {}
+        }
+        self.records.append(record)
+        self._by_name[key] = record['id']
+        return record
+    
+    def _fill(self, record, field, value):
+        """只在字段为空时填入，先加载的数据源优先"""
+        if value and not record[field]:
+            record[field] = value
+    
+    def _load(self):
+        """加载CRS名单和各招生要求CSV，按学校名称合并"""
+        for row in read_csv_rows(self._path(CATALOG_CSV)):
+            record = self._record_for(row['名称'])
+            self._fill(record, '地区', row.get('地区'))
+            self._fill(record, '类型', row.get('类型'))
+            self._fill(record, '链接', row.get('链接'))
+            record['标记'] = split_values(row.get('标记'), ',')
+        
+        for row in read_csv_rows(self._path(RECOMMENDED_CSV)):
+            record = self._record_for(row['学校名称'])
+            self._fill(record, '地区', row.get('地区'))
+            self._fill(record, '学制模式', row.get('学制模式'))
+            self._fill(record, '专业方向', row.get('主要专业方向'))
+            self._fill(record, '官网', row.get('网址'))
+            record['成绩类型'].update(split_values(row.get('接受成绩类型')))
+            record['外方院校'].update(split_values(row.get('外方院校')))
+        
+        for row in read_csv_rows(self._path(SCORE_REQUIREMENT_CSV)):
+            record = self._record_for(row['学校名称'])
+            self._fill(record, '地区', row.get('地区'))
+            self._fill(record, '学制模式', row.get('学制模式'))
+            self._fill(record, '官网', row.get('官网'))
+            for test in ('SAT', 'IB', 'A-level', '雅思', '托福'):
+                self._add_requirement(record, test, row.get(test))
+        
+        for row in read_csv_rows(self._path(FOUR_PLUS_ZERO_CSV)):
+            record = self._record_for(row['学校名称'])
+            if row.get('4+0模式') == '是':
+                self._fill(record, '学制模式', '4+0')
+            self._fill(record, '专业方向', row.get('可申请专业'))
+            self._fill(record, '申请途径', row.get('申请途径'))
+            record['外方院校'].update(split_values(row.get('外方院校')))
+            for test in ('SAT', 'IB', 'A-level', '雅思', '托福'):
+                self._add_requirement(record, test, row.get(f'{test}要求'))
+        
+        for row in read_csv_rows(self._path(ADMISSION_SUMMARY_CSV)):
+            record = self._record_for(row['学校名称'])
+            self._fill(record, '官网', row.get('官网'))
+            for link in split_values(row.get('招生链接'), ';'):
+                if link not in record['招生链接']:
+                    record['招生链接'].append(link)
+    
+    def _add_requirement(self, record, test, value):
+        """记录一项成绩要求：接受的成绩计入成绩类型，有分数线的保留最高的一个"""
+        if not is_accepted(value):
+            return
+        record['成绩要求'].setdefault(test, value)
+        if test in CREDENTIALS:
+            record['成绩类型'].add(test)
+        threshold = parse_threshold(value, test)
+        if threshold is not None:
+            record['分数线'][test] = max(threshold, record['分数线'].get(test, threshold))
+    
+    def _build_indexes(self):
+        """建立倒排索引、分数线有序索引和名称索引"""
+        for record in self.records:
+            record_id = record['id']
+            for field in INDEXED_FIELDS:
+                value = record[field]
+                values = value if isinstance(value, (set, list)) else [value]
+                for item in values:
+                    if item:
+                        self.indexes[field].setdefault(normalize_text(item), set()).add(record_id)
+            
+            # 中文名和英文名分别建立名称索引，模糊搜索时各自计算相似度
+            for key in (record['名称'], record['英文名称']):
+                if key:
+                    self._name_keys.append((normalize_text(key), record_id))
+                    bigrams = name_bigrams(key)
+                    for bigram in bigrams:
+                        self._bigrams.setdefault(bigram, set()).add(len(self._fuzzy_keys))
+                    self._fuzzy_keys.append((record_id, len(bigrams)))
+        
+        # 每项考试按分数线排序，查询时二分定位满足条件的前缀
+        for test in SCORED_TESTS:
+            pairs = sorted((record['分数线'][test], record['id']) for record in self.records if test in record['分数线'])
+            self._scores[test] = ([threshold for threshold, _ in pairs], [record_id for _, record_id in pairs])
+        self._name_keys.sort()
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def lookup(self, field, value):
+        """返回某个索引字段取值对应的记录编号集合"""
+        return self.indexes[field].get(normalize_text(value), set())
+    
+    def eligible_by_score(self, test, score):
+        """返回最低分数线不高于申请人成绩的记录编号集合；没有该项分数线的记录不计入"""
+        thresholds, record_ids = self._scores[test]
+        return set(record_ids[:bisect_right(thresholds, score)])
+    
+    def query(self, region=None, type=None, mode=None, credentials=(), markers=(), partner=None,
+              scores=None, name_prefix=None, limit=None):
+        """按条件组合查询，各条件取交集，返回按编号排序的记录列表
+        
+        scores 为 {考试: 申请人成绩}，例如 {'雅思': 6.5, 'A-level': alevel_points('BBB')}。
+        """
+        candidates = []
+        if region:
+            candidates.append(self.lookup('地区', region))
+        if type:
+            candidates.append(self.lookup('类型', type))
+        if mode:
+            candidates.append(self.lookup('学制模式', mode))
+        if partner:
+            candidates.append(self.lookup('外方院校', partner))
+        for credential in credentials:
+            candidates.append(self.lookup('成绩类型', credential))
+        for marker in markers:
+            candidates.append(self.lookup('标记', marker))
+        for test, score in (scores or {}).items():
+            candidates.append(self.eligible_by_score(test, score))
+        if name_prefix:
+            candidates.append({record['id'] for record in self.prefix_search(name_prefix)})
+        
+        if candidates:
+            # 从最小的集合开始求交集
+            candidates.sort(key=len)
+            matched = candidates[0].intersection(*candidates[1:])
+        else:
+            matched = range(len(self.records))
+        record_ids = sorted(matched)
+        if limit is not None:
+            record_ids = record_ids[:limit]
+        return [self.records[record_id] for record_id in record_ids]
+    
+    def prefix_search(self, prefix, limit=None):
+        """按名称前缀（中文名或英文名）查找记录"""
+        key = normalize_text(prefix)
+        start = bisect_left(self._name_keys, (key,))
+        results = {}
+        for name_key, record_id in self._name_keys[start:]:
+            if not name_key.startswith(key):
+                break
+            results.setdefault(record_id, self.records[record_id])
+            if limit is not None and len(results) >= limit:
+                break
+        return sorted(results.values(), key=lambda record: record['id'])
+    
+    def fuzzy_search(self, text, limit=10, min_score=0.3):
+        """按名称字符二元组的重合度模糊查找，返回 (相似度, 记录) 列表"""
+        query_bigrams = name_bigrams(text)
+        if not query_bigrams:
+            return []
+        
+        overlaps = {}
+        for bigram in query_bigrams:
+            for key_index in self._bigrams.get(bigram, ()):
+                overlaps[key_index] = overlaps.get(key_index, 0) + 1
+        
+        best = {}
+        for key_index, overlap in overlaps.items():
+            record_id, bigram_count = self._fuzzy_keys[key_index]
+            # Dice 系数，名称越接近得分越高；中英文名称取较高的一个
+            score = 2 * overlap / (len(query_bigrams) + bigram_count)
+            if score >= min_score and score > best.get(record_id, 0):
+                best[record_id] = score
+        scored = [(round(score, 3), self.records[record_id]) for record_id, score in best.items()]
+        scored.sort(key=lambda item: (-item[0], item[1]['id']))
+        return scored[:limit]
+
+_catalog = None
+
+def load_catalog(data_dir='.'):
+    """返回进程内共享的目录实例，只在第一次调用时读取CSV"""
+    global _catalog
+    if _catalog is None or _catalog.data_dir != data_dir:
+        _catalog = InstitutionCatalog(data_dir)
+    return _catalog
+
+def format_record(record):
+    """单条记录的简要说明"""
+    parts = [record['名称'], record['地区'] or '-', record['类型'] or '-']
+    if record['学制模式']:
+        parts.append(record['学制模式'])
+    if record['成绩类型']:
+        parts.append('/'.join(sorted(record['成绩类型'])))
+    if record['分数线']:
+        parts.append(', '.join(f"{test}≥{threshold:g}" for test, threshold in record['分数线'].items()))
+    if record['标记']:
+        parts.append(''.join(record['标记']))
+    return ' | '.join(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description='中外合作办学目录查询')
+    parser.add_argument('--data-dir', default='.', help='CSV所在目录 (默认: 当前目录)')
+    parser.add_argument('--region', help='地区，例如 江苏')
+    parser.add_argument('--type', help='类型：合作办学机构 / 合作办学项目')
+    parser.add_argument('--mode', help='学制模式，例如 4+0')
+    parser.add_argument('--credential', action='append', default=[], help=f"接受的成绩类型，可重复 ({'/'.join(CREDENTIALS)})")
+    parser.add_argument('--marker', action='append', default=[], help='名单标记 ▲ / ● / ■，可重复')
+    parser.add_argument('--partner', help='外方院校')
+    parser.add_argument('--ielts', type=float, help='申请人雅思成绩')
+    parser.add_argument('--toefl', type=float, help='申请人托福成绩')
+    parser.add_argument('--sat', type=float, help='申请人SAT成绩')
+    parser.add_argument('--ib', type=float, help='申请人IB总分')
+    parser.add_argument('--alevel', help='申请人A-level预估成绩，例如 AAB')
+    parser.add_argument('--name', help='名称前缀')
+    parser.add_argument('--search', help='模糊搜索名称')
+    parser.add_argument('--limit', type=int, default=20, help='最多显示的记录数 (默认: 20)')
+    args = parser.parse_args()
+    
+    start_time = time.perf_counter()
+    catalog = load_catalog(args.data_dir)
+    print(f"目录加载完成，共 {len(catalog)} 条记录，耗时 {(time.perf_counter() - start_time) * 1000:.1f} 毫秒")
+    
+    if args.search:
+        start_time = time.perf_counter()
+        matches = catalog.fuzzy_search(args.search, limit=args.limit)
+        elapsed = (time.perf_counter() - start_time) * 1e6
+        print(f"\n模糊搜索 \"{args.search}\"：{len(matches)} 条，耗时 {elapsed:.0f} 微秒")
+        for score, record in matches:
+            print(f"  {score:.2f}  {format_record(record)}")
+        return
+    
+    scores = {}
+    for test, value in (('雅思', args.ielts), ('托福', args.toefl), ('SAT', args.sat), ('IB', args.ib)):
+        if value is not None:
+            scores[test] = value
+    if args.alevel:
+        scores['A-level'] = alevel_points(args.alevel.upper())
+    
+    conditions = dict(region=args.region, type=args.type, mode=args.mode, credentials=args.credential,
+                      markers=args.marker, partner=args.partner, scores=scores, name_prefix=args.name)
+    results = catalog.query(**conditions)
+    
+    # 重复执行取平均，单次查询耗时太短，直接计时误差较大
+    repeats = 1000
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        catalog.query(**conditions)
+    elapsed = (time.perf_counter() - start_time) / repeats * 1e6
+    
+    print(f"\n查询结果：{len(results)} 条，平均耗时 {elapsed:.1f} 微秒")
+    for record in results[:args.limit]:
+        print(f"  {format_record(record)}")
+    if len(results) > args.limit:
+        print(f"  ... 另有 {len(results) - args.limit} 条")
+
+if __name__ == "__main__":
+    main()
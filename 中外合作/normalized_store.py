@@ -0,0 +1,297 @@
+import pandas as pd
+from mysql.connector import Error
+from data_version import bump_data_version
+from storage_backend import backend_of, table_exists
+from student_schema import COLUMNS, DB_COLUMNS, DERIVED_COLUMNS, DERIVED_DB_COLUMNS, TRACKING_COLUMNS
+
+# 规范化布局的三张表：学员、课程班级和报读记录；student_courses 改为连接三张表的视图
+STUDENT_TABLE = 'students'
+COURSE_TABLE = 'course_classes'
+ENROLLMENT_TABLE = 'enrollments'
+WIDE_VIEW = 'student_courses'
+
+# 学员表：同一学号和姓名只保存一行，只包含不随报读记录变化的身份属性
+STUDENT_KEY = ['student_id', 'student_name']
+STUDENT_COLUMNS = STUDENT_KEY + ['phone_number', 'gender', 'birth_date']
+
+# 早期版本保存在学员表、现在随每条报读记录保存的列（跟进人、学管师等在同一学员的不同报读记录间可能不同）
+MOVED_STUDENT_COLUMNS = ['phone_relation', 'follow_up_person', 'tutor', 'wechat_status', 'card_status',
+                         'face_status', 'grade', 'school']
+
+# 课程班级表：课程名称和班级名称确定一个班级
+COURSE_KEY = ['course_name', 'class_name']
+COURSE_COLUMNS = COURSE_KEY + ['course_type']
+
+# 报读记录表保存每次报读的课时、费用、跟进人员等列和派生指标，通过代理键引用学员和班级
+ENROLLMENT_COLUMNS = [col for col in DB_COLUMNS if col not in STUDENT_COLUMNS and col not in COURSE_COLUMNS]
+ENROLLMENT_COLUMNS += DERIVED_DB_COLUMNS
+FOREIGN_KEYS = {'student_key': STUDENT_TABLE, 'course_class_key': COURSE_TABLE}
+
+# 报读记录表的二级索引
+ENROLLMENT_INDEXES = {
+    'idx_enrollments_student': 'student_key',
+    'idx_enrollments_course_class': 'course_class_key',
+    'idx_enrollments_import_date': 'import_date'
+}
+
+# 按代理键查询维度时每条 IN 语句包含的键数
+LOOKUP_BATCH_SIZE = 500
+
+# 各列的数据库类型
+SQL_TYPES = {db_name: sql_type for _, db_name, _, sql_type in COLUMNS}
+SQL_TYPES.update({db_name: sql_type for db_name, _, sql_type in DERIVED_COLUMNS})
+
+def storage_layout(conn, cursor):
+    """返回数据库当前使用的存储布局，存在报读记录表时为 normalized"""
+    return 'normalized' if table_exists(conn, cursor, ENROLLMENT_TABLE) else 'wide'
+
+def fact_table(layout):
+    """返回按 id 更新报读记录时使用的表"""
+    return ENROLLMENT_TABLE if layout == 'normalized' else WIDE_VIEW
+
+def _id_column(cursor, backend, table):
+    """各后端的自增主键定义"""
+    if backend == 'duckdb':
+        # DuckDB 没有自增列，使用序列生成id
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {table}_id_seq")
+        return f"id INTEGER PRIMARY KEY DEFAULT nextval('{table}_id_seq')"
+    if backend == 'sqlite':
+        return "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    return "id INT AUTO_INCREMENT PRIMARY KEY"
+
+def _key_definition(column, backend):
+    """维度表自然键列的定义；MySQL 默认排序规则不区分大小写，键列改用二进制排序规则"""
+    if backend == 'mysql':
+        return f"{column} {SQL_TYPES[column]} CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL"
+    return f"{column} {SQL_TYPES[column]} NOT NULL"
+
+def _create_table(cursor, table, definitions):
+    """按列和约束定义创建表（表已存在时不做修改）"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS {} (\n    {}\n)".format(table, ',\n    '.join(definitions)))
+
+def _create_dimension_table(cursor, backend, table, columns, key_columns):
+    """创建维度表，自然键上建唯一约束供批量 upsert 使用"""
+    definitions = [_id_column(cursor, backend, table)]
+    definitions += [_key_definition(col, backend) if col in key_columns else f"{col} {SQL_TYPES[col]}"
+                    for col in columns]
+    definitions.append(f"UNIQUE ({', '.join(key_columns)})")
+    _create_table(cursor, table, definitions)
+
+def create_normalized_tables(conn, cursor):
+    """创建学员、课程班级和报读记录表；已有宽表时迁移其中的记录，最后创建兼容视图"""
+    backend = backend_of(conn)
+    _create_dimension_table(cursor, backend, STUDENT_TABLE, STUDENT_COLUMNS, STUDENT_KEY)
+    _create_dimension_table(cursor, backend, COURSE_TABLE, COURSE_COLUMNS, COURSE_KEY)
+    
+    definitions = [_id_column(cursor, backend, ENROLLMENT_TABLE)]
+    definitions += [f"{col} INT NOT NULL" for col in FOREIGN_KEYS]
+    definitions += [f"{col} {SQL_TYPES[col]}" for col in ENROLLMENT_COLUMNS]
+    definitions += [f"{col} {definition}" for col, definition in TRACKING_COLUMNS.items()]
+    # DuckDB 的外键约束会阻止更新被引用的维度行，只在 MySQL 和 SQLite 上声明
+    if backend != 'duckdb':
+        definitions += [f"FOREIGN KEY ({col}) REFERENCES {table} (id)" for col, table in FOREIGN_KEYS.items()]
+    if backend == 'mysql':
+        definitions += [f"KEY {name} ({columns})" for name, columns in ENROLLMENT_INDEXES.items()]
+    _create_table(cursor, ENROLLMENT_TABLE, definitions)
+    
+    # 为旧版本创建的报读记录表补齐后来增加的列
+    cursor.execute(f"SELECT * FROM {ENROLLMENT_TABLE} LIMIT 0")
+    cursor.fetchall()
+    existing_columns = {column[0] for column in cursor.description}
+    for col in ENROLLMENT_COLUMNS:
+        if col not in existing_columns:
+            cursor.execute(f"ALTER TABLE {ENROLLMENT_TABLE} ADD COLUMN {col} {SQL_TYPES[col]}")
+    backfill_moved_columns(cursor, [col for col in MOVED_STUDENT_COLUMNS if col not in existing_columns])
+    
+    # DuckDB 依靠列存的区间统计过滤数据，二级索引只会拖慢写入
+    if backend == 'sqlite':
+        for name, columns in ENROLLMENT_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {ENROLLMENT_TABLE} ({columns})")
+    
+    if table_exists(conn, cursor, WIDE_VIEW):
+        migrate_wide_table(conn, cursor)
+    create_wide_view(conn, cursor)
+
+def backfill_moved_columns(cursor, columns):
+    """早期版本的报读记录表新增这些列后，先用学员表中保存的值填充
+    
+    学员表只保留了最后写入的值，同时清空行哈希，下一次增量导入会按导出文件重写每条仍在快照中的记录。
+    """
+    if not columns:
+        return
+    cursor.execute(f"SELECT * FROM {STUDENT_TABLE} LIMIT 0")
+    cursor.fetchall()
+    student_columns = {column[0] for column in cursor.description}
+    columns = [col for col in columns if col in student_columns]
+    if not columns:
+        return
+    assignments = ', '.join(f"{col} = (SELECT s.{col} FROM {STUDENT_TABLE} s "
+                            f"WHERE s.id = {ENROLLMENT_TABLE}.student_key)" for col in columns)
+    cursor.execute(f"UPDATE {ENROLLMENT_TABLE} SET {assignments}, row_hash = NULL")
+    bump_data_version(cursor)
+    print(f"已将学员表中的 {', '.join(columns)} 复制到 {ENROLLMENT_TABLE} 表")
+
+def create_wide_view(conn, cursor):
+    """创建与原 student_courses 表列名和顺序一致的视图，读取数据的查询无需修改"""
+    sources = {col: 's' for col in STUDENT_COLUMNS}
+    sources.update({col: 'c' for col in COURSE_COLUMNS})
+    select_columns = ['e.id'] + [f"{sources.get(col, 'e')}.{col}" for col in DB_COLUMNS + DERIVED_DB_COLUMNS]
+    select_columns += [f"e.{col}" for col in TRACKING_COLUMNS]
+    select_sql = (f"SELECT {', '.join(select_columns)} FROM {ENROLLMENT_TABLE} e "
+                  f"JOIN {STUDENT_TABLE} s ON s.id = e.student_key "
+                  f"JOIN {COURSE_TABLE} c ON c.id = e.course_class_key")
+    if backend_of(conn) == 'sqlite':
+        cursor.execute(f"DROP VIEW IF EXISTS {WIDE_VIEW}")
+        cursor.execute(f"CREATE VIEW {WIDE_VIEW} AS {select_sql}")
+    else:
+        cursor.execute(f"CREATE OR REPLACE VIEW {WIDE_VIEW} AS {select_sql}")
+
+def _advance_id_seed(conn, cursor, table):
+    """显式写入 id 后推进自增种子，之后新增的记录不会与已写入的 id 冲突
+    
+    MySQL 和 SQLite 写入更大的 id 时会自动推进自增值；DuckDB 的序列需要取号推进。
+    """
+    if backend_of(conn) != 'duckdb':
+        return
+    cursor.execute(f"SELECT MAX(id) FROM {table}")
+    max_id = cursor.fetchone()[0] or 0
+    cursor.execute(f"SELECT MAX(nextval('{table}_id_seq')) FROM range(%s)", (int(max_id),))
+    cursor.fetchall()
+
+def migrate_wide_table(conn, cursor, batch_size=10000):
+    """将旧的 student_courses 宽表按 id 顺序分批拆分写入三张表，行数核对一致后删除宽表
+    
+    报读记录沿用宽表中的 id，风险评分等按 id 引用报读记录的数据在迁移后仍然对应原来的记录。
+    """
+    cursor.execute(f"SELECT COUNT(*) FROM {WIDE_VIEW}")
+    total = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM {ENROLLMENT_TABLE}")
+    before = cursor.fetchone()[0]
+    
+    # 包含已标记删除的记录，保留完整的导入历史
+    columns = DB_COLUMNS + DERIVED_DB_COLUMNS + list(TRACKING_COLUMNS)
+    last_id = 0
+    while True:
+        cursor.execute(f"SELECT id, {', '.join(columns)} FROM {WIDE_VIEW} WHERE id > %s ORDER BY id LIMIT %s",
+                       (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        frame = pd.DataFrame(rows, columns=['id'] + columns)
+        frame[STUDENT_KEY + COURSE_KEY] = frame[STUDENT_KEY + COURSE_KEY].fillna('')
+        write_enrollments(conn, cursor, frame, batch_size)
+    _advance_id_seed(conn, cursor, ENROLLMENT_TABLE)
+    
+    cursor.execute(f"SELECT COUNT(*) FROM {ENROLLMENT_TABLE}")
+    migrated = cursor.fetchone()[0] - before
+    if migrated != total:
+        conn.rollback()
+        raise Error(msg=f"迁移后的报读记录数 {migrated} 与宽表记录数 {total} 不一致，已回滚")
+    
+    cursor.execute(f"DROP TABLE {WIDE_VIEW}")
+    bump_data_version(cursor)
+    conn.commit()
+    print(f"已将 {total} 条记录从宽表 {WIDE_VIEW} 迁移到 {STUDENT_TABLE}/{COURSE_TABLE}/{ENROLLMENT_TABLE}")
+
+def _frame_rows(frame):
+    """将DataFrame转换为由Python原生类型组成的行元组列表，缺失值转为None"""
+    columns = [frame[col].astype(object).where(frame[col].notna(), None).tolist() for col in frame.columns]
+    return list(zip(*columns))
+
+def _match_keys(conn, keys):
+    """用于在内存中比对自然键的值；MySQL 比较字符串时忽略末尾空格"""
+    keys = keys.astype(str)
+    if backend_of(conn) == 'mysql':
+        keys = keys.apply(lambda col: col.str.rstrip())
+    return keys
+
+def upsert_dimension(conn, cursor, table, frame, key_columns, batch_size=1000):
+    """批量写入维度行：自然键已存在时更新其余列，返回与 frame 各行对应的代理键"""
+    frame = frame.copy()
+    frame[key_columns] = frame[key_columns].fillna('').astype(str)
+    unique_rows = frame.drop_duplicates(key_columns, keep='last')
+    columns = list(unique_rows.columns)
+    backend = backend_of(conn)
+    
+    if backend == 'duckdb':
+        conn.upsert_frame(table, unique_rows, key_columns)
+    else:
+        placeholders = ', '.join(['%s'] * len(columns))
+        value_columns = [col for col in columns if col not in key_columns]
+        if backend == 'mysql':
+            assignments = ', '.join(f"{col} = VALUES({col})" for col in value_columns)
+            conflict = f"ON DUPLICATE KEY UPDATE {assignments}"
+        else:
+            assignments = ', '.join(f"{col} = excluded.{col}" for col in value_columns)
+            conflict = f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {assignments}"
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) {conflict}"
+        rows = _frame_rows(unique_rows)
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i:i + batch_size])
+    
+    # 按第一个键列分批查回代理键，再在内存中按完整的自然键对应
+    lookup_values = unique_rows[key_columns[0]].unique().tolist()
+    found = []
+    for i in range(0, len(lookup_values), LOOKUP_BATCH_SIZE):
+        chunk = lookup_values[i:i + LOOKUP_BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(f"SELECT id, {', '.join(key_columns)} FROM {table} WHERE {key_columns[0]} IN ({placeholders})",
+                       chunk)
+        found.extend(cursor.fetchall())
+    
+    stored = pd.DataFrame(found, columns=['id'] + key_columns)
+    stored[key_columns] = _match_keys(conn, stored[key_columns])
+    stored = stored.drop_duplicates(key_columns)
+    keys = _match_keys(conn, frame[key_columns]).merge(stored, on=key_columns, how='left')
+    if keys['id'].isna().any():
+        raise Error(msg=f"{table} 中找不到 {int(keys['id'].isna().sum())} 行的代理键")
+    return pd.Series(keys['id'].astype('int64').to_numpy(), index=frame.index)
+
+def resolve_keys(conn, cursor, frame, batch_size=1000):
+    """写入学员和课程班级维度，返回用代理键替换维度列后的报读记录"""
+    frame = frame.copy()
+    for col in STUDENT_KEY + COURSE_KEY:
+        if col not in frame.columns:
+            frame[col] = ''
+    
+    student_columns = [col for col in STUDENT_COLUMNS if col in frame.columns]
+    course_columns = [col for col in COURSE_COLUMNS if col in frame.columns]
+    keyed = frame.drop(columns=student_columns + course_columns)
+    keyed.insert(0, 'student_key', upsert_dimension(conn, cursor, STUDENT_TABLE, frame[student_columns],
+                                                    STUDENT_KEY, batch_size))
+    keyed.insert(1, 'course_class_key', upsert_dimension(conn, cursor, COURSE_TABLE, frame[course_columns],
+                                                         COURSE_KEY, batch_size))
+    return keyed
+
+def write_enrollments(conn, cursor, frame, batch_size=1000):
+    """将按数据库列名命名的宽表记录拆分写入三张表，返回写入的报读记录数；frame 包含 id 列时沿用这些 id"""
+    if len(frame) == 0:
+        return 0
+    keyed = resolve_keys(conn, cursor, frame, batch_size)
+    if backend_of(conn) == 'duckdb':
+        conn.insert_frame(ENROLLMENT_TABLE, keyed)
+    else:
+        placeholders = ', '.join(['%s'] * len(keyed.columns))
+        sql = f"INSERT INTO {ENROLLMENT_TABLE} ({', '.join(keyed.columns)}) VALUES ({placeholders})"
+        rows = _frame_rows(keyed)
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i:i + batch_size])
+    return len(keyed)
+
+def update_enrollments(conn, cursor, frame, batch_size=1000):
+    """按 id 更新报读记录，frame 中的学员和班级列先写入维度表再替换为代理键"""
+    if len(frame) == 0:
+        return 0
+    keyed = resolve_keys(conn, cursor, frame.drop(columns='id'), batch_size)
+    keyed['id'] = frame['id'].astype('int64')
+    update_columns = [col for col in keyed.columns if col != 'id']
+    if backend_of(conn) == 'duckdb':
+        conn.update_frame(ENROLLMENT_TABLE, keyed, 'id')
+    else:
+        assignments = ', '.join(f"{col} = %s" for col in update_columns)
+        sql = f"UPDATE {ENROLLMENT_TABLE} SET {assignments} WHERE id = %s"
+        rows = _frame_rows(keyed[update_columns + ['id']])
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i:i + batch_size])
+    return len(keyed)
@@ -0,0 +1,218 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 指标输出目录，可用环境变量覆盖
+METRICS_DIR = os.environ.get('PIPELINE_METRICS_DIR', 'metrics')
+
+# 设置为阶段名称时，为该阶段附加 cProfile 和 tracemalloc 分析结果
+PROFILE_STAGE_ENV = 'PIPELINE_PROFILE_STAGE'
+
+# 本次运行的指标
+_run = {
+    'run_id': datetime.now().strftime('%Y%m%d%H%M%S') + f"_{os.getpid()}",
+    'started_at': datetime.now().isoformat(timespec='seconds'),
+    'stages': [],
+    'db_round_trips': 0
+}
+_lock = threading.Lock()
+# 每个线程的阶段栈和数据库往返次数，阶段只统计本线程发出的往返
+_local = threading.local()
+
+def peak_rss_mb():
+    """返回进程的峰值常驻内存（MB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 单位为字节
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+def record_round_trip(count=1):
+    """记录数据库往返次数，同时计入本次运行的总数和当前线程的计数"""
+    _local.round_trips = getattr(_local, 'round_trips', 0) + count
+    with _lock:
+        _run['db_round_trips'] += count
+
+def result_rows(result, *args, **kwargs):
+    """以返回值的行数作为阶段处理的行数"""
+    return len(result) if hasattr(result, '__len__') else None
+
+def input_rows(result, *args, **kwargs):
+    """以第一个参数的行数作为阶段处理的行数"""
+    return len(args[0]) if args and hasattr(args[0], '__len__') else None
+
+class CountingCursor:
+    """统计 execute/executemany 次数的游标包装，counter 字典用于额外按任务累计"""
+    
+    def __init__(self, cursor, counter=None):
+        self._cursor = cursor
+        self._counter = counter
+    
+    def _count(self):
+        record_round_trip()
+        if self._counter is not None:
+            self._counter['db_round_trips'] = self._counter.get('db_round_trips', 0) + 1
+    
+    def execute(self, *args, **kwargs):
+        self._count()
+        return self._cursor.execute(*args, **kwargs)
+    
+    def executemany(self, *args, **kwargs):
+        self._count()
+        return self._cursor.executemany(*args, **kwargs)
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class CountingConnection:
+    """返回 CountingCursor 的连接包装，其余属性透传给原连接"""
+    
+    def __init__(self, conn, counter=None):
+        self._conn = conn
+        self._counter = counter
+    
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counter)
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def _write_profile(name, profiler, snapshot):
+    """保存单个阶段的 cProfile 和 tracemalloc 分析结果"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    prefix = os.path.join(METRICS_DIR, f"{_run['run_id']}_{name}")
+    profiler.dump_stats(prefix + '.prof')
+    with open(prefix + '.profile.txt', 'w', encoding='utf-8') as f:
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+    with open(prefix + '.tracemalloc.txt', 'w', encoding='utf-8') as f:
+        for stat in snapshot.statistics('lineno')[:40]:
+            f.write(f"{stat}\n")
+    print(f"阶段 {name} 的性能分析结果已保存到 {prefix}.*")
+
+@contextmanager
+def stage(name, rows=None):
+    """记录一个阶段的耗时、行数、吞吐量、峰值内存和数据库往返次数
+    
+    yield 出的字典可在阶段内补充 rows。数据库往返次数只包括执行阶段的线程发出的往返，
+    阶段内交给其他线程执行的查询不计入。
+    """
+    parents = getattr(_local, 'stack', [])
+    record = {'stage': name, 'parent': parents[-1] if parents else None, 'rows': rows}
+    _local.stack = parents + [name]
+    
+    profiling = os.environ.get(PROFILE_STAGE_ENV) == name
+    if profiling:
+        profiler = cProfile.Profile()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profiler.enable()
+    
+    round_trips_before = getattr(_local, 'round_trips', 0)
+    start_time = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - start_time
+        if profiling:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            _write_profile(name, profiler, snapshot)
+        
+        _local.stack = parents
+        record['seconds'] = round(elapsed, 4)
+        record['rows_per_sec'] = round(record['rows'] / elapsed, 1) if record['rows'] and elapsed > 0 else None
+        record['peak_rss_mb'] = peak_rss_mb()
+        record['db_round_trips'] = getattr(_local, 'round_trips', 0) - round_trips_before
+        with _lock:
+            _run['stages'].append(record)
+
+def instrument(name=None, rows=None):
+    """将函数记录为流水线阶段的装饰器，rows 为根据 (返回值, *参数) 计算行数的函数"""
+    def decorator(func):
+        stage_name = name or func.__name__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    try:
+                        record['rows'] = rows(result, *args, **kwargs)
+                    except Exception:
+                        record['rows'] = None
+                return result
+        return wrapper
+    return decorator
+
+def _stage_totals():
+    """按阶段名称汇总多次调用的指标"""
+    totals = {}
+    for record in _run['stages']:
+        total = totals.setdefault(record['stage'], {'calls': 0, 'seconds': 0.0, 'rows': 0,
+                                                    'db_round_trips': 0, 'peak_rss_mb': 0.0})
+        total['calls'] += 1
+        total['seconds'] += record['seconds']
+        total['rows'] += record['rows'] or 0
+        total['db_round_trips'] += record['db_round_trips']
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'] or 0)
+    return totals
+
+def _prometheus_text(totals):
+    """生成 Prometheus 文本格式的指标"""
+    metrics = [
+        ('pipeline_stage_seconds', '各阶段累计耗时（秒）', 'seconds'),
+        ('pipeline_stage_rows', '各阶段累计处理行数', 'rows'),
+        ('pipeline_stage_calls', '各阶段调用次数', 'calls'),
+        ('pipeline_stage_db_round_trips', '各阶段数据库往返次数', 'db_round_trips'),
+        ('pipeline_stage_peak_rss_mb', '阶段结束时进程峰值常驻内存（MB）', 'peak_rss_mb')
+    ]
+    lines = []
+    for metric, help_text, key in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for stage_name, total in totals.items():
+            lines.append(f'{metric}{{run="{_run["run_id"]}",stage="{stage_name}"}} {total[key]}')
+    lines.append("# HELP pipeline_db_round_trips_total 本次运行的数据库往返次数")
+    lines.append("# TYPE pipeline_db_round_trips_total counter")
+    lines.append(f'pipeline_db_round_trips_total{{run="{_run["run_id"]}"}} {_run["db_round_trips"]}')
+    return '\n'.join(lines) + '\n'
+
+def write_run_metrics(output_dir=None):
+    """将本次运行的指标写入JSON和Prometheus文本文件，返回JSON文件路径"""
+    output_dir = output_dir or METRICS_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    totals = _stage_totals()
+    report = {
+        **_run,
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'peak_rss_mb': peak_rss_mb(),
+        'totals': totals
+    }
+    
+    json_path = os.path.join(output_dir, f"run_{_run['run_id']}.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    with open(os.path.join(output_dir, f"run_{_run['run_id']}.prom"), 'w', encoding='utf-8') as f:
+        f.write(_prometheus_text(totals))
+    
+    print(f"运行指标已保存到 {json_path}")
+    return json_path
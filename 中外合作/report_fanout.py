@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from advanced_analytics import (_attendance_section, _course_section, _findings_section, clean_and_prepare_data,
+                                cluster_summary, course_stats_from_frame, load_data, student_clustering)
+from chart_renderer import PLOT_MODES, build_chart_inputs, render_charts
+from direct_mysql_import import campus_of
+from pipeline_metrics import instrument, write_run_metrics
+from report_sections import CACHE_DIR as SECTION_CACHE_DIR, compute_sections
+
+# 分组方式及其在报告中的名称；tutor 和 follow_up_person 为数据列，campus 由学员姓名的前缀得出
+GROUPINGS = {
+    'tutor': '学管师',
+    'follow_up_person': '跟进人',
+    'campus': '校区'
+}
+
+# 分组值缺失（或学员姓名没有校区前缀）时使用的分组名称
+MISSING_GROUP = '未分配'
+
+# 分组报告和图表用到的列，只有这些列写入共享的列式文件
+FANOUT_COLUMNS = ['student_name', 'class_name', 'course_name', 'course_type', 'gender', 'purchased_amount',
+                  'consumed_amount', 'remaining_amount', 'absent_count', 'course_completion_rate',
+                  'consumption_efficiency', 'attendance_group', 'cluster']
+
+# 共享列式文件的上级目录，每次运行在其中新建临时目录，运行结束后删除
+STORE_DIR = os.path.join('.cache', 'fanout')
+
+# 分组报告的输出目录，按 分组方式/分组名称 存放报告和图表
+OUTPUT_DIR = '分组报告'
+REPORT_NAME = '学生课程数据分析报告.md'
+INDEX_NAME = '索引.md'
+
+# 工作进程中以只读方式映射的列式文件，每个进程只打开一次
+_store = {}
+
+def group_values(df, grouping):
+    """返回每行所属的分组名称"""
+    values = campus_of(df['student_name']) if grouping == 'campus' else df[grouping].astype(object)
+    values = values.fillna('').astype(str).str.strip()
+    return values.mask(values == '', MISSING_GROUP)
+
+def safe_name(name):
+    """将分组名称转换为可用作目录名的字符串"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name).strip('.') or '_'
+
+@instrument()
+def write_store(df, store_dir, groups):
+    """将数据按列写入 .npy 文件，并为每种分组保存按分组排列的行号和各分组的起止位置
+    
+    数值列直接保存，文本和category列保存为编码和取值表；工作进程用内存映射只读打开这些文件，
+    只复制各自分组的行，不需要在每个进程中保留完整的数据集。返回写入的清单。
+    """
+    manifest = {'rows': len(df), 'columns': {}, 'groups': {}}
+    for col in FANOUT_COLUMNS:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.cat.codes.to_numpy()
+            info = {'kind': 'category', 'categories': series.cat.categories.tolist(),
+                    'ordered': bool(series.cat.ordered)}
+        elif pd.api.types.is_numeric_dtype(series):
+            values = series.to_numpy()
+            info = {'kind': 'numeric'}
+        else:
+            codes, uniques = pd.factorize(series)
+            values = codes.astype(np.int32)
+            info = {'kind': 'text', 'categories': uniques.tolist(), 'dtype': str(series.dtype)}
+        np.save(os.path.join(store_dir, f"{col}.npy"), values)
+        manifest['columns'][col] = info
+    
+    for grouping, values in groups.items():
+        codes, names = pd.factorize(values, sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        np.save(os.path.join(store_dir, f"group_{grouping}.npy"), order.astype(np.int64))
+        manifest['groups'][grouping] = [{'name': name, 'start': int(bounds[i]), 'stop': int(bounds[i + 1])}
+                                        for i, name in enumerate(names)]
+    
+    # 清单最后写入，工作进程看到清单时所有列都已写完
+    path = os.path.join(store_dir, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+def open_store(store_dir):
+    """以内存映射方式打开列式文件，返回 {'manifest': 清单, 'columns': {列名: 数组}, 'orders': {分组方式: 行号}}"""
+    with open(os.path.join(store_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return {
+        'manifest': manifest,
+        'columns': {col: np.load(os.path.join(store_dir, f"{col}.npy"), mmap_mode='r')
+                    for col in manifest['columns']},
+        'orders': {grouping: np.load(os.path.join(store_dir, f"group_{grouping}.npy"), mmap_mode='r')
+                   for grouping in manifest['groups']}
+    }
+
+def read_rows(store, positions):
+    """按行号取出一个分组的数据，category列只保留分组内出现的取值"""
+    data = {}
+    for col, info in store['manifest']['columns'].items():
+        values = np.asarray(store['columns'][col][positions])
+        if info['kind'] == 'numeric':
+            data[col] = values
+        elif info['kind'] == 'category':
+            data[col] = pd.Categorical.from_codes(values, info['categories'],
+                                                  ordered=info['ordered']).remove_unused_categories()
+        else:
+            data[col] = pd.Series(pd.Categorical.from_codes(values, info['categories'])).astype(info['dtype'])
+    return pd.DataFrame(data)
+
+def _init_worker(store_dir):
+    """工作进程启动时映射列式文件，并使用无界面的绘图后端"""
+    import matplotlib
+    matplotlib.use('Agg')
+    _store.update(open_store(store_dir))
+
+def _group_cluster_section(cluster_inputs):
+    """学生分群：分组内的学生在全体学生聚类中的分布"""
+    cluster_analysis = cluster_summary(cluster_inputs)
+    return cluster_analysis, """
+    ## 1. 学生分群分析
+    
+    按全体学生训练的聚类模型，该分组的学生分布在以下几个群体中：
+    
+    {}
+    """.format(cluster_analysis.to_string())
+
+def _group_findings_section(cluster_analysis, course_insights, attendance_analysis):
+    """关键发现：分组内没有学生数达到5人的课程时不给出课程相关的建议"""
+    if course_insights['popular_courses'].empty:
+        return None, """
+    ## 6. 关键发现和建议
+    
+    该分组内没有学生数达到5人的课程，样本较少，不给出课程相关的建议。
+    """
+    return _findings_section(cluster_analysis, course_insights, attendance_analysis)
+
+# 分组报告的各部分，与 advanced_analytics.REPORT_SECTIONS 相同，聚类使用全体学生的结果
+GROUP_SECTIONS = {
+    'clusters': {'title': '学生分群分析', 'deps': ['cluster_inputs'], 'compute': _group_cluster_section},
+    'courses': {'title': '课程排名', 'deps': ['course_stats'], 'compute': _course_section},
+    'attendance': {'title': '出勤模式分析', 'deps': ['attendance_inputs'], 'compute': _attendance_section},
+    'findings': {'title': '关键发现和建议', 'deps': ['clusters', 'courses', 'attendance'],
+                 'compute': _group_findings_section}
+}
+
+def build_group_report(grouping, name, start, stop, output_dir=OUTPUT_DIR, charts=True, plot_mode='auto',
+                       force=False):
+    """在工作进程中生成一个分组的报告和图表，返回 (行数, 耗时, 新绘制的图表数)"""
+    start_time = time.perf_counter()
+    df = read_rows(_store, _store['orders'][grouping][start:stop])
+    group_dir = os.path.join(output_dir, grouping, safe_name(name))
+    os.makedirs(group_dir, exist_ok=True)
+    
+    inputs = {
+        'cluster_inputs': df[['cluster', 'purchased_amount', 'consumed_amount', 'remaining_amount', 'absent_count',
+                              'course_completion_rate', 'student_name']],
+        'course_stats': course_stats_from_frame(df),
+        'attendance_inputs': df[['attendance_group', 'course_completion_rate', 'consumption_efficiency',
+                                 'student_name']]
+    }
+    cache_dir = os.path.join(SECTION_CACHE_DIR, 'groups', grouping, safe_name(name))
+    _, markdown, _ = compute_sections(GROUP_SECTIONS, inputs, cache_dir=cache_dir, force=force, verbose=False)
+    report = """
+    # 学生课程数据分析报告：{} {}
+    
+    共 {} 条报读记录，{} 名学生。
+    {}
+    """.format(GROUPINGS[grouping], name, len(df), df['student_name'].nunique(),
+               ''.join(markdown[section] for section in GROUP_SECTIONS))
+    with open(os.path.join(group_dir, REPORT_NAME), 'w', encoding='utf-8') as f:
+        f.write(report)
+    
+    rendered = 0
+    if charts:
+        # 已经在工作进程中，图表在本进程内依次绘制
+        summary = render_charts(build_chart_inputs(df, df, plot_mode=plot_mode), output_dir=group_dir,
+                                max_workers=1, force=force, verbose=False)
+        rendered = len(summary['rendered'])
+    return len(df), time.perf_counter() - start_time, rendered
+
+def write_index(results, output_dir=OUTPUT_DIR):
+    """写出所有分组报告的索引"""
+    lines = ['# 分组报告索引', '']
+    for grouping, label in GROUPINGS.items():
+        rows = sorted((result for result in results if result['grouping'] == grouping), key=lambda r: r['name'])
+        if not rows:
+            continue
+        lines += [f"## 按{label}", '', f"| {label} | 记录数 | 报告 | 状态 |", '| --- | ---: | --- | --- |']
+        lines += [f"| {result['name']} | {result['rows']} | "
+                  f"[{REPORT_NAME}]({grouping}/{safe_name(result['name'])}/{REPORT_NAME}) | {result['status']} |"
+                  for result in rows]
+        lines.append('')
+    path = os.path.join(output_dir, INDEX_NAME)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    return path
+
+@instrument()
+def run_fanout(groupings=tuple(GROUPINGS), output_dir=OUTPUT_DIR, workers=None, charts=True, plot_mode='auto',
+               min_rows=1, force=False):
+    """加载并清洗一次数据，写入共享的列式文件后由进程池并行生成各分组的报告和图表
+    
+    返回每个分组的结果列表；无法加载数据时返回None。
+    """
+    df = load_data()
+    if df.empty:
+        print("无法加载数据，请检查数据库连接")
+        return None
+    
+    # 聚类在全体数据上完成一次，各分组只汇总自己的学生
+    df_clustered, _ = student_clustering(clean_and_prepare_data(df))
+    groups = {grouping: group_values(df_clustered, grouping) for grouping in groupings}
+    
+    os.makedirs(STORE_DIR, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    store_dir = tempfile.mkdtemp(dir=STORE_DIR)
+    results = []
+    try:
+        manifest = write_store(df_clustered, store_dir, groups)
+        del df, df_clustered
+        tasks = [(grouping, group['name'], group['start'], group['stop'])
+                 for grouping in groupings for group in manifest['groups'][grouping]
+                 if group['stop'] - group['start'] >= min_rows]
+        # 行数多的分组先提交，避免最后只剩一个大分组在运行
+        tasks.sort(key=lambda task: task[3] - task[2], reverse=True)
+        print(f"共 {len(tasks)} 个分组，数据 {manifest['rows']} 行已写入共享列式文件 {store_dir}")
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store_dir,)) as executor:
+            futures = {executor.submit(build_group_report, *task, output_dir, charts, plot_mode, force): task
+                       for task in tasks}
+            for future in as_completed(futures):
+                grouping, name, start, stop = futures[future]
+                result = {'grouping': grouping, 'name': name, 'rows': stop - start, 'seconds': 0.0, 'charts': 0}
+                try:
+                    _, result['seconds'], result['charts'] = future.result()
+                    result['status'] = '成功'
+                except Exception as e:
+                    print(f"生成{GROUPINGS[grouping]} {name} 的报告时出错: {e}")
+                    result['status'] = f"失败: {e}"
+                results.append(result)
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+    
+    write_index(results, output_dir)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按学管师、跟进人和校区并行生成分组的分析报告和图表')
+    parser.add_argument('--groupings', nargs='+', choices=list(GROUPINGS), default=list(GROUPINGS),
+                        help='分组方式 (默认: 全部)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help=f'输出目录 (默认: {OUTPUT_DIR})')
+    parser.add_argument('--workers', type=int, default=None, help='并行的进程数 (默认: CPU核数)')
+    parser.add_argument('--min-rows', type=int, default=1, help='记录数少于该值的分组不生成报告 (默认: 1)')
+    parser.add_argument('--no-charts', action='store_true', help='只生成报告，不绘制图表')
+    parser.add_argument('--plot-mode', choices=PLOT_MODES, default='auto',
+                        help='散点图和箱线图的绘图模式 (默认: auto)')
+    parser.add_argument('--force', action='store_true', help='忽略缓存，重新计算所有报告和图表')
+    args = parser.parse_args(argv)
+    
+    start_time = time.perf_counter()
+    results = run_fanout(args.groupings, output_dir=args.output_dir, workers=args.workers,
+                         charts=not args.no_charts, plot_mode=args.plot_mode, min_rows=args.min_rows,
+                         force=args.force)
+    if results is not None:
+        failed = [result for result in results if result['status'] != '成功']
+        elapsed = time.perf_counter() - start_time
+        print(f"已生成 {len(results) - len(failed)} 个分组报告（失败 {len(failed)} 个），"
+              f"索引保存在 {os.path.join(args.output_dir, INDEX_NAME)}，耗时 {elapsed:.2f} 秒")
+    write_run_metrics()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pickle
+import time
+from chart_renderer import input_hash
+
+# 报告各部分的缓存目录，每个部分保存最近一次的输入哈希、结果和markdown文本
+CACHE_DIR = os.path.join('.cache', 'report_sections')
+
+# 计算状态在报告中的说明
+STATUS_LABELS = {'computed': '重新计算', 'reused': '复用（输入未变化）'}
+
+def _section_path(cache_dir, name):
+    """返回某个部分的缓存文件路径"""
+    return os.path.join(cache_dir, f"{name}.pkl")
+
+def _read_section(cache_dir, name, key):
+    """读取输入哈希一致的缓存结果，没有或已过期时返回None"""
+    path = _section_path(cache_dir, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return cached if cached.get('key') == key else None
+
+def _write_section(cache_dir, name, key, result, markdown):
+    """保存某个部分的结果，先写临时文件再替换，中断时不会留下损坏的缓存"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _section_path(cache_dir, name)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump({'key': key, 'result': result, 'markdown': markdown}, f)
+    os.replace(path + '.tmp', path)
+
+def section_key(name, spec, dep_hashes):
+    """由部分名称、版本和各依赖的哈希计算缓存键"""
+    parts = [name, str(spec.get('version', 1))] + [f"{dep}={dep_hashes[dep]}" for dep in spec['deps']]
+    return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+def compute_sections(sections, inputs, cache_dir=CACHE_DIR, force=False, verbose=True):
+    """按依赖顺序计算报告的各部分，依赖的哈希未变化的部分直接读取缓存
+    
+    sections 为按依赖顺序排列的 {名称: {'deps': [...], 'compute': 函数, 'version': 可选}}，deps 中的名称是
+    inputs 中的输入数据或排在前面的部分；compute 按 deps 的顺序接收各依赖的值，返回 (结果, markdown文本)。
+    部分的哈希取其markdown文本的哈希，上游重新计算但输出不变时下游仍然复用。
+    
+    verbose 为False时不输出复用和重新计算的部分，分组生成大量报告时使用。
+    返回 ({名称: 结果}, {名称: markdown}, {名称: {'status': 'computed'/'reused', 'seconds': 耗时}})。
+    """
+    hashes = {name: input_hash(value, {}) for name, value in inputs.items()}
+    values = dict(inputs)
+    markdown = {}
+    summary = {}
+    
+    for name, spec in sections.items():
+        start_time = time.perf_counter()
+        key = section_key(name, spec, hashes)
+        cached = None if force else _read_section(cache_dir, name, key)
+        if cached is not None:
+            result, text = cached['result'], cached['markdown']
+            status = 'reused'
+        else:
+            result, text = spec['compute'](*[values[dep] for dep in spec['deps']])
+            _write_section(cache_dir, name, key, result, text)
+            status = 'computed'
+        
+        values[name] = result
+        markdown[name] = text
+        hashes[name] = hashlib.md5(text.encode('utf-8')).hexdigest()
+        summary[name] = {'status': status, 'seconds': round(time.perf_counter() - start_time, 3)}
+    
+    reused = [name for name, info in summary.items() if info['status'] == 'reused']
+    computed = [name for name, info in summary.items() if info['status'] == 'computed']
+    if verbose and reused:
+        print(f"输入未变化，复用 {len(reused)} 个报告部分: {', '.join(reused)}")
+    if verbose and computed:
+        print(f"重新计算 {len(computed)} 个报告部分: {', '.join(computed)}")
+    return {name: values[name] for name in sections}, markdown, summary
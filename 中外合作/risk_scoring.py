@@ -0,0 +1,285 @@
+import argparse
+import bisect
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from mysql.connector import Error
+from pipeline_metrics import CountingConnection, input_rows, instrument, result_rows, write_run_metrics
+from storage_backend import DATABASE_URL_ENV, backend_of, connect
+from student_schema import COLUMNS
+
+# 风险评分表，学管师的看板直接读取，不需要运行分析；导入时在同一事务中写入新增和变化记录的评分，每日整表重新计算一次
+RISK_TABLE = 'student_risk_scores'
+
+# 各风险因素的权重，合计为1；评分 = 100 × Σ 权重 × 因素得分，各因素得分在0到1之间
+RISK_WEIGHTS = {
+    'absence': 0.30,
+    'completion': 0.20,
+    'remaining': 0.20,
+    'expiry': 0.30
+}
+
+# 各因素在看板中显示的说明，贡献最大的因素作为主要原因
+RISK_FACTOR_LABELS = {
+    'absence': '缺课较多',
+    'completion': '完成率低',
+    'remaining': '剩余课时或金额多',
+    'expiry': '即将到期'
+}
+
+# 剩余课消金额达到该值时剩余因素得满分
+REMAINING_FEE_SATURATION = 5000.0
+
+# 仍有剩余课时且距到期不足该天数时，到期因素从0线性升到1；已过期为1
+EXPIRY_WINDOW_DAYS = 90
+
+# 风险等级的分数区间和名称
+RISK_BINS = [0, 40, 70, 100]
+RISK_LEVELS = ['低', '中', '高']
+
+# 评分用到的列：出勤率和课程完成率为导入时保存的派生指标
+RISK_SOURCE_COLUMNS = ['attendance_rate', 'course_completion_rate', 'purchased_amount', 'gifted_amount',
+                       'remaining_amount', 'remaining_fee', 'expiry_date']
+
+# 评分表中随评分保存的报读记录信息，看板按学管师和跟进人筛选
+RISK_RECORD_COLUMNS = ['student_name', 'course_name', 'class_name', 'tutor', 'follow_up_person']
+
+# 按 id 删除评分时每条 IN 语句包含的 id 数
+ID_BATCH_SIZE = 500
+
+# 评分表的列定义
+RISK_TABLE_COLUMNS = {
+    'enrollment_id': 'BIGINT PRIMARY KEY',
+    **{db_name: sql_type for _, db_name, _, sql_type in COLUMNS if db_name in RISK_RECORD_COLUMNS},
+    'risk_score': 'DOUBLE',
+    'risk_level': 'VARCHAR(10)',
+    'main_factor': 'VARCHAR(20)',
+    'scored_at': 'DATETIME'
+}
+
+def risk_factors(attendance_rate, completion_rate, purchased, gifted, remaining, remaining_fee, days_left):
+    """由各列的数组计算每个风险因素的得分（0到1），缺失值不增加风险"""
+    attendance_rate, completion_rate, purchased, gifted, remaining, remaining_fee, days_left = (
+        np.asarray(values, dtype='float64') for values in
+        (attendance_rate, completion_rate, purchased, gifted, remaining, remaining_fee, days_left))
+    total = np.nan_to_num(purchased) + np.nan_to_num(gifted)
+    remaining = np.nan_to_num(remaining)
+    has_remaining = remaining > 0
+    
+    # 没有购买记录时剩余比例按0处理
+    remaining_share = np.divide(remaining, total, out=np.zeros_like(total), where=total > 0)
+    expiry = np.clip((EXPIRY_WINDOW_DAYS - days_left) / EXPIRY_WINDOW_DAYS, 0, 1)
+    return {
+        'absence': np.clip(1 - np.nan_to_num(attendance_rate, nan=1.0), 0, 1),
+        'completion': np.where(has_remaining, np.clip(1 - np.nan_to_num(completion_rate, nan=100.0) / 100, 0, 1), 0.0),
+        'remaining': np.maximum(np.clip(remaining_share, 0, 1),
+                                np.clip(np.nan_to_num(remaining_fee) / REMAINING_FEE_SATURATION, 0, 1)),
+        'expiry': np.where(has_remaining, np.nan_to_num(expiry), 0.0)
+    }
+
+def combine_factors(factors):
+    """按权重合成 0-100 的评分，返回 (评分, 主要因素的序号)"""
+    contributions = np.column_stack([RISK_WEIGHTS[name] * factors[name] for name in RISK_WEIGHTS])
+    return contributions.sum(axis=1) * 100, contributions.argmax(axis=1)
+
+def _as_of(as_of):
+    """评分日期，默认今天"""
+    return pd.Timestamp(as_of if as_of is not None else datetime.now()).normalize()
+
+def _levels(score):
+    """按 RISK_BINS 划分风险等级"""
+    positions = np.searchsorted(RISK_BINS, score, side='right') - 1
+    return np.asarray(RISK_LEVELS)[np.clip(positions, 0, len(RISK_LEVELS) - 1)]
+
+def _main_factors(score, main):
+    """评分为0的记录没有主要因素"""
+    return np.where(score > 0, np.asarray(list(RISK_FACTOR_LABELS.values()))[main], '无')
+
+@instrument(rows=input_rows)
+def score_frame(df, as_of=None):
+    """批量计算每条报读记录的风险评分，df 使用数据库列名
+    
+    各列整体转换为数组后一次计算，不逐行循环。返回与 df 索引一致的 risk_score、risk_level、main_factor 三列。
+    """
+    def source(col):
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    
+    expiry = pd.to_datetime(df['expiry_date'], errors='coerce')
+    days_left = ((expiry - _as_of(as_of)) / pd.Timedelta(days=1)).to_numpy(dtype='float64', na_value=np.nan)
+    score, main = combine_factors(risk_factors(*(source(col) for col in RISK_SOURCE_COLUMNS[:-1]), days_left))
+    return pd.DataFrame({
+        'risk_score': score.round(2),
+        'risk_level': _levels(score),
+        'main_factor': _main_factors(score, main)
+    }, index=df.index)
+
+def _clip(value):
+    """将单个因素得分限制在0到1之间"""
+    return min(max(value, 0.0), 1.0)
+
+def _number(value, default=0.0):
+    """单条记录中的缺失值按 default 处理"""
+    return default if value is None or value != value else float(value)
+
+def score_record(record, as_of=None):
+    """计算单条记录的风险评分，record 为按数据库列名取值的字典，返回 (评分, 等级, 主要因素)
+    
+    公式与 risk_factors 相同，但只用Python标量运算，导入时逐行调用也不会产生数组和DataFrame的开销。
+    """
+    total = _number(record.get('purchased_amount')) + _number(record.get('gifted_amount'))
+    remaining = _number(record.get('remaining_amount'))
+    has_remaining = remaining > 0
+    expiry = record.get('expiry_date')
+    if has_remaining and expiry is not None and expiry == expiry:
+        days_left = (pd.Timestamp(expiry) - _as_of(as_of)) / pd.Timedelta(days=1)
+        expiry_factor = _clip((EXPIRY_WINDOW_DAYS - days_left) / EXPIRY_WINDOW_DAYS)
+    else:
+        expiry_factor = 0.0
+    factors = {
+        'absence': _clip(1 - _number(record.get('attendance_rate'), 1.0)),
+        'completion': _clip(1 - _number(record.get('course_completion_rate'), 100.0) / 100) if has_remaining else 0.0,
+        'remaining': max(_clip(remaining / total if total > 0 else 0.0),
+                         _clip(_number(record.get('remaining_fee')) / REMAINING_FEE_SATURATION)),
+        'expiry': expiry_factor
+    }
+    
+    contributions = [RISK_WEIGHTS[name] * factors[name] for name in RISK_WEIGHTS]
+    score = sum(contributions) * 100
+    level = RISK_LEVELS[min(max(bisect.bisect_right(RISK_BINS, score) - 1, 0), len(RISK_LEVELS) - 1)]
+    main = list(RISK_FACTOR_LABELS.values())[contributions.index(max(contributions))] if score > 0 else '无'
+    return round(score, 2), level, main
+
+def create_risk_table(conn, cursor):
+    """创建风险评分表"""
+    columns = ',\n        '.join(f"{col} {sql_type}" for col, sql_type in RISK_TABLE_COLUMNS.items())
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {RISK_TABLE} (
+        {columns}
+    )
+    """)
+
+def _active_rows(cursor, condition='', params=()):
+    """读取有效报读记录中评分需要的列，condition 为附加的过滤条件"""
+    source_columns = RISK_RECORD_COLUMNS + RISK_SOURCE_COLUMNS
+    cursor.execute(f"SELECT id, {', '.join(source_columns)} FROM student_courses WHERE removed_at IS NULL{condition}",
+                   params)
+    return pd.DataFrame(cursor.fetchall(), columns=['enrollment_id'] + source_columns)
+
+def _upsert_scores(conn, cursor, scores, batch_size=5000):
+    """按 enrollment_id 写入已计算的评分，已有的评分被覆盖"""
+    scores = scores[['enrollment_id'] + RISK_RECORD_COLUMNS + ['risk_score', 'risk_level', 'main_factor']].copy()
+    scores['scored_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    scores = scores.astype(object).where(scores.notna(), None)
+    backend = backend_of(conn)
+    
+    if backend == 'duckdb':
+        conn.upsert_frame(RISK_TABLE, scores, ['enrollment_id'])
+        return
+    value_columns = [col for col in scores.columns if col != 'enrollment_id']
+    if backend == 'mysql':
+        assignments = ', '.join(f"{col} = VALUES({col})" for col in value_columns)
+        conflict = f"ON DUPLICATE KEY UPDATE {assignments}"
+    else:
+        assignments = ', '.join(f"{col} = excluded.{col}" for col in value_columns)
+        conflict = f"ON CONFLICT (enrollment_id) DO UPDATE SET {assignments}"
+    placeholders = ', '.join(['%s'] * len(scores.columns))
+    sql = f"INSERT INTO {RISK_TABLE} ({', '.join(scores.columns)}) VALUES ({placeholders}) {conflict}"
+    rows = scores.values.tolist()
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[i:i + batch_size])
+
+@instrument(rows=result_rows)
+def refresh_risk_scores(conn, cursor, as_of=None, batch_size=5000):
+    """为当前有效的报读记录重新计算风险评分并整表替换 RISK_TABLE，返回评分的记录数
+    
+    评分依赖到期日与当天的距离，数据没有变化时也需要每天刷新一次。
+    """
+    create_risk_table(conn, cursor)
+    frame = _active_rows(cursor)
+    cursor.execute(f"DELETE FROM {RISK_TABLE}")
+    _upsert_scores(conn, cursor, frame[['enrollment_id'] + RISK_RECORD_COLUMNS].join(score_frame(frame, as_of)), batch_size)
+    conn.commit()
+    return len(frame)
+
+def last_enrollment_id(cursor, table='student_courses'):
+    """返回报读记录当前最大的 id，导入前记录下来，之后 id 更大的即为本次新增的记录"""
+    cursor.execute(f"SELECT MAX(id) FROM {table}")
+    return int(cursor.fetchone()[0] or 0)
+
+def score_import_frame(frame, per_record=False, as_of=None):
+    """在写入数据库之前为内存中的报读记录评分，返回随评分保存的记录信息和评分列，索引与 frame 一致
+    
+    per_record 为True时（逐行导入）逐行调用 score_record，否则用 score_frame 整批计算。
+    """
+    if per_record:
+        records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        scores = pd.DataFrame([score_record(record, as_of) for record in records],
+                              columns=['risk_score', 'risk_level', 'main_factor'], index=frame.index)
+    else:
+        scores = score_frame(frame, as_of)
+    return frame[RISK_RECORD_COLUMNS].join(scores)
+
+def save_import_scores(conn, cursor, scores, after_id=None, ids=None, table='student_courses', batch_size=5000):
+    """在导入事务中保存写入前算好的评分，与导入一起提交，返回保存的评分数
+    
+    ids 为None时，scores 按写入顺序对应本事务中写入的、id 大于 after_id 的新记录；两者数量不一致时
+    （例如 LOAD DATA 跳过了部分行）不保存，这些记录的评分在每日整表刷新时补上。
+    """
+    if ids is None:
+        # 事务内的读取看不到其他写入者尚未提交或之后提交的记录
+        cursor.execute(f"SELECT id FROM {table} WHERE id > %s ORDER BY id", (after_id,))
+        ids = [row[0] for row in cursor.fetchall()]
+        if len(ids) != len(scores):
+            print(f"新写入 {len(ids)} 条记录，与评分数 {len(scores)} 不一致，这些记录的评分将在每日整表刷新时补算")
+            return 0
+    if len(scores):
+        _upsert_scores(conn, cursor, scores.assign(enrollment_id=list(ids)), batch_size)
+    return len(scores)
+
+def delete_scores(cursor, ids):
+    """删除已消失的报读记录的评分"""
+    ids = [int(row_id) for row_id in ids]
+    for i in range(0, len(ids), ID_BATCH_SIZE):
+        chunk = ids[i:i + ID_BATCH_SIZE]
+        cursor.execute(f"DELETE FROM {RISK_TABLE} WHERE enrollment_id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+def top_risks(conn, limit=20, tutor=None):
+    """读取评分最高的记录，tutor 不为空时只看该学管师的学生"""
+    condition, params = ('WHERE tutor = %s', (tutor,)) if tutor else ('', ())
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(RISK_TABLE_COLUMNS)} FROM {RISK_TABLE} {condition} "
+                   f"ORDER BY risk_score DESC LIMIT {int(limit)}", params)
+    risks = pd.DataFrame(cursor.fetchall(), columns=list(RISK_TABLE_COLUMNS))
+    cursor.close()
+    return risks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='重新计算报读记录的风险评分，并列出需要关注的学生')
+    parser.add_argument('--url', default=os.environ.get(DATABASE_URL_ENV),
+                        help='数据库地址，例如 sqlite:///student_management.db (默认: 按 advanced_analytics 的配置连接MySQL)')
+    parser.add_argument('--as-of', default=None, help='评分日期，例如 2025-05-06 (默认: 今天)')
+    parser.add_argument('--tutor', default=None, help='只列出该学管师的学生')
+    parser.add_argument('--top', type=int, default=20, help='列出评分最高的记录数 (默认: 20)')
+    args = parser.parse_args(argv)
+    
+    try:
+        if args.url:
+            conn = CountingConnection(connect(args.url))
+        else:
+            from advanced_analytics import DB_CONFIG
+            conn = CountingConnection(connect(None, **DB_CONFIG))
+        cursor = conn.cursor()
+        count = refresh_risk_scores(conn, cursor, as_of=args.as_of)
+        cursor.close()
+        print(f"已为 {count} 条报读记录计算风险评分，保存在 {RISK_TABLE} 表")
+        risks = top_risks(conn, limit=args.top, tutor=args.tutor)
+        conn.close()
+    except Error as e:
+        print(f"计算风险评分时出错: {e}")
+        return
+    print(risks.drop(columns=['scored_at']).to_string(index=False))
+    write_run_metrics()
+
+if __name__ == "__main__":
+    main()
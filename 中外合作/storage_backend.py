@@ -0,0 +1,221 @@
+import os
+import sqlite3
+from urllib.parse import quote, unquote, urlparse
+import mysql.connector
+from mysql.connector import Error
+try:
+    import duckdb
+except ImportError:  # DuckDB 为可选依赖
+    duckdb = None
+
+# 数据库地址的环境变量，例如：
+#   mysql://root:密码@127.0.0.1:3306/student_management
+#   sqlite:///student_management.db
+#   duckdb:///student_management.duckdb
+DATABASE_URL_ENV = 'STUDENT_DB_URL'
+
+# 支持的存储后端，sqlite 和 duckdb 为嵌入式数据库文件，不需要数据库服务器
+BACKENDS = ('mysql', 'sqlite', 'duckdb')
+EMBEDDED_BACKENDS = ('sqlite', 'duckdb')
+
+def database_url():
+    """返回环境变量中配置的数据库地址，未配置时返回None（使用MySQL）"""
+    return os.environ.get(DATABASE_URL_ENV) or None
+
+# 明细数据的存储布局：wide 为单张 student_courses 表，normalized 拆分为学员、课程班级和报读记录三张表
+LAYOUT_ENV = 'STUDENT_DB_LAYOUT'
+LAYOUTS = ('wide', 'normalized')
+
+def database_layout():
+    """从环境变量读取存储布局，未设置时返回None（沿用数据库现有的布局）"""
+    return os.environ.get(LAYOUT_ENV) or None
+
+def parse_database_url(url):
+    """解析数据库地址，返回包含 backend 和连接参数的字典"""
+    parsed = urlparse(url)
+    backend = parsed.scheme.lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的数据库类型: {backend}，可选: {', '.join(BACKENDS)}")
+    
+    if backend in EMBEDDED_BACKENDS:
+        # sqlite:///相对路径 或 sqlite:////绝对路径
+        path = unquote(parsed.netloc + parsed.path)
+        path = path[1:] if path.startswith('/') else path
+        return {'backend': backend, 'path': path or ':memory:'}
+    
+    options = {'backend': backend}
+    if parsed.hostname:
+        options['host'] = parsed.hostname
+    if parsed.port:
+        options['port'] = parsed.port
+    if parsed.username:
+        options['user'] = unquote(parsed.username)
+    # 空密码（mysql://root:@host）同样覆盖默认配置中的密码
+    if parsed.password is not None:
+        options['password'] = unquote(parsed.password)
+    if parsed.path.strip('/'):
+        options['database'] = parsed.path.strip('/')
+    return options
+
+def mysql_url(host, port, user, password, database):
+    """由MySQL连接参数组成数据库地址，设置到 STUDENT_DB_URL 后其他模块连接同一个库"""
+    credentials = quote(user, safe='')
+    if password is not None:
+        credentials += ':' + quote(password, safe='')
+    return f"mysql://{credentials}@{host}:{port}/{database}"
+
+def table_exists(conn, cursor, table):
+    """判断数据库中是否存在指定的基本表（视图不算）"""
+    backend = backend_of(conn)
+    if backend == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+    elif backend == 'duckdb':
+        cursor.execute("SELECT COUNT(*) FROM information_schema.tables "
+                       "WHERE table_name = %s AND table_type = 'BASE TABLE'", (table,))
+    else:
+        cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND TABLE_TYPE = 'BASE TABLE'", (table,))
+    return cursor.fetchone()[0] > 0
+
+def backend_of(conn):
+    """返回连接所属的存储后端"""
+    return getattr(conn, 'backend', 'mysql')
+
+def date_expression(conn, column):
+    """返回按日期截断时间列的SQL表达式"""
+    if backend_of(conn) == 'duckdb':
+        return f"CAST({column} AS DATE)"
+    return f"DATE({column})"
+
+class EmbeddedCursor:
+    """以MySQL游标的接口包装嵌入式数据库游标：占位符 %s 转换为 ?，错误转换为 mysql.connector.Error"""
+    
+    def __init__(self, cursor, errors, owns_cursor=True):
+        self._cursor = cursor
+        self._errors = errors
+        self._owns_cursor = owns_cursor
+    
+    def execute(self, sql, params=()):
+        try:
+            self._cursor.execute(sql.replace('%s', '?'), tuple(params or ()))
+        except self._errors as e:
+            raise Error(msg=str(e))
+        return self
+    
+    def executemany(self, sql, rows):
+        try:
+            self._cursor.executemany(sql.replace('%s', '?'), rows)
+        except self._errors as e:
+            raise Error(msg=str(e))
+        return self
+    
+    def fetchone(self):
+        return self._cursor.fetchone()
+    
+    def fetchall(self):
+        return self._cursor.fetchall()
+    
+    @property
+    def description(self):
+        return self._cursor.description
+    
+    @property
+    def rowcount(self):
+        return getattr(self._cursor, 'rowcount', -1)
+    
+    def close(self):
+        if self._owns_cursor:
+            self._cursor.close()
+
+class EmbeddedConnection:
+    """以MySQL连接的接口包装 SQLite / DuckDB 连接"""
+    
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        if backend == 'sqlite':
+            # 写入线程与主线程共用同一连接
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+            self._errors = sqlite3.Error
+        else:
+            if duckdb is None:
+                raise Error(msg="未安装 duckdb，请先执行 pip install duckdb")
+            # DuckDB 默认自动提交，显式开启事务以保持与MySQL一致的提交/回滚语义
+            self._conn = duckdb.connect(path)
+            self._conn.begin()
+            self._errors = duckdb.Error
+    
+    def cursor(self):
+        if self.backend == 'duckdb':
+            # DuckDB 的 cursor() 会打开独立的连接和事务，游标直接使用当前连接
+            return EmbeddedCursor(self._conn, self._errors, owns_cursor=False)
+        return EmbeddedCursor(self._conn.cursor(), self._errors)
+    
+    def is_connected(self):
+        return True
+    
+    def commit(self):
+        self._conn.commit()
+        if self.backend == 'duckdb':
+            self._conn.begin()
+    
+    def rollback(self):
+        self._conn.rollback()
+        if self.backend == 'duckdb':
+            self._conn.begin()
+    
+    def insert_frame(self, table, df):
+        """DuckDB 直接扫描DataFrame，用一条 INSERT ... SELECT 写入整批数据"""
+        columns_str = ', '.join(df.columns)
+        try:
+            self._conn.register('_insert_frame', df)
+            self._conn.execute(f"INSERT INTO {table} ({columns_str}) SELECT {columns_str} FROM _insert_frame")
+        except self._errors as e:
+            raise Error(msg=str(e))
+        finally:
+            self._conn.unregister('_insert_frame')
+    
+    def upsert_frame(self, table, df, key_columns):
+        """DuckDB 用一条 INSERT ... ON CONFLICT 写入整批数据，键已存在时更新其余列"""
+        columns_str = ', '.join(df.columns)
+        assignments = ', '.join(f"{col} = excluded.{col}" for col in df.columns if col not in key_columns)
+        try:
+            self._conn.register('_upsert_frame', df)
+            self._conn.execute(f"INSERT INTO {table} ({columns_str}) SELECT {columns_str} FROM _upsert_frame "
+                               f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {assignments}")
+        except self._errors as e:
+            raise Error(msg=str(e))
+        finally:
+            self._conn.unregister('_upsert_frame')
+    
+    def update_frame(self, table, df, key):
+        """DuckDB 按 key 列将DataFrame中的其余列一次性更新到表中"""
+        assignments = ', '.join(f"{col} = _update_frame.{col}" for col in df.columns if col != key)
+        try:
+            self._conn.register('_update_frame', df)
+            self._conn.execute(f"UPDATE {table} SET {assignments} FROM _update_frame "
+                               f"WHERE {table}.{key} = _update_frame.{key}")
+        except self._errors as e:
+            raise Error(msg=str(e))
+        finally:
+            self._conn.unregister('_update_frame')
+    
+    def close(self):
+        self._conn.close()
+
+def connect(url=None, **mysql_options):
+    """按数据库地址连接存储后端；url为空时使用 mysql_options 连接MySQL"""
+    options = parse_database_url(url) if url else {'backend': 'mysql'}
+    backend = options.pop('backend')
+    if backend in EMBEDDED_BACKENDS:
+        return EmbeddedConnection(backend, options['path'])
+    return mysql.connector.connect(**{**mysql_options, **options})
+
+class EmbeddedPool:
+    """嵌入式数据库的连接来源，接口与 mysql.connector 连接池的 get_connection 一致"""
+    
+    def __init__(self, url):
+        self.url = url
+    
+    def get_connection(self):
+        return connect(self.url)
@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+
+# 学生报读课程数据的统一字段定义：(CSV列名, 数据库列名, 内存类型, 数据库类型)
+# 取值种类很少的文本列使用category；课时和次数使用int32；金额在分析时使用float32，
+# 导入时保持float64，避免DECIMAL(10,2)的金额丢失精度；日期列缺失时为NaT/NULL
+COLUMNS = [
+    ('学员姓名', 'student_name', 'object', 'VARCHAR(100)'),
+    ('手机号身份', 'phone_relation', 'category', 'VARCHAR(50)'),
+    ('手机号', 'phone_number', 'object', 'VARCHAR(20)'),
+    ('所在班级', 'class_name', 'category', 'VARCHAR(100)'),
+    ('课程名称', 'course_name', 'category', 'VARCHAR(100)'),
+    ('课程类型', 'course_type', 'category', 'VARCHAR(50)'),
+    ('购买数量', 'purchased_amount', 'int32', 'INT'),
+    ('赠送数量', 'gifted_amount', 'int32', 'INT'),
+    ('消耗数量', 'consumed_amount', 'int32', 'INT'),
+    ('退转数量', 'returned_amount', 'int32', 'INT'),
+    ('剩余数量', 'remaining_amount', 'int32', 'INT'),
+    ('超上数量', 'over_amount', 'int32', 'INT'),
+    ('课消金额', 'consumed_fee', 'float32', 'DECIMAL(10,2)'),
+    ('剩余课消金额', 'remaining_fee', 'float32', 'DECIMAL(10,2)'),
+    ('缺课次数', 'absent_count', 'int32', 'INT'),
+    ('跟进人', 'follow_up_person', 'category', 'VARCHAR(50)'),
+    ('学管师', 'tutor', 'category', 'VARCHAR(50)'),
+    ('到期时间', 'expiry_date', 'datetime64[ns]', 'DATE'),
+    ('性别', 'gender', 'category', 'VARCHAR(10)'),
+    ('微信绑定状态', 'wechat_status', 'category', 'VARCHAR(20)'),
+    ('绑卡状态', 'card_status', 'category', 'VARCHAR(20)'),
+    ('人脸采集状态', 'face_status', 'category', 'VARCHAR(20)'),
+    ('出生日期', 'birth_date', 'datetime64[ns]', 'DATE'),
+    ('年级', 'grade', 'category', 'VARCHAR(50)'),
+    ('学号', 'student_id', 'object', 'VARCHAR(50)'),
+    ('学校', 'school', 'category', 'VARCHAR(100)')
+]
+
+# 导入时间和增量导入使用的附加列
+TRACKING_COLUMNS = {
+    'import_date': 'DATETIME',
+    'row_hash': 'CHAR(32)',
+    'snapshot_time': 'DATETIME',
+    'removed_at': 'DATETIME NULL'
+}
+
+# 派生指标 (数据库列名, 内存类型, 数据库类型)，导入或更新记录时由 compute_derived_metrics 计算并保存
+DERIVED_COLUMNS = [
+    ('course_completion_rate', 'float64', 'DOUBLE'),
+    ('consumption_efficiency', 'float64', 'DOUBLE'),
+    ('attendance_rate', 'float64', 'DOUBLE'),
+    ('attendance_group', 'category', 'VARCHAR(20)')
+]
+DERIVED_DB_COLUMNS = [db_name for db_name, _, _ in DERIVED_COLUMNS]
+
+# 计算派生指标用到的列
+DERIVED_SOURCE_COLUMNS = ['purchased_amount', 'gifted_amount', 'consumed_amount', 'absent_count']
+
+# 出勤率分组的区间和名称
+ATTENDANCE_BINS = [0, 0.6, 0.8, 0.9, 1.0]
+ATTENDANCE_LABELS = ['低(<60%)', '中(60-80%)', '良好(80-90%)', '优秀(>90%)']
+ATTENDANCE_GROUP_DTYPE = pd.CategoricalDtype(ATTENDANCE_LABELS, ordered=True)
+
+# CSV列名 -> 数据库列名
+COLUMN_MAPPING = {csv_name: db_name for csv_name, db_name, _, _ in COLUMNS}
+
+# 导入和分析使用的列（CSV列名 / 数据库列名）
+SELECTED_COLUMNS = [csv_name for csv_name, _, _, _ in COLUMNS]
+DB_COLUMNS = [db_name for _, db_name, _, _ in COLUMNS]
+
+# 数据库列名 -> 内存类型
+DTYPES = {db_name: dtype for _, db_name, dtype, _ in COLUMNS}
+
+# 按类型划分的CSV列
+INT_COLUMNS = [csv_name for csv_name, _, dtype, _ in COLUMNS if dtype == 'int32']
+FEE_COLUMNS = [csv_name for csv_name, _, dtype, _ in COLUMNS if dtype == 'float32']
+CATEGORY_COLUMNS = [csv_name for csv_name, _, dtype, _ in COLUMNS if dtype == 'category']
+DATE_COLUMNS = [csv_name for csv_name, _, dtype, _ in COLUMNS if dtype == 'datetime64[ns]']
+
+# 导出文件中带单位的数值列：CSV列名 -> 单位，例如 69课时、8岁（年龄不导入数据库，但同样需要解析）
+UNIT_SUFFIXES = {
+    '购买数量': '课时',
+    '赠送数量': '课时',
+    '消耗数量': '课时',
+    '退转数量': '课时',
+    '剩余数量': '课时',
+    '超上数量': '课时',
+    '年龄': '岁'
+}
+
+# 需要转换为数值的CSV列
+NUMERIC_CSV_COLUMNS = INT_COLUMNS + FEE_COLUMNS + ['年龄']
+
+# 日期列在导出文件中的格式，不符合格式的取值再按通用格式解析一次
+DATE_FORMATS = {
+    '到期时间': '%Y/%m/%d',
+    '出生日期': '%Y-%m-%d'
+}
+
+def apply_dtypes(df):
+    """将按数据库列名命名的DataFrame转换为紧凑的内存类型，数值列的缺失值填0"""
+    for col, dtype in DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype in ('int32', 'float32'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(dtype)
+        elif dtype == 'datetime64[ns]' and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            # 数据库返回 YYYY-MM-DD 字符串或 date 对象
+            df[col] = pd.to_datetime(df[col], errors='coerce', format='ISO8601').astype(dtype)
+        elif dtype == 'category' and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    
+    # 派生指标的缺失值保持为空，由 ensure_derived_metrics 补算
+    for col, dtype, _ in DERIVED_COLUMNS:
+        if col not in df.columns:
+            continue
+        if col == 'attendance_group':
+            df[col] = df[col].astype(object).astype(ATTENDANCE_GROUP_DTYPE)
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    return df
+
+def compute_derived_metrics(frame):
+    """按统一定义计算派生指标，frame 使用数据库列名，返回由派生列组成的DataFrame
+    
+    课程完成率 = 消耗课时 / (购买课时 + 赠送课时)，限制在0-100%；消耗效率 = 消耗课时 / (缺课次数 + 1)；
+    出勤率 = 1 - 缺课次数 / (消耗课时 + 缺课次数 + 0.1)，限制在0-1，并按 ATTENDANCE_BINS 分组。
+    """
+    def source(col):
+        if col not in frame.columns:
+            return pd.Series(0.0, index=frame.index)
+        return pd.to_numeric(frame[col], errors='coerce').fillna(0).astype('float64')
+    
+    purchased, gifted, consumed, absent = (source(col) for col in DERIVED_SOURCE_COLUMNS)
+    attendance_rate = (1 - absent / (consumed + absent + 0.1)).clip(0, 1)
+    return pd.DataFrame({
+        'course_completion_rate': (consumed / (purchased + gifted) * 100).clip(0, 100),
+        'consumption_efficiency': consumed / (absent + 1),
+        'attendance_rate': attendance_rate,
+        'attendance_group': pd.cut(attendance_rate, bins=ATTENDANCE_BINS, labels=ATTENDANCE_LABELS)
+    }, index=frame.index)
+
+def ensure_derived_metrics(df):
+    """读取已保存的派生指标；缺少派生列或派生值为空的记录（旧版本导入的数据）按统一定义补算"""
+    missing = [col for col in DERIVED_DB_COLUMNS if col not in df.columns]
+    stale = df['attendance_rate'].isna() if not missing else pd.Series(True, index=df.index)
+    if not stale.any():
+        return df
+    
+    derived = compute_derived_metrics(df)
+    for col in DERIVED_DB_COLUMNS:
+        df[col] = derived[col] if col in missing else df[col].where(~stale, derived[col])
+    return apply_dtypes(df)
+
+def apply_csv_dtypes(df):
+    """将清洗后按CSV列名命名的DataFrame转换为紧凑的内存类型（金额列保持float64）"""
+    for col in INT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('int32')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def fill_category(series, value):
+    """为可能是category类型的列填充缺失值"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if value not in series.cat.categories:
+            series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+def _parse_unique_values(series, parse):
+    """只解析列中不重复的取值再按位置展开；导出文件的课时、年龄、日期取值种类很少
+    
+    返回 (解析结果, 原值非空而解析失败的单元格掩码)。
+    """
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    blank = (uniques == '').to_numpy()
+    parsed = parse(uniques)
+    failed = (parsed.isna().to_numpy() & ~blank)
+    
+    present = codes >= 0
+    positions = np.where(present, codes, 0)
+    values = parsed.to_numpy()[positions] if len(uniques) else np.full(len(series), np.nan)
+    result = pd.Series(values, index=series.index).where(present)
+    rejected = pd.Series(present & failed[positions] if len(uniques) else present, index=series.index)
+    return result, rejected
+
+def parse_numeric_column(series, suffix=None):
+    """将 "69课时"、"8岁" 这样的取值解析为数值，返回 (数值列, 无法解析的单元格掩码)"""
+    def parse(values):
+        if suffix:
+            values = values.str.removesuffix(suffix)
+        return pd.to_numeric(values, errors='coerce')
+    
+    result, rejected = _parse_unique_values(series, parse)
+    return result.astype('float64'), rejected
+
+def parse_date_column(series, date_format=None):
+    """将日期字符串解析为datetime，返回 (日期列, 无法解析的单元格掩码)"""
+    def parse(values):
+        parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+        retry = parsed.isna() & (values != '')
+        if date_format is not None and retry.any():
+            # 个别行使用了其他日期写法
+            parsed[retry] = pd.to_datetime(values[retry], format='mixed', errors='coerce')
+        return parsed
+    
+    result, rejected = _parse_unique_values(series, parse)
+    return pd.to_datetime(result).astype('datetime64[ns]'), rejected
+
+def parse_typed_columns(df, rejections=None):
+    """按统一定义解析导出文件中的数值列和日期列
+    
+    无法解析的单元格数值列记为0、日期列记为NaT，并以 {行号, 列, 原始值, 原因} 追加到 rejections。
+    """
+    for col in NUMERIC_CSV_COLUMNS + DATE_COLUMNS:
+        if col not in df.columns:
+            continue
+        original = df[col]
+        if col in DATE_COLUMNS:
+            parsed, rejected = parse_date_column(original, DATE_FORMATS.get(col))
+            reason = '无法解析为日期'
+        else:
+            parsed, rejected = parse_numeric_column(original, UNIT_SUFFIXES.get(col))
+            parsed = parsed.fillna(0)
+            reason = '无法解析为数值'
+        df[col] = parsed
+        
+        if rejections is not None and rejected.any():
+            for index, value in original[rejected].items():
+                # 行号按CSV文件计，表头为第1行
+                rejections.append({'行号': index + 2 if isinstance(index, int) else index,
+                                   '列': col, '原始值': value, '原因': reason})
+    return df
@@ -0,0 +1,176 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# 导出文件的34列，与学生报读课程导出格式一致
+EXPORT_COLUMNS = [
+    '学员姓名', '手机号身份', '手机号', '所在班级', '课程名称', '课程类型',
+    '购买数量', '赠送数量', '消耗数量', '退转数量', '剩余数量', '超上数量',
+    '课消金额', '剩余课消金额', '缺课次数', '跟进人', '学管师', '到期时间',
+    '性别', '微信绑定状态', '绑卡状态', '人脸采集状态', '备用手机号身份', '备用手机号',
+    '来源', '出生日期', '年龄', '年级', '学号', '学校', '住址', '标签', '备注', '学员创建人'
+]
+
+# 预设的数据规模
+PRESET_SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+# 每次生成并写入的行数，保证生成1000万行时内存占用不变
+CHUNK_ROWS = 500_000
+
+# 平均每个学员报读的课程数
+ENROLLMENTS_PER_STUDENT = 1.5
+
+# 合成数据的取值范围，比例参照真实导出文件
+CAMPUSES = ['QL', 'KX', 'YT', 'HZ', 'HX', 'XY', 'AJ', 'WD']
+COURSE_SUFFIXES = ['常规课通用', '常规课平时', '编程常规课', '常规课周末', 'GESP', 'HABA']
+CLASS_WEEKDAYS = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+CLASS_GROUPS = ['FT', 'DT', 'AS', 'AW', 'DW']
+CLASS_HOURS = ['9/10', '10/11', '13/14', '14/15', '15/16', '16/17', '18/19']
+SURNAMES = list('王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗梁宋郑谢韩唐冯于董萧程曹袁邓许傅沈曾彭吕苏卢蒋蔡贾丁魏薛叶阎余潘杜戴夏钟汪田任姜范方石姚谭廖邹熊金陆郝孔白崔康毛邱秦江史顾侯邵孟龙万段雷钱汤尹黎易常武乔贺赖龚文')
+GIVEN_CHARS = list('子浩宇轩涵梓欣一诺然泽睿博文嘉怡雨晨思佳明俊昊天依彤语桐可馨瑞阳歆蔓宸希昀咏坦')
+PHONE_RELATIONS = (['妈妈', '爸爸', '外婆', '奶奶', ''], [0.955, 0.012, 0.002, 0.001, 0.03])
+GENDERS = (['男', '女', '未知'], [0.65, 0.17, 0.18])
+GRADES = ['一年级', '二年级', '三年级', '四年级', '五年级', '六年级', '初中一年级', '初中二年级', '初中三年级']
+SCHOOLS = ['铁岭小学', '继红小学', '花园小学', '奋斗小学', '育红小学', '工附中学', '省二幼']
+STAFF = ['袁媛', '王春梅', '何召凤', '赵妍', '高晴', '张弛', '王琪', '杜欣然', '栾丽娜', '蒋迎雪']
+SOURCES = ['转介绍', '电话邀约', '门店到访', '小麦秀', '地推活动', '视频课', '大班直播']
+
+def parse_size(size):
+    """将 10k、1M 这样的规模参数转换为行数"""
+    if size in PRESET_SIZES:
+        return PRESET_SIZES[size]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(size[-1].lower(), 1)
+    number = size[:-1] if multiplier > 1 else size
+    return int(float(number) * multiplier)
+
+def _pick(rng, values, size, p=None):
+    """按概率随机选取取值"""
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=p)]
+
+def _sparse(rng, values, size, fill_rate):
+    """只有 fill_rate 比例的行有值，其余为空"""
+    column = _pick(rng, values, size).astype(object)
+    column[rng.random(size) >= fill_rate] = ''
+    return column
+
+def _date_table(start, days, fmt):
+    """预先格式化区间内的每一天，生成时按下标查表，避免逐行格式化日期"""
+    day_range = pd.date_range(start, periods=days, freq='D')
+    return day_range.strftime(fmt).to_numpy(dtype=object), day_range.year.to_numpy()
+
+def _dates(rng, start, end, size, fmt):
+    """在区间内随机生成日期字符串"""
+    table, _ = _date_table(start, (np.datetime64(end, 'D') - np.datetime64(start, 'D')).astype(int), fmt)
+    return table[rng.integers(0, len(table), size=size)]
+
+def generate_chunk(rng, rows, n_students):
+    """生成一个数据块，学员的固定属性由学员编号决定，同一学员的多条报读记录保持一致"""
+    student = rng.integers(0, n_students, size=rows)
+    campus = np.asarray(CAMPUSES, dtype=object)[student % len(CAMPUSES)]
+    
+    # 学员属性
+    surname = np.asarray(SURNAMES, dtype=object)[student % len(SURNAMES)]
+    given = np.asarray(GIVEN_CHARS, dtype=object)[(student // len(SURNAMES)) % len(GIVEN_CHARS)]
+    given2 = np.asarray(GIVEN_CHARS, dtype=object)[(student // 7) % len(GIVEN_CHARS)]
+    phone = (13000000000 + (student * 7919) % 9_000_000_000).astype(str)
+    gender_bucket = (student * 2654435761 % 1000) / 1000
+    gender = np.asarray(GENDERS[0], dtype=object)[np.searchsorted(np.cumsum(GENDERS[1]), gender_bucket, side='right')]
+    birth_table, birth_years = _date_table('2010-01-01', 5000, '%Y-%m-%d')
+    birth_day = (student * 37) % 5000
+    age = (2025 - birth_years[birth_day]).astype(str).astype(object) + '岁'
+    has_birth = (student % 10) != 0
+    
+    # 报读信息
+    course = campus + _pick(rng, COURSE_SUFFIXES, rows, p=[0.35, 0.35, 0.12, 0.1, 0.04, 0.04])
+    group_buy = rng.random(rows) < 0.08
+    course[group_buy] = '团购课'
+    class_name = (campus + _pick(rng, CLASS_GROUPS, rows) + _pick(rng, CLASS_WEEKDAYS, rows)
+                  + _pick(rng, CLASS_HOURS, rows))
+    class_name[rng.random(rows) < 0.67] = '-'
+    
+    purchased = np.rint(rng.gamma(1.2, 37, size=rows)).astype(np.int64)
+    gifted = rng.choice([0, 0, 0, 1, 2, 3, 5, 8], size=rows)
+    consumed = np.rint(rng.random(rows) * (purchased + gifted)).astype(np.int64)
+    returned = np.where(rng.random(rows) < 0.05, rng.integers(0, 10, size=rows), 0)
+    remaining = np.clip(purchased + gifted - consumed - returned, 0, None)
+    unit_price = rng.uniform(80, 160, size=rows)
+    absent = np.minimum(rng.geometric(0.08, size=rows) - 1, 115)
+    
+    def hours(values):
+        return pd.Series(values).astype(str).to_numpy(dtype=object) + '课时'
+    
+    expiry = _dates(rng, '2021-01-01', '2028-01-01', rows, '%Y/%m/%d')
+    expiry[rng.random(rows) >= 0.06] = ''
+    
+    return pd.DataFrame({
+        '学员姓名': campus + surname + given + given2,
+        '手机号身份': _pick(rng, PHONE_RELATIONS[0], rows, p=PHONE_RELATIONS[1]),
+        '手机号': phone,
+        '所在班级': class_name,
+        '课程名称': course,
+        '课程类型': '一对多',
+        '购买数量': hours(purchased),
+        '赠送数量': hours(gifted),
+        '消耗数量': hours(consumed),
+        '退转数量': hours(returned),
+        '剩余数量': hours(remaining),
+        '超上数量': '0课时',
+        '课消金额': np.round(consumed * unit_price, 2),
+        '剩余课消金额': np.round(remaining * unit_price, 2),
+        '缺课次数': absent,
+        '跟进人': _sparse(rng, STAFF, rows, 0.8),
+        '学管师': _sparse(rng, STAFF, rows, 0.13),
+        '到期时间': expiry,
+        '性别': gender,
+        '微信绑定状态': _pick(rng, ['已绑定', '未绑定'], rows, p=[0.7, 0.3]),
+        '绑卡状态': '未绑定',
+        '人脸采集状态': '未采集',
+        '备用手机号身份': _sparse(rng, ['爸爸', '妈妈', '奶奶', '外婆'], rows, 0.015),
+        '备用手机号': '',
+        '来源': _sparse(rng, SOURCES, rows, 0.03),
+        '出生日期': np.where(has_birth, birth_table[birth_day], ''),
+        '年龄': np.where(has_birth, age, ''),
+        '年级': _sparse(rng, GRADES, rows, 0.025),
+        '学号': (200000 + student).astype(str),
+        '学校': _sparse(rng, SCHOOLS, rows, 0.025),
+        '住址': '',
+        '标签': '',
+        '备注': _sparse(rng, ['续费全年卡', '报名寒假课包', '不退不转', '赠送2课时'], rows, 0.75),
+        '学员创建人': _sparse(rng, STAFF, rows, 0.28)
+    }, columns=EXPORT_COLUMNS)
+
+def generate_export(path, rows, seed=42, chunk_rows=CHUNK_ROWS):
+    """分块生成指定行数的合成导出文件"""
+    rng = np.random.default_rng(seed)
+    n_students = max(1, int(rows / ENROLLMENTS_PER_STUDENT))
+    start_time = time.perf_counter()
+    
+    for start_row in range(0, rows, chunk_rows):
+        chunk = generate_chunk(rng, min(chunk_rows, rows - start_row), n_students)
+        chunk.to_csv(path, mode='w' if start_row == 0 else 'a', header=(start_row == 0),
+                     index=False, encoding='utf-8')
+    
+    elapsed = time.perf_counter() - start_time
+    print(f"已生成 {path}，共 {rows} 行，耗时 {elapsed:.2f} 秒")
+    return path
+
+def synthetic_export_path(output_dir, size):
+    """合成导出文件的路径，文件名带有快照时间戳以便按导出文件处理"""
+    return os.path.join(output_dir, f"学生报读课程20250101000000_synthetic_{size}.csv")
+
+def main():
+    parser = argparse.ArgumentParser(description='生成与学生报读课程导出格式一致的合成数据')
+    parser.add_argument('--sizes', nargs='+', default=['10k', '100k', '1M', '10M'],
+                        help='数据规模，例如 10k 100k 1M 10M (默认: 全部)')
+    parser.add_argument('--output-dir', default=os.path.join('benchmarks', 'data'), help='输出目录')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子 (默认: 42)')
+    args = parser.parse_args()
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size in args.sizes:
+        generate_export(synthetic_export_path(args.output_dir, size), parse_size(size), seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import pytest
+from mysql.connector import Error
+
+# 各模块以平铺方式互相导入，测试从 中外合作 目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from direct_mysql_import import create_database_and_table
+from storage_backend import connect, parse_database_url
+
+# 设置该环境变量（例如 mysql://root:密码@127.0.0.1:3306/student_test）时，数据库测试同时在MySQL上运行
+MYSQL_TEST_URL_ENV = 'STUDENT_TEST_MYSQL_URL'
+
+# 测试写入的表，MySQL测试库在每个测试开始前清空
+TEST_TABLES = ['student_risk_scores', 'daily_rollup', 'data_version', 'enrollments', 'students', 'course_classes', 'student_courses']
+
+@pytest.fixture
+def create_database(tmp_path):
+    """返回创建空数据库的函数：create(backend, layout, name) -> 数据库地址；未配置MySQL测试库时跳过MySQL
+    
+    MySQL 只有一个测试库，每次调用都会清空其中的表。
+    """
+    def create(backend, layout='wide', name='student'):
+        if backend == 'mysql':
+            url = os.environ.get(MYSQL_TEST_URL_ENV)
+            if not url:
+                pytest.skip(f"未设置 {MYSQL_TEST_URL_ENV}")
+        else:
+            if backend == 'duckdb':
+                pytest.importorskip('duckdb')
+            url = f"{backend}:///{tmp_path / (name + '.' + backend)}"
+        
+        conn = connect(url)
+        cursor = conn.cursor()
+        if backend == 'mysql':
+            for statement in ["DROP VIEW IF EXISTS student_courses"] + [f"DROP TABLE IF EXISTS {table}"
+                                                                        for table in TEST_TABLES]:
+                try:
+                    cursor.execute(statement)
+                except Error:
+                    pass
+        assert create_database_and_table(conn, cursor, parse_database_url(url).get('database'), layout)
+        cursor.close()
+        conn.close()
+        return url
+    
+    return create
@@ -0,0 +1,100 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+import advanced_analytics
+from advanced_analytics import (clean_and_prepare_data, course_analysis, course_analysis_pushdown, load_data,
+                                reset_loaded_data, verify_pushdown)
+from direct_mysql_import import create_database_and_table, delta_import, process_csv_file
+from storage_backend import DATABASE_URL_ENV, connect
+from synthetic_data import generate_export
+
+@pytest.fixture
+def database(create_database, tmp_path, monkeypatch):
+    """导入一个合成快照的数据库，分析端连接该数据库并把缓存写到临时目录"""
+    url = create_database('sqlite')
+    monkeypatch.setenv(DATABASE_URL_ENV, url)
+    monkeypatch.setattr(advanced_analytics, 'CACHE_DIR', str(tmp_path / 'cache'))
+    path = generate_export(str(tmp_path / '学生报读课程20250102000000.csv'), 300, seed=17)
+    conn = connect(url)
+    assert delta_import(process_csv_file(path), conn, conn.cursor(), datetime(2025, 1, 2))
+    conn.close()
+    reset_loaded_data()
+    yield url, path
+    reset_loaded_data()
+
+def _reload():
+    """丢弃进程内的数据后重新加载，只能命中本地缓存或重新查询数据库"""
+    reset_loaded_data()
+    return load_data()
+
+def test_unchanged_data_is_read_from_cache(database, capsys):
+    """数据没有变化时第二次加载读取本地缓存"""
+    first = _reload()
+    capsys.readouterr()
+    second = _reload()
+    assert '数据未变化' in capsys.readouterr().out
+    pd.testing.assert_frame_equal(second, first)
+
+def test_in_place_update_invalidates_cache(database, tmp_path, capsys):
+    """强制重新导入较早的快照只原地更新记录，行数和各最大值不变，缓存仍然失效"""
+    url, path = database
+    before = _reload()
+    
+    older = pd.read_csv(path, dtype=str, keep_default_na=False)
+    older.loc[:49, '缺课次数'] = '77'
+    older_path = str(tmp_path / '学生报读课程20250101000000.csv')
+    older.to_csv(older_path, index=False, encoding='utf-8')
+    conn = connect(url)
+    counts = delta_import(process_csv_file(older_path), conn, conn.cursor(), datetime(2025, 1, 1), force=True)
+    conn.close()
+    assert counts['updated'] > 0 and counts['inserted'] == counts['removed'] == 0
+    
+    capsys.readouterr()
+    after = _reload()
+    assert '数据未变化' not in capsys.readouterr().out
+    assert len(after) == len(before)
+    assert (after['absent_count'] == 77).sum() == counts['updated']
+
+def test_backfill_invalidates_cache(database, capsys):
+    """补算派生指标只原地更新记录，缓存仍然失效"""
+    url, _ = database
+    _reload()
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE student_courses SET attendance_rate = NULL")
+    conn.commit()
+    assert create_database_and_table(conn, cursor, None, 'wide')
+    conn.close()
+    
+    capsys.readouterr()
+    _reload()
+    assert '数据未变化' not in capsys.readouterr().out
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb'])
+def test_sql_aggregates_match_pandas(create_database, tmp_path, monkeypatch, backend):
+    """数据库中的课程和每日汇总与读取明细后在pandas中汇总的结果一致，已标记删除的记录不计入"""
+    url = create_database(backend)
+    monkeypatch.setenv(DATABASE_URL_ENV, url)
+    monkeypatch.setattr(advanced_analytics, 'CACHE_DIR', str(tmp_path / 'cache'))
+    first = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 800, seed=21)
+    second = pd.read_csv(first, dtype=str, keep_default_na=False).drop(index=range(100))
+    second_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    second.to_csv(second_path, index=False, encoding='utf-8')
+    conn = connect(url)
+    cursor = conn.cursor()
+    assert delta_import(process_csv_file(first), conn, cursor, datetime(2025, 1, 1))
+    assert delta_import(process_csv_file(second_path), conn, cursor, datetime(2025, 1, 2))['removed'] > 0
+    conn.close()
+    reset_loaded_data()
+    
+    try:
+        assert verify_pushdown()
+        frame_ranking = course_analysis(clean_and_prepare_data(load_data()))
+        sql_ranking = course_analysis_pushdown()
+    finally:
+        reset_loaded_data()
+    
+    # 排序值相同的课程先后顺序可能不同，只比较排序依据的取值
+    for name, column in [('popular_courses', 'student_count'), ('highest_completion', 'completion_rate'),
+                         ('lowest_absence', 'average_absences')]:
+        assert sql_ranking[name][column].tolist() == pytest.approx(frame_ranking[name][column].tolist())
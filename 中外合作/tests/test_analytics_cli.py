@@ -0,0 +1,57 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+import pandas as pd
+import pytest
+
+# 被测模块所在目录，子进程从这里导入
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 较重的依赖，只有用到它们的子命令才应导入
+HEAVY_MODULES = ('pandas', 'sklearn', 'seaborn', 'matplotlib', 'mysql')
+
+# 在新进程中运行命令行，结束后输出已导入的较重依赖
+RUN_CLI = f"""
+import json, sys
+import analytics_cli
+analytics_cli.main(sys.argv[1:])
+print(json.dumps(sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)))
+"""
+
+def _run_cli(tmp_path, *argv):
+    """在临时目录中以新进程运行命令行，返回 (退出码, 已导入的较重依赖, 标准错误)"""
+    env = {**os.environ, 'PYTHONPATH': PACKAGE_DIR, 'PIPELINE_METRICS_DIR': str(tmp_path / 'metrics')}
+    completed = subprocess.run([sys.executable, '-c', RUN_CLI, *argv], cwd=tmp_path, env=env,
+                               capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    return completed.returncode, json.loads(lines[-1]) if completed.returncode == 0 else None, completed.stderr
+
+def test_parser_imports_no_heavy_dependency():
+    """构建命令行解析器时不导入 pandas、scikit-learn 等依赖"""
+    code = "import sys, analytics_cli; analytics_cli.build_parser(); " \
+           f"print([name for name in {HEAVY_MODULES!r} if name in sys.modules])"
+    completed = subprocess.run([sys.executable, '-c', code], cwd=PACKAGE_DIR, capture_output=True, text=True)
+    assert completed.stdout.strip() == '[]', completed.stderr
+
+def test_subcommand_imports_only_its_dependencies(tmp_path):
+    """regions 子命令只导入 pandas，不导入绘图和聚类依赖，运行指标记录启动阶段"""
+    output_path = str(tmp_path / 'stats.csv')
+    
+    code, imported, stderr = _run_cli(tmp_path, 'regions', '--input',
+                                      os.path.join(PACKAGE_DIR, '中外合作办学机构数据.csv'), '--output', output_path)
+    
+    assert code == 0, stderr
+    assert imported == ['pandas']
+    assert len(pd.read_csv(output_path)) > 0
+    [metrics_path] = glob.glob(str(tmp_path / 'metrics' / 'run_*.json'))
+    with open(metrics_path, encoding='utf-8') as f:
+        stages = json.load(f)['stages']
+    assert [stage['command'] for stage in stages if stage['stage'] == 'startup'] == ['regions']
+
+@pytest.mark.parametrize('argv', [['regions', '--unknown'], ['nothing']])
+def test_unknown_arguments_are_rejected(tmp_path, argv):
+    """不转交参数的子命令遇到无法识别的参数或未知子命令时报错退出"""
+    code, _, stderr = _run_cli(tmp_path, *argv)
+    assert code == 2 and 'usage' in stderr
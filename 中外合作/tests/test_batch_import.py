@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import batch_import
+from batch_import import _parse_file, create_pool, run_batch_import
+from storage_backend import connect
+from synthetic_data import generate_export
+
+class FailingPool:
+    """第一次取连接时抛出非数据库异常的连接池，其余连接正常"""
+    
+    def __init__(self, pool):
+        self._pool = pool
+        self._failed = False
+    
+    def get_connection(self):
+        if not self._failed:
+            self._failed = True
+            raise RuntimeError('连接池已关闭')
+        return self._pool.get_connection()
+
+def test_write_error_is_reported_for_that_file(create_database, tmp_path):
+    """写入线程抛出任意异常时只把该文件标记为写入失败，其他文件照常导入"""
+    files = [generate_export(str(tmp_path / f"学生报读课程2025010{day}000000.csv"), 200, seed=day)
+             for day in (1, 2)]
+    pool, _ = create_pool(create_database('sqlite'), 1)
+    
+    results = run_batch_import(files, FailingPool(pool), mode='batch', workers=1, writers=1)
+    
+    statuses = sorted(result['status'] for result in results)
+    assert statuses == ['写入失败: 连接池已关闭', '成功']
+
+def test_delta_snapshots_are_written_in_snapshot_order(create_database, tmp_path, monkeypatch):
+    """同一校区较早的快照最后解析完成时，仍按快照时间顺序写入；已导入更新快照后的旧快照报告为跳过"""
+    older_path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 300, seed=1)
+    newer = pd.read_csv(older_path, dtype=str, keep_default_na=False)
+    newer['缺课次数'] = '40'
+    newer = newer.drop(index=range(50))
+    newer_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    newer.to_csv(newer_path, index=False, encoding='utf-8')
+    
+    # 解析在线程中进行，较早的快照故意晚一些解析完成
+    def slow_parse(path):
+        if path == older_path:
+            time.sleep(0.5)
+        return _parse_file(path)
+    
+    monkeypatch.setattr(batch_import, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(batch_import, '_parse_file', slow_parse)
+    url = create_database('sqlite')
+    pool, _ = create_pool(url, 1)
+    
+    results = run_batch_import([older_path, newer_path], pool, mode='delta', workers=2, writers=2)
+    assert [result['status'] for result in results] == ['成功', '成功']
+    
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT absent_count FROM student_courses WHERE removed_at IS NULL")
+    assert cursor.fetchall() == [(40,)]
+    # 较早的快照先写入，其中不在较新快照里的记录随后被标记删除
+    cursor.execute("SELECT COUNT(*) FROM student_courses WHERE removed_at IS NOT NULL")
+    assert cursor.fetchone()[0] > 0
+    conn.close()
+    
+    results = run_batch_import([older_path], pool, mode='delta', workers=1, writers=1)
+    assert results[0]['status'] == '跳过: 已导入更新的快照'
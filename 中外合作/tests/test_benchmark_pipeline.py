@@ -0,0 +1,65 @@
+import os
+import tracemalloc
+import pandas as pd
+import pytest
+import clustering_engine
+from benchmark_pipeline import compare_with_baseline, run_pipeline
+from direct_mysql_import import rejection_report_path, process_csv_file
+from synthetic_data import EXPORT_COLUMNS, generate_export, parse_size
+
+def test_parse_size():
+    """规模参数支持预设名称、k/M 后缀和直接给出的行数"""
+    assert parse_size('10k') == 10_000
+    assert parse_size('1M') == 1_000_000
+    assert parse_size('2.5m') == 2_500_000
+    assert parse_size('1500') == 1500
+
+def test_generated_export_is_reproducible_and_clean(tmp_path):
+    """同一种子分块生成的文件完全相同；同一学号的固定属性一致，清洗时没有无法解析的单元格"""
+    first = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 1000, seed=5, chunk_rows=300)
+    second = generate_export(str(tmp_path / 'again.csv'), 1000, seed=5, chunk_rows=300)
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        assert f.read() == g.read()
+    
+    export = pd.read_csv(first, dtype=str, keep_default_na=False)
+    assert list(export.columns) == EXPORT_COLUMNS
+    assert len(export) == 1000
+    per_student = export.groupby('学号')[['学员姓名', '手机号', '性别', '出生日期']].nunique()
+    assert (per_student == 1).all().all()
+    
+    assert len(process_csv_file(first)) == 1000
+    assert not os.path.exists(rejection_report_path(first))
+
+def test_benchmark_measures_every_stage(tmp_path, monkeypatch):
+    """端到端基准测试在合成数据上依次运行各阶段，记录每个阶段的行数和吞吐量"""
+    # run_pipeline 会把聚类模型目录改到工作目录下，测试结束后恢复
+    monkeypatch.setattr(clustering_engine, 'MODEL_DIR', clustering_engine.MODEL_DIR)
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 400, seed=12)
+    workdir = tmp_path / 'work'
+    workdir.mkdir()
+    
+    tracemalloc.start()
+    try:
+        results, database_bytes = run_pipeline(path, str(workdir), plot_mode='sample')
+    finally:
+        tracemalloc.stop()
+    
+    assert list(results) == ['process_csv_file', 'import_to_mysql', 'refresh_risk_scores', 'load_data', 'score_frame',
+                             'clean_and_prepare_data', 'student_clustering', 'course_analysis',
+                             'create_visualizations']
+    assert results['process_csv_file']['rows'] == results['import_to_mysql']['rows'] == 400
+    assert results['load_data']['rows'] == results['refresh_risk_scores']['rows'] > 0
+    assert all(stage['seconds'] >= 0 and stage['peak_memory_mb'] >= 0 for stage in results.values())
+    assert database_bytes > 0
+    assert len(os.listdir(workdir / 'visualizations')) > 0
+
+def test_compare_with_baseline_reports_only_throughput_drops():
+    """只有吞吐量下降超过允许比例的阶段视为回退，基准中没有的阶段不比较"""
+    baseline = {'sizes': {'10k': {'load_data': {'rows_per_sec': 1000}, 'score_frame': {'rows_per_sec': 1000}}}}
+    current = {'sizes': {'10k': {'load_data': {'rows_per_sec': 700}, 'score_frame': {'rows_per_sec': 900},
+                                 'course_analysis': {'rows_per_sec': 1}}}}
+    
+    regressions = compare_with_baseline(current, baseline, tolerance=0.2)
+    
+    assert [(size, stage) for size, stage, _ in regressions] == [('10k', 'load_data')]
+    assert regressions[0][2] == pytest.approx(-0.3)
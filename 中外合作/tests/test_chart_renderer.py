@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pandas as pd
+from matplotlib import cbook
+import chart_renderer
+from chart_renderer import (CHART_CONFIG, binned_counts, box_statistics, build_chart_inputs, render_charts,
+                            stratified_sample)
+from student_schema import ATTENDANCE_GROUP_DTYPE, ATTENDANCE_LABELS
+
+# 测试中用较低的分辨率绘制，缩短渲染时间
+LOW_DPI = {name: {'dpi': 40} for name in CHART_CONFIG}
+
+def _analysis_frame(rows, seed=0):
+    """按分析数据的列生成图表输入所需的报读记录，同时作为已聚类的数据"""
+    rng = np.random.default_rng(seed)
+    purchased = rng.integers(10, 100, rows)
+    consumed = rng.integers(0, 10, rows)
+    return pd.DataFrame({
+        'class_name': pd.Categorical(rng.choice([f"班级{i}" for i in range(12)], rows)),
+        'course_type': pd.Categorical(rng.choice(['常规课', '编程课', '团购课'], rows)),
+        'gender': pd.Categorical(rng.choice(['男', '女', '未知'], rows, p=[0.6, 0.35, 0.05])),
+        'absent_count': rng.integers(0, 20, rows),
+        'purchased_amount': purchased,
+        'consumed_amount': consumed,
+        'remaining_amount': purchased - consumed,
+        'course_completion_rate': consumed / purchased * 100,
+        'attendance_group': pd.Categorical(rng.choice(ATTENDANCE_LABELS, rows), dtype=ATTENDANCE_GROUP_DTYPE),
+        'cluster': rng.integers(0, 3, rows)
+    })
+
+def test_unchanged_charts_are_skipped(tmp_path):
+    """第二次渲染时输入和配置都没有变化的图表直接复用，只重新绘制输入、配置变化或输出文件丢失的图表"""
+    output_dir = str(tmp_path / 'visualizations')
+    frame = _analysis_frame(400)
+    inputs = build_chart_inputs(frame, frame, plot_mode='full')
+    
+    first = render_charts(inputs, output_dir, config=LOW_DPI, max_workers=2)
+    assert sorted(first['rendered']) == sorted(inputs) and first['failed'] == []
+    assert render_charts(inputs, output_dir, config=LOW_DPI, max_workers=1)['rendered'] == []
+    
+    # 性别取值变化只影响用到性别的两个图表；另外删除一个输出文件、修改一个图表的分辨率
+    changed = frame.copy()
+    changed.loc[:50, 'gender'] = '女'
+    os.remove(os.path.join(output_dir, '班级课程关系热力图.png'))
+    config = {**LOW_DPI, '课程类型分布': {'dpi': 50}}
+    summary = render_charts(build_chart_inputs(changed, frame, plot_mode='full'), output_dir, config=config,
+                            max_workers=1)
+    assert sorted(summary['rendered']) == sorted(['学生性别分布', '课程完成率与缺课次数关系', '班级课程关系热力图',
+                                                  '课程类型分布'])
+    assert sorted(summary['reused']) == sorted(['学生课时聚类分析', '出勤率与课程完成率关系'])
+    
+    forced = render_charts(inputs, output_dir, config=LOW_DPI, max_workers=1, force=True)
+    assert sorted(forced['rendered']) == sorted(inputs)
+
+def test_stratified_sample_keeps_every_stratum():
+    """分层抽样按比例抽取，行数很少的层至少保留一行"""
+    frame = _analysis_frame(20000)
+    frame.loc[:2, 'gender'] = '未知'
+    frame.loc[3:, 'gender'] = frame.loc[3:, 'gender'].replace('未知', '男')
+    
+    sample = stratified_sample(frame, 'gender', sample_size=1000)
+    
+    assert 990 <= len(sample) <= 1010
+    assert set(sample['gender']) == {'男', '女', '未知'}
+    shares = sample['gender'].value_counts(normalize=True)
+    expected = frame['gender'].value_counts(normalize=True)
+    assert abs(shares['女'] - expected['女']) < 0.01
+    # 不超过目标行数时不抽样
+    assert len(stratified_sample(frame.head(500), 'gender', sample_size=1000)) == 500
+
+def test_binned_counts_cover_every_row():
+    """二维分箱只保留非空格子，格子行数之和等于总行数，格子中心落在数据范围内"""
+    frame = _analysis_frame(5000)
+    binned = binned_counts(frame, 'consumed_amount', 'remaining_amount', gridsize=10)
+    
+    assert binned['count'].sum() == len(frame)
+    assert (binned['count'] > 0).all() and len(binned) <= 100
+    assert binned['consumed_amount'].between(frame['consumed_amount'].min(), frame['consumed_amount'].max()).all()
+
+def test_box_statistics_match_matplotlib():
+    """预先计算的分位数和须线端点与 matplotlib 由明细计算的箱线图统计一致"""
+    frame = _analysis_frame(3000)
+    stats = box_statistics(frame, 'attendance_group', 'course_completion_rate').set_index('attendance_group')
+    
+    for group, values in frame.groupby('attendance_group', observed=True)['course_completion_rate']:
+        expected = cbook.boxplot_stats(values.to_numpy())[0]
+        row = stats.loc[group]
+        assert row['count'] == len(values)
+        for key in ('q1', 'med', 'q3', 'whislo', 'whishi'):
+            assert row[key] == expected[key]
+
+def test_large_inputs_are_sampled_and_rendered(tmp_path, monkeypatch):
+    """超过大数据量阈值时散点图只接收抽样或分箱结果、箱线图只接收分位数，这些输入都能绘制"""
+    monkeypatch.setattr(chart_renderer, 'LARGE_DATA_ROWS', 1000)
+    frame = _analysis_frame(3000)
+    
+    sampled = build_chart_inputs(frame, frame, sample_size=500)
+    hexbin = build_chart_inputs(frame, frame, plot_mode='hexbin')
+    
+    assert isinstance(build_chart_inputs(frame.head(800), frame.head(800))['学生课时聚类分析'], pd.DataFrame)
+    assert sampled['学生课时聚类分析']['method'] == 'sample' and len(sampled['学生课时聚类分析']['data']) <= 510
+    assert hexbin['学生课时聚类分析']['method'] == 'hexbin'
+    assert hexbin['学生课时聚类分析']['data']['count'].sum() == len(frame)
+    assert sampled['出勤率与课程完成率关系']['method'] == 'quantiles'
+    
+    for name, inputs in (('sample', sampled), ('hexbin', hexbin)):
+        summary = render_charts(inputs, str(tmp_path / name), config=LOW_DPI, max_workers=1, verbose=False)
+        assert summary['failed'] == [] and sorted(summary['rendered']) == sorted(inputs)
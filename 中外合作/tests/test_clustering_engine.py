@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import clustering_engine
+from clustering_engine import CLUSTER_FEATURES, assign_clusters, load_model
+
+def _features(rows, seed, shift=0.0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(50, 10, size=(rows, len(CLUSTER_FEATURES))), columns=CLUSTER_FEATURES)
+    X['absent_count'] += shift
+    return X
+
+@pytest.fixture(autouse=True)
+def model_dir(tmp_path, monkeypatch):
+    """每个测试使用单独的模型目录和空的模型缓存"""
+    monkeypatch.setattr(clustering_engine, 'MODEL_DIR', str(tmp_path / 'clustering'))
+    monkeypatch.setattr(clustering_engine, '_models', {})
+
+def _trained_hash(X):
+    assign_clusters(X, k_range=range(1, 5), n_jobs=1)
+    return load_model()['feature_hash']
+
+def test_same_distribution_with_more_rows_reuses_model():
+    """行数变化较大但特征分布不变时沿用已有模型"""
+    first = _trained_hash(_features(2000, seed=1))
+    assert _trained_hash(_features(3000, seed=2)) == first
+
+def test_shifted_features_with_same_row_count_refit():
+    """行数相同但某个特征整体偏移时重新训练"""
+    first = _trained_hash(_features(2000, seed=1))
+    assert _trained_hash(_features(2000, seed=2, shift=10)) != first
+
+def test_different_fit_options_refit(monkeypatch):
+    """特征相同但训练选项不同时重新训练，不复用按其他选项训练的模型；换回原来的选项时复用原来的模型"""
+    fits = []
+    fit_clusters = clustering_engine.fit_clusters
+    
+    def counting_fit(X, **options):
+        fits.append(options)
+        return fit_clusters(X, **options)
+    
+    monkeypatch.setattr(clustering_engine, 'fit_clusters', counting_fit)
+    X = _features(2000, seed=1)
+    for minibatch in (False, True, False):
+        assign_clusters(X, k_range=range(1, 5), n_jobs=1, minibatch=minibatch)
+    
+    assert [options['minibatch'] for options in fits] == [False, True]
+    assert load_model()['settings']['minibatch']
+
+def test_saved_models_are_limited(monkeypatch):
+    """按特征保存的模型文件只保留最近的 MAX_SAVED_MODELS 个"""
+    monkeypatch.setattr(clustering_engine, 'MAX_SAVED_MODELS', 2)
+    for shift in (0, 20, 40, 60):
+        _trained_hash(_features(500, seed=1, shift=shift))
+    saved = sorted(os.listdir(clustering_engine.MODEL_DIR))
+    assert len(saved) == 3 and clustering_engine.LATEST_MODEL in saved
@@ -0,0 +1,39 @@
+import os
+import shutil
+import crs_parser
+from crs_parser import OUTPUT_CSV, parse_page, parse_pages, write_records
+
+# 仓库中保存的CRS名单页面和由它生成的机构数据
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_PATH = os.path.join(PACKAGE_DIR, 'crs_page.html')
+CSV_PATH = os.path.join(PACKAGE_DIR, OUTPUT_CSV)
+
+def test_parser_reproduces_institution_csv(tmp_path, monkeypatch):
+    """解析保存的页面后写出的CSV与仓库中的机构数据逐字节一致"""
+    monkeypatch.setattr(crs_parser, 'CACHE_DIR', str(tmp_path / 'cache'))
+    output_path = str(tmp_path / OUTPUT_CSV)
+    
+    records, parsed, reused = parse_pages([PAGE_PATH])
+    write_records(records, output_path)
+    
+    assert (parsed, reused) == ([PAGE_PATH], [])
+    with open(output_path, 'rb') as f, open(CSV_PATH, 'rb') as expected:
+        assert f.read() == expected.read()
+
+def test_chunk_boundaries_do_not_change_records(monkeypatch):
+    """分块读取时多字节字符和标签被切开，解析结果与整块读取相同"""
+    _, records = parse_page(PAGE_PATH)
+    monkeypatch.setattr(crs_parser, 'READ_CHUNK_SIZE', 7)
+    assert parse_page(PAGE_PATH)[1] == records
+
+def test_unchanged_pages_reuse_cached_records(tmp_path, monkeypatch):
+    """内容未变化的页面复用缓存的解析结果，同一审批详情在多个页面中只保留一条"""
+    monkeypatch.setattr(crs_parser, 'CACHE_DIR', str(tmp_path / 'cache'))
+    copy_path = str(tmp_path / 'copy.html')
+    shutil.copy(PAGE_PATH, copy_path)
+    first, _, _ = parse_pages([PAGE_PATH])
+    
+    records, parsed, reused = parse_pages([PAGE_PATH, copy_path])
+    
+    assert parsed == [] and reused == [PAGE_PATH, copy_path]
+    assert records == first
@@ -0,0 +1,66 @@
+import threading
+import time
+from datetime import date
+import pandas as pd
+import pytest
+from daily_rollup import ROLLUP_METRICS, ROLLUP_TABLE, apply_rollup_deltas
+from storage_backend import connect
+
+def _delta(day, students, purchased=0, consumed=0):
+    return pd.DataFrame([[students, purchased, consumed]], index=[day], columns=list(ROLLUP_METRICS))
+
+def _rollup(url):
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT import_day, student_count, cumulative_students FROM {ROLLUP_TABLE} ORDER BY import_day")
+    rows = [(pd.Timestamp(day).date(), int(count), int(cumulative)) for day, count, cumulative in cursor.fetchall()]
+    conn.close()
+    return rows
+
+@pytest.mark.parametrize('backend', ['sqlite', 'mysql'])
+def test_concurrent_writers_add_the_same_new_day(create_database, backend):
+    """两个写入者在同一天并发写入：新日期只插入一次，累计值取自提交后的前一天"""
+    url = create_database(backend)
+    first_day, new_day = date(2025, 1, 1), date(2025, 1, 2)
+    setup = connect(url)
+    apply_rollup_deltas(setup, setup.cursor(), _delta(first_day, 5))
+    setup.commit()
+    setup.close()
+    
+    # 第一个写入者插入新日期但尚未提交；第二个写入者随后写入同一天，需要等待第一个提交
+    writer = connect(url)
+    apply_rollup_deltas(writer, writer.cursor(), _delta(new_day, 3), _delta(first_day, 1))
+    errors = []
+    
+    def second_writer():
+        conn = connect(url)
+        try:
+            apply_rollup_deltas(conn, conn.cursor(), _delta(new_day, 2))
+            conn.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+    
+    thread = threading.Thread(target=second_writer)
+    thread.start()
+    time.sleep(0.5)
+    writer.commit()
+    writer.close()
+    thread.join(timeout=30)
+    
+    assert not errors
+    assert _rollup(url) == [(first_day, 6, 6), (new_day, 5, 11)]
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb', 'mysql'])
+def test_new_day_is_seeded_from_previous_day(create_database, backend):
+    """新日期插入在已有日期之间时，累计值接续前一天，之后各天顺延"""
+    url = create_database(backend)
+    conn = connect(url)
+    cursor = conn.cursor()
+    apply_rollup_deltas(conn, cursor, _delta(date(2025, 1, 1), 2), _delta(date(2025, 1, 5), 4))
+    apply_rollup_deltas(conn, cursor, _delta(date(2025, 1, 3), 1))
+    conn.commit()
+    conn.close()
+    
+    assert _rollup(url) == [(date(2025, 1, 1), 2, 2), (date(2025, 1, 3), 1, 3), (date(2025, 1, 5), 4, 7)]
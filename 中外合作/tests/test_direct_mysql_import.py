@@ -0,0 +1,159 @@
+import os
+from datetime import datetime
+import pandas as pd
+import pytest
+from direct_mysql_import import (create_database_and_table, delta_import, import_to_mysql, process_csv_file,
+                                 rejection_report_path, stream_import)
+from normalized_store import fact_table
+from storage_backend import connect
+from student_schema import DERIVED_DB_COLUMNS, DERIVED_SOURCE_COLUMNS, compute_derived_metrics
+from synthetic_data import generate_export
+
+def _stored_rows(url, table='student_courses'):
+    """按 id 顺序读回写入的记录，去掉每次导入都不同的 id 和导入时间"""
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT * FROM {table} ORDER BY id")
+    frame = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+    conn.close()
+    return frame.drop(columns=['id', 'import_date'])
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb', 'mysql'])
+def test_bulk_modes_store_same_rows_as_row_mode(create_database, tmp_path, backend):
+    """批量插入和 LOAD DATA 装载写入的记录与逐行插入完全一致，包括需要转义的制表符、换行和反斜杠"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 600, seed=3)
+    export = pd.read_csv(path, dtype=str, keep_default_na=False)
+    export.loc[:2, '学校'] = ['第一\t小学', '第二\n小学', 'C:\\第三小学']
+    export.to_csv(path, index=False, encoding='utf-8')
+    
+    stored = {}
+    for mode in ('row', 'batch', 'infile'):
+        # MySQL 只有一个测试库，每种模式重新清空后导入
+        url = create_database(backend, name=mode)
+        conn = connect(url)
+        assert import_to_mysql(process_csv_file(path), conn, conn.cursor(), batch_size=250, mode=mode)
+        conn.close()
+        stored[mode] = _stored_rows(url)
+    
+    assert len(stored['row']) == 600
+    assert stored['row']['school'].tolist()[:3] == ['第一\t小学', '第二\n小学', 'C:\\第三小学']
+    pd.testing.assert_frame_equal(stored['batch'], stored['row'])
+    pd.testing.assert_frame_equal(stored['infile'], stored['row'])
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb', 'mysql'])
+def test_reimporting_same_snapshot_is_a_no_op(create_database, tmp_path, backend):
+    """同一快照重复导入时跳过；强制重新导入也只判定为未变化，不写入任何记录"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 500, seed=4)
+    url = create_database(backend)
+    conn = connect(url)
+    first = delta_import(process_csv_file(path), conn, conn.cursor(), datetime(2025, 1, 1), batch_size=200)
+    conn.close()
+    before = _stored_rows(url)
+    
+    conn = connect(url)
+    cursor = conn.cursor()
+    again = delta_import(process_csv_file(path), conn, cursor, datetime(2025, 1, 1))
+    forced = delta_import(process_csv_file(path), conn, cursor, datetime(2025, 1, 1), force=True)
+    conn.close()
+    
+    assert first['inserted'] == len(before) > 0
+    assert again == {'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': 0, 'skipped': True}
+    assert forced == {'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': len(before), 'skipped': False}
+    pd.testing.assert_frame_equal(_stored_rows(url), before)
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb'])
+def test_streaming_import_matches_single_shot_import(create_database, tmp_path, backend):
+    """分块流式导入写入的记录和校验报告与整体读取后导入一致，报告中的行号跨数据块连续"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 1000, seed=6)
+    export = pd.read_csv(path, dtype=str, keep_default_na=False)
+    export.loc[[5, 640], '购买数量'] = '很多课时'
+    export.to_csv(path, index=False, encoding='utf-8')
+    
+    single_url = create_database(backend, name='single')
+    conn = connect(single_url)
+    assert import_to_mysql(process_csv_file(path), conn, conn.cursor(), batch_size=300, mode='batch')
+    conn.close()
+    single_report = pd.read_csv(rejection_report_path(path))
+    
+    stream_url = create_database(backend, name='stream')
+    conn = connect(stream_url)
+    assert stream_import(path, conn, conn.cursor(), chunksize=170, queue_size=2, batch_size=100)
+    conn.close()
+    stream_report = pd.read_csv(rejection_report_path(path))
+    
+    pd.testing.assert_frame_equal(_stored_rows(stream_url), _stored_rows(single_url))
+    pd.testing.assert_frame_equal(stream_report, single_report)
+    assert stream_report['列'].tolist() == ['购买数量', '购买数量']
+    assert stream_report['行号'].iloc[1] > 170
+
+def test_rejected_cells_are_reported(tmp_path):
+    """带单位的数值和其他写法的日期照常解析；无法解析的单元格记为0或空，并按CSV行号写入校验报告"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 200, seed=7)
+    export = pd.read_csv(path, dtype=str, keep_default_na=False)
+    export.loc[0, ['购买数量', '到期时间']] = ['69课时', '2026-03-01']
+    export.loc[3, '购买数量'] = '很多课时'
+    export.loc[10, '缺课次数'] = '3次'
+    export.loc[[20, 21], '到期时间'] = ['明年', '']
+    export.to_csv(path, index=False, encoding='utf-8')
+    
+    cleaned = process_csv_file(path)
+    report = pd.read_csv(rejection_report_path(path), dtype={'原始值': str})
+    
+    assert report.to_dict('records') == [
+        {'行号': 5, '列': '购买数量', '原始值': '很多课时', '原因': '无法解析为数值'},
+        {'行号': 12, '列': '缺课次数', '原始值': '3次', '原因': '无法解析为数值'},
+        {'行号': 22, '列': '到期时间', '原始值': '明年', '原因': '无法解析为日期'}
+    ]
+    assert cleaned.loc[0, '购买数量'] == 69 and cleaned.loc[0, '到期时间'] == pd.Timestamp('2026-03-01')
+    assert cleaned.loc[3, '购买数量'] == 0 and cleaned.loc[10, '缺课次数'] == 0
+    assert cleaned.loc[[20, 21], '到期时间'].isna().all()
+    
+    # 修正后重新处理，旧的校验报告被删除
+    export.loc[3, '购买数量'] = '12课时'
+    export.loc[10, '缺课次数'] = '3'
+    export.loc[20, '到期时间'] = ''
+    export.to_csv(path, index=False, encoding='utf-8')
+    process_csv_file(path)
+    assert not os.path.exists(rejection_report_path(path))
+
+def _derived_columns(url):
+    """读取保存的派生指标，以及按统一定义由保存的源列重新计算的值"""
+    conn = connect(url)
+    cursor = conn.cursor()
+    columns = DERIVED_SOURCE_COLUMNS + DERIVED_DB_COLUMNS
+    cursor.execute(f"SELECT {', '.join(columns)} FROM student_courses ORDER BY id")
+    stored = pd.DataFrame(cursor.fetchall(), columns=columns)
+    conn.close()
+    expected = compute_derived_metrics(stored)
+    expected['attendance_group'] = expected['attendance_group'].astype(object)
+    return stored[DERIVED_DB_COLUMNS], expected
+
+@pytest.mark.parametrize('backend,layout', [('sqlite', 'wide'), ('sqlite', 'normalized'), ('duckdb', 'wide'),
+                                            ('duckdb', 'normalized')])
+def test_derived_columns_after_import_and_backfill(create_database, tmp_path, backend, layout):
+    """导入和增量更新时写入派生指标；派生值为空的旧记录在建表检查时补算，结果与统一定义一致"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 400, seed=15)
+    changed = pd.read_csv(path, dtype=str, keep_default_na=False)
+    changed.loc[:99, '缺课次数'] = '30'
+    changed_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    changed.to_csv(changed_path, index=False, encoding='utf-8')
+    url = create_database(backend, layout)
+    conn = connect(url)
+    cursor = conn.cursor()
+    assert delta_import(process_csv_file(path), conn, cursor, datetime(2025, 1, 1))
+    assert delta_import(process_csv_file(changed_path), conn, cursor, datetime(2025, 1, 2))['updated'] > 0
+    conn.close()
+    
+    stored, expected = _derived_columns(url)
+    assert stored['attendance_rate'].notna().all()
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False)
+    
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute(f"UPDATE {fact_table(layout)} SET {', '.join(f'{col} = NULL' for col in DERIVED_DB_COLUMNS)} "
+                   f"WHERE id <= 150")
+    conn.commit()
+    assert create_database_and_table(conn, cursor, None, layout)
+    conn.close()
+    
+    pd.testing.assert_frame_equal(_derived_columns(url)[0], stored)
@@ -0,0 +1,61 @@
+import os
+import shutil
+import pandas as pd
+from export_watcher import NEWLINE_GRACE_SECONDS, SETTLE_SECONDS, ingest_export, scan_exports
+from storage_backend import connect
+from synthetic_data import generate_export
+
+def _write_export(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+def test_stable_file_is_ready_after_settling(tmp_path):
+    """大小和修改时间保持不变 settle 秒后即可导入"""
+    path = _write_export(tmp_path, '学生报读课程20250101000000.csv', b'a,b\r\n1,2\r\n')
+    pending = {}
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=0) == []
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=SETTLE_SECONDS - 1) == []
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=SETTLE_SECONDS) == [path]
+
+def test_file_without_trailing_newline_is_imported_after_grace(tmp_path):
+    """不以换行结尾的完整文件多等待一段时间后仍会导入，不会一直被跳过"""
+    path = _write_export(tmp_path, '学生报读课程20250101000000.csv', b'a,b\r\n1,2')
+    pending = {}
+    scan_exports(str(tmp_path), {'files': {}}, pending, now=0)
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=SETTLE_SECONDS) == []
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=SETTLE_SECONDS + NEWLINE_GRACE_SECONDS) == [path]
+
+def test_changing_file_restarts_the_settle_timer(tmp_path):
+    """文件变化后重新计时，第一次发现的时间保持不变"""
+    path = _write_export(tmp_path, '学生报读课程20250101000000.csv', b'a,b\r\n')
+    pending = {}
+    scan_exports(str(tmp_path), {'files': {}}, pending, now=0)
+    with open(path, 'ab') as f:
+        f.write(b'1,2\r\n')
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=SETTLE_SECONDS) == []
+    assert pending[path]['first_seen'] == 0
+    assert scan_exports(str(tmp_path), {'files': {}}, pending, now=2 * SETTLE_SECONDS) == [path]
+
+def test_copy_of_an_older_snapshot_is_imported(create_database, tmp_path):
+    """与更早快照内容相同的文件照常导入，只有与最近一次导入的快照相同的副本才跳过"""
+    first = generate_export(str(tmp_path / '学生报读课程20250601000000.csv'), 300, seed=3)
+    pd.read_csv(first, dtype=str, keep_default_na=False).head(50).to_csv(
+        tmp_path / '学生报读课程20250602000000.csv', index=False, encoding='utf-8')
+    shutil.copyfile(first, tmp_path / '学生报读课程20250603000000.csv')
+    shutil.copyfile(first, tmp_path / '学生报读课程20250604000000.csv')
+    
+    conn = connect(create_database('sqlite'))
+    cursor = conn.cursor()
+    ledger = {'files': {}}
+    imported, active = [], []
+    for day in (1, 2, 3, 4):
+        imported.append(ingest_export(str(tmp_path / f"学生报读课程202506{day:02d}000000.csv"), conn, cursor, ledger))
+        cursor.execute("SELECT COUNT(*) FROM student_courses WHERE removed_at IS NULL")
+        active.append(cursor.fetchone()[0])
+    conn.close()
+    
+    assert imported == [True, True, True, False]
+    assert active[1] < active[0]
+    assert active[2] == active[3] == active[0]
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import socket
+from contextlib import asynccontextmanager
+from batch_import import create_pool
+from ingest_service import IngestService
+from synthetic_data import generate_export
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def _request(port, request, body=b''):
+    """发送一个HTTP请求，返回 (状态码, 响应内容)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), json.loads(payload)
+
+@asynccontextmanager
+async def _running(service):
+    """在后台运行 serve，服务可以响应后返回端口，结束时取消服务"""
+    port = _free_port()
+    task = asyncio.create_task(service.serve('127.0.0.1', port))
+    for _ in range(100):
+        try:
+            await _request(port, b'GET /health HTTP/1.1\r\n\r\n')
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    try:
+        yield port
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+async def _upload(port, filename, content, mode):
+    """上传文件，接受后等待任务结束，返回 (状态码, 响应内容或任务状态)"""
+    request = (f"POST /imports?mode={mode}&filename={filename} HTTP/1.1\r\n"
+               f"Content-Length: {len(content)}\r\n\r\n").encode('utf-8')
+    status, job = await _request(port, request, content)
+    while status == 202 and job['state'] not in ('done', 'failed'):
+        await asyncio.sleep(0.05)
+        _, job = await _request(port, f"GET /imports/{job['id']} HTTP/1.1\r\n\r\n".encode('utf-8'))
+    return status, job
+
+def _service(create_database, tmp_path, mode='batch'):
+    pool, writers = create_pool(create_database('sqlite'), 1)
+    return IngestService(pool, writers=writers, workers=1, mode=mode, upload_dir=str(tmp_path / 'uploads'))
+
+def _export(tmp_path, filename):
+    path = generate_export(str(tmp_path / filename), 500, seed=13)
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_delta_job_records_counts_and_utf8_filename(create_database, tmp_path):
+    """增量导入任务记录新增、更新和删除的记录数，查询参数中未编码的中文文件名按UTF-8解析"""
+    filename = '学生报读课程20250101000000.csv'
+    content = _export(tmp_path, filename)
+    service = _service(create_database, tmp_path)
+    
+    async def run():
+        async with _running(service) as port:
+            return await _upload(port, filename, content, 'delta')
+    
+    status, job = asyncio.run(run())
+    
+    assert status == 202
+    assert job['state'] == 'done', job['error']
+    assert job['file'] == filename
+    assert 0 < job['inserted'] <= job['rows'] == 500
+    assert job['updated'] == job['removed'] == job['failed'] == 0
+
+def test_infile_request_is_rejected_unless_service_uses_infile(create_database, tmp_path):
+    """服务不是以 infile 模式启动时，单个请求指定 infile 直接返回400，不会在写入时失败"""
+    filename = '学生报读课程20250101000000.csv'
+    content = _export(tmp_path, filename)
+    service = _service(create_database, tmp_path)
+    
+    async def run():
+        async with _running(service) as port:
+            return await _upload(port, filename, content, 'infile')
+    
+    status, body = asyncio.run(run())
+    
+    assert status == 400
+    assert 'infile' in body['error']
+    assert service.jobs == {}
@@ -0,0 +1,82 @@
+import csv
+import pytest
+from institution_catalog import (CATALOG_CSV, RECOMMENDED_CSV, SCORE_REQUIREMENT_CSV, InstitutionCatalog,
+                                 alevel_points, parse_threshold)
+
+def _write_csv(path, header, rows):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+@pytest.fixture
+def catalog(tmp_path):
+    """由三个小CSV组成的目录：CRS名单、推荐院校和成绩要求，同一学校在不同文件中写法不同"""
+    _write_csv(tmp_path / CATALOG_CSV, ['地区', '类型', '名称', '链接', '标记'], [
+        ['江苏', '合作办学机构', '西交利物浦大学（Xi’an Jiaotong-Liverpool University）',
+         'https://www.crs.jsj.edu.cn/aproval/detail/1', '▲'],
+        ['上海', '合作办学机构', '上海纽约大学（New York University Shanghai）',
+         'https://www.crs.jsj.edu.cn/aproval/detail/2', '▲, ■'],
+        ['广东', '合作办学机构', '北京师范大学-香港浸会大学联合国际学院',
+         'https://www.crs.jsj.edu.cn/aproval/detail/3', '●']
+    ])
+    _write_csv(tmp_path / RECOMMENDED_CSV,
+               ['学校名称', '地区', '学制模式', '接受成绩类型', '外方院校', '主要专业方向', '网址'], [
+        ['西交利物浦大学', '江苏', '4+0', 'A-level/IB', '利物浦大学', '金融', ''],
+        ['上海纽约大学', '上海', '4+0', 'SAT/ACT/AP/IB', '纽约大学', '工程学', '']
+    ])
+    _write_csv(tmp_path / SCORE_REQUIREMENT_CSV,
+               ['学校名称', '地区', '学制模式', 'SAT', 'IB', 'A-level', '雅思', '托福', '官网'], [
+        ['西交利物浦大学', '江苏', '4+0', '不作要求', '接受', 'AAB-BBC', '6.5分以上', '90分以上', ''],
+        ['上海纽约大学', '上海', '4+0', '接受', '接受', '至少AAA', '7.5+', '100分以上', ''],
+        ['北京师范-香港浸会联合国际学院', '广东', '2+2', '接受', '接受', '接受', '6.0分以上', '80分以上', '']
+    ])
+    return InstitutionCatalog(str(tmp_path))
+
+@pytest.mark.parametrize('text,test,expected', [
+    ('7.5+', '雅思', 7.5),
+    ('6.5分以上', '雅思', 6.5),
+    ('总分30-36', 'IB', 30.0),
+    ('至少BBB', 'A-level', 120.0),
+    ('AAB-BBC', 'A-level', 112.0),
+    ('BBC-AAB', 'A-level', 112.0),
+    ('A*AA', 'A-level', 152.0),
+    ('不作要求', '雅思', None),
+    ('接受', 'SAT', None),
+    ('', 'A-level', None)
+])
+def test_parse_threshold(text, test, expected):
+    """分数要求解析为最低分数，A-level 区间取较低一端，没有具体分数线时为None"""
+    assert parse_threshold(text, test) == expected
+
+def test_alevel_points():
+    """A-level 等级组合按 UCAS Tariff 折算"""
+    assert alevel_points('BBB') == 120
+    assert alevel_points('A*AB') == 144
+
+def _names(records):
+    return [record['名称'] for record in records]
+
+def test_sources_are_merged_by_name(catalog):
+    """不同数据源中的同一学校（含简称和英文名）合并为一条记录"""
+    assert len(catalog) == 3
+    xjtlu = catalog.prefix_search('西交')[0]
+    assert xjtlu['英文名称'] == 'Xi’an Jiaotong-Liverpool University'
+    assert xjtlu['成绩类型'] == {'A-level', 'IB'}
+    assert xjtlu['分数线'] == {'A-level': 112.0, '雅思': 6.5, '托福': 90.0}
+    assert catalog.prefix_search('北京师范')[0]['学制模式'] == '2+2'
+
+def test_query_combines_indexes_and_score_thresholds(catalog):
+    """各条件取交集；分数线要求申请人成绩不低于学校的最低要求"""
+    assert _names(catalog.query(mode='4+0', credentials=['IB'])) == ['西交利物浦大学', '上海纽约大学']
+    assert _names(catalog.query(scores={'雅思': 6.5})) == ['西交利物浦大学', '北京师范大学-香港浸会大学联合国际学院']
+    assert _names(catalog.query(scores={'A-level': alevel_points('BBC')})) == ['西交利物浦大学']
+    assert _names(catalog.query(scores={'A-level': alevel_points('BBB')})) == ['西交利物浦大学']
+    assert _names(catalog.query(markers=['■'], scores={'雅思': 8})) == ['上海纽约大学']
+    assert catalog.query(region='江苏', partner='纽约大学') == []
+
+def test_name_search(catalog):
+    """前缀搜索同时匹配中文名和英文名，模糊搜索按名称相似度排序"""
+    assert _names(catalog.prefix_search('new york')) == ['上海纽约大学']
+    score, record = catalog.fuzzy_search('西交利物浦')[0]
+    assert record['名称'] == '西交利物浦大学' and score > 0.5
@@ -0,0 +1,88 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+from direct_mysql_import import create_database_and_table, delta_import, import_to_mysql, process_csv_file
+from risk_scoring import RISK_TABLE, refresh_risk_scores
+from storage_backend import connect, parse_database_url
+from synthetic_data import generate_export
+
+# 两次导入的时间不同，比较时不包括导入时间
+EXCLUDED_COLUMNS = ['import_date']
+
+def _student_courses(url):
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM student_courses ORDER BY id")
+    columns = [column[0] for column in cursor.description]
+    frame = pd.DataFrame(cursor.fetchall(), columns=columns).drop(columns=EXCLUDED_COLUMNS)
+    conn.close()
+    return frame.astype(str)
+
+def _import(url, snapshots):
+    """先整表导入第一个快照，再增量导入第二个快照"""
+    conn = connect(url)
+    cursor = conn.cursor()
+    import_to_mysql(snapshots[0], conn, cursor, batch_size=500, mode='batch')
+    assert delta_import(snapshots[1], conn, cursor, datetime(2025, 1, 2), batch_size=500)
+    conn.close()
+
+@pytest.fixture
+def snapshots(tmp_path):
+    """两个合成快照，第二个快照修改了部分报读记录的跟进人和年级"""
+    first_path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 2000, seed=7)
+    second = pd.read_csv(first_path, dtype=str, keep_default_na=False)
+    second.loc[:99, '跟进人'] = '王琪'
+    second.loc[100:199, '年级'] = '三年级'
+    second_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    second.to_csv(second_path, index=False, encoding='utf-8')
+    return [process_csv_file(first_path), process_csv_file(second_path)]
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb', 'mysql'])
+def test_view_matches_wide_table(create_database, snapshots, backend):
+    """同一学员的各条报读记录跟进人、学管师等不同时，规范化布局的视图与宽表逐格一致"""
+    wide_url = create_database(backend, 'wide', name='wide')
+    _import(wide_url, snapshots)
+    wide = _student_courses(wide_url)
+    
+    normalized_url = create_database(backend, 'normalized', name='normalized')
+    _import(normalized_url, snapshots)
+    normalized = _student_courses(normalized_url)
+    
+    # 合成数据中同一学员的报读记录跟进人各不相同，确保比较覆盖了这种情况
+    per_student = wide.groupby(['student_id', 'student_name'])['follow_up_person'].nunique()
+    assert (per_student > 1).any()
+    pd.testing.assert_frame_equal(normalized, wide)
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb', 'mysql'])
+def test_migration_keeps_enrollment_ids_for_risk_scores(create_database, snapshots, tmp_path, backend):
+    """宽表迁移到规范化布局后报读记录沿用原 id，已有的风险评分仍对应原来的记录，之后新增的记录不与其冲突"""
+    url = create_database(backend, 'wide')
+    _import(url, snapshots)
+    conn = connect(url)
+    cursor = conn.cursor()
+    # 删除过记录或事务回滚后宽表的 id 不连续
+    cursor.execute("DELETE FROM student_courses WHERE id BETWEEN %s AND %s", (100, 300))
+    conn.commit()
+    refresh_risk_scores(conn, cursor)
+    scored_sql = (f"SELECT r.enrollment_id, r.student_name, r.course_name, r.class_name, c.student_name, "
+                  f"c.course_name, c.class_name FROM {RISK_TABLE} r JOIN student_courses c ON c.id = r.enrollment_id "
+                  f"ORDER BY r.enrollment_id")
+    cursor.execute(scored_sql)
+    before = cursor.fetchall()
+    cursor.execute("SELECT MAX(id) FROM student_courses")
+    max_id = cursor.fetchone()[0]
+    
+    assert create_database_and_table(conn, cursor, parse_database_url(url).get('database'), 'normalized')
+    cursor.execute(scored_sql)
+    after = cursor.fetchall()
+    
+    assert len(after) == len(before) > 0
+    assert after == before
+    assert all(row[1:4] == row[4:] for row in after)
+    
+    # 迁移后新增的记录从宽表最大的 id 之后编号
+    path = generate_export(str(tmp_path / '学生报读课程20250103000000.csv'), 50, seed=99)
+    counts = delta_import(process_csv_file(path), conn, cursor, datetime(2025, 1, 3), batch_size=500)
+    cursor.execute("SELECT COUNT(*) FROM student_courses WHERE id > %s", (max_id,))
+    assert cursor.fetchone()[0] == counts['inserted'] > 0
+    conn.close()
@@ -0,0 +1,34 @@
+import threading
+import pipeline_metrics
+from pipeline_metrics import record_round_trip, stage
+
+def test_stage_counts_only_its_own_threads_round_trips(monkeypatch):
+    """其他线程在阶段执行期间发出的数据库往返不计入该阶段，但计入本次运行的总数"""
+    monkeypatch.setitem(pipeline_metrics._run, 'db_round_trips', 0)
+    monkeypatch.setitem(pipeline_metrics._run, 'stages', [])
+    started, finish = threading.Event(), threading.Event()
+    records = {}
+    
+    def worker(name, count):
+        with stage(name) as record:
+            if name == 'first':
+                started.set()
+                record_round_trip(count)
+                finish.wait()
+            else:
+                started.wait()
+                record_round_trip(count)
+        records[name] = record
+    
+    # 第一个阶段开始后，第二个线程在其结束前完成自己的阶段
+    first = threading.Thread(target=worker, args=('first', 2))
+    second = threading.Thread(target=worker, args=('second', 5))
+    first.start()
+    second.start()
+    second.join()
+    finish.set()
+    first.join()
+    
+    assert records['first']['db_round_trips'] == 2
+    assert records['second']['db_round_trips'] == 5
+    assert pipeline_metrics._run['db_round_trips'] == 7
@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+import pandas as pd
+import pytest
+import advanced_analytics
+import clustering_engine
+import report_fanout
+from advanced_analytics import load_data, reset_loaded_data
+from direct_mysql_import import delta_import, process_csv_file
+from report_fanout import (FANOUT_COLUMNS, INDEX_NAME, REPORT_NAME, group_values, open_store, read_rows, run_fanout,
+                           safe_name, write_store)
+from storage_backend import DATABASE_URL_ENV, connect
+from synthetic_data import generate_export
+
+@pytest.fixture
+def analytics_data(create_database, tmp_path, monkeypatch):
+    """导入合成快照的数据库；分析端的缓存、聚类模型和共享列式文件都写到临时目录"""
+    url = create_database('sqlite')
+    monkeypatch.setenv(DATABASE_URL_ENV, url)
+    monkeypatch.setattr(advanced_analytics, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(clustering_engine, 'MODEL_DIR', str(tmp_path / 'models'))
+    monkeypatch.setattr(report_fanout, 'STORE_DIR', str(tmp_path / 'store'))
+    monkeypatch.setattr(report_fanout, 'SECTION_CACHE_DIR', str(tmp_path / 'sections'))
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 1200, seed=23)
+    conn = connect(url)
+    assert delta_import(process_csv_file(path), conn, conn.cursor(), datetime(2025, 1, 1))
+    conn.close()
+    reset_loaded_data()
+    yield load_data()
+    reset_loaded_data()
+
+def test_store_round_trip(analytics_data, tmp_path):
+    """从内存映射的列式文件按分组取出的行与原数据中该分组的行一致"""
+    df = analytics_data.assign(cluster=analytics_data.index % 3)
+    groups = {'tutor': group_values(df, 'tutor')}
+    store_dir = tmp_path / 'columns'
+    store_dir.mkdir()
+    
+    manifest = write_store(df, str(store_dir), groups)
+    store = open_store(str(store_dir))
+    
+    assert sum(group['stop'] - group['start'] for group in manifest['groups']['tutor']) == len(df)
+    for group in manifest['groups']['tutor']:
+        rows = read_rows(store, store['orders']['tutor'][group['start']:group['stop']])
+        expected = df.loc[groups['tutor'] == group['name'], FANOUT_COLUMNS].reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows, expected, check_categorical=False)
+
+def test_fanout_writes_one_report_per_tutor_and_campus(analytics_data, tmp_path):
+    """每个学管师和校区（包括未分配）各生成一份报告，记录数与各分组的行数一致，索引列出所有分组"""
+    output_dir = tmp_path / 'reports'
+    
+    results = run_fanout(groupings=('tutor', 'campus'), output_dir=str(output_dir), workers=2, charts=False)
+    
+    for grouping in ('tutor', 'campus'):
+        expected = group_values(analytics_data, grouping).value_counts().to_dict()
+        produced = {result['name']: result['rows'] for result in results if result['grouping'] == grouping}
+        assert produced == expected
+        for name, rows in expected.items():
+            with open(output_dir / grouping / safe_name(name) / REPORT_NAME, encoding='utf-8') as f:
+                assert f"共 {rows} 条报读记录" in f.read()
+    assert {result['status'] for result in results} == {'成功'}
+    assert report_fanout.MISSING_GROUP in {result['name'] for result in results if result['grouping'] == 'tutor'}
+    with open(output_dir / INDEX_NAME, encoding='utf-8') as f:
+        assert f.read().count(f"[{REPORT_NAME}]") == len(results)
+    assert os.listdir(tmp_path / 'store') == []
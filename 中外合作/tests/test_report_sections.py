@@ -0,0 +1,71 @@
+import pandas as pd
+from report_sections import _section_path, compute_sections
+
+def _sections(calls, version=1):
+    """三个部分：totals 和 sizes 各依赖一个输入，summary 依赖前两个部分；calls 按顺序记录实际计算的部分"""
+    def totals(scores):
+        calls.append('totals')
+        total = int(scores['score'].sum())
+        return total, f"总分 {total}"
+    
+    def sizes(groups):
+        calls.append('sizes')
+        return len(groups), f"共 {len(groups)} 组"
+    
+    def summary(total, size):
+        calls.append('summary')
+        return total / size, f"平均 {total / size:.1f}"
+    
+    return {
+        'totals': {'deps': ['scores'], 'compute': totals, 'version': version},
+        'sizes': {'deps': ['groups'], 'compute': sizes},
+        'summary': {'deps': ['totals', 'sizes'], 'compute': summary}
+    }
+
+def _inputs(scores):
+    return {'scores': pd.DataFrame({'score': scores}), 'groups': pd.Series(['甲', '乙'])}
+
+def test_sections_run_in_dependency_order_and_reuse_cache(tmp_path):
+    """各部分按依赖顺序计算；输入不变时全部复用，只有依赖变化的部分及其下游重新计算"""
+    cache_dir = str(tmp_path / 'sections')
+    calls = []
+    
+    results, markdown, summary = compute_sections(_sections(calls), _inputs([3, 5]), cache_dir)
+    assert calls == ['totals', 'sizes', 'summary']
+    assert results == {'totals': 8, 'sizes': 2, 'summary': 4.0}
+    assert markdown['summary'] == '平均 4.0'
+    
+    calls.clear()
+    results, _, summary = compute_sections(_sections(calls), _inputs([3, 5]), cache_dir)
+    assert calls == []
+    assert results == {'totals': 8, 'sizes': 2, 'summary': 4.0}
+    assert {info['status'] for info in summary.values()} == {'reused'}
+    
+    # 输入变化但总分不变：totals 重新计算，输出的文本相同，下游的 summary 仍然复用
+    compute_sections(_sections(calls), _inputs([5, 3]), cache_dir)
+    assert calls == ['totals']
+    
+    calls.clear()
+    results, _, _ = compute_sections(_sections(calls), _inputs([5, 7]), cache_dir)
+    assert calls == ['totals', 'summary']
+    assert results['summary'] == 6.0
+
+def test_version_force_and_damaged_cache_recompute(tmp_path):
+    """部分的版本号变化、强制重新计算或缓存文件损坏时重新计算"""
+    cache_dir = str(tmp_path / 'sections')
+    calls = []
+    compute_sections(_sections(calls), _inputs([3, 5]), cache_dir)
+    
+    calls.clear()
+    compute_sections(_sections(calls, version=2), _inputs([3, 5]), cache_dir)
+    assert calls == ['totals']
+    
+    calls.clear()
+    with open(_section_path(cache_dir, 'sizes'), 'wb') as f:
+        f.write(b'damaged')
+    compute_sections(_sections(calls, version=2), _inputs([3, 5]), cache_dir)
+    assert calls == ['sizes']
+    
+    calls.clear()
+    compute_sections(_sections(calls, version=2), _inputs([3, 5]), cache_dir, force=True)
+    assert calls == ['totals', 'sizes', 'summary']
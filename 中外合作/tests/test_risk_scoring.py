@@ -0,0 +1,100 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from direct_mysql_import import delta_import, import_to_mysql, process_csv_file
+from risk_scoring import RISK_TABLE, refresh_risk_scores, score_frame, score_record
+from storage_backend import connect
+from synthetic_data import generate_export
+
+# 评分日期固定，到期因素不随运行测试的日期变化
+AS_OF = '2025-05-06'
+
+@pytest.fixture
+def enrollments(create_database, tmp_path):
+    """合成导出文件经过导入时的清洗和类型转换后，按数据库列名读回的报读记录"""
+    conn = connect(create_database('sqlite'))
+    cursor = conn.cursor()
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 3000, seed=11)
+    import_to_mysql(process_csv_file(path), conn, cursor, batch_size=1000, mode='batch')
+    cursor.execute("SELECT * FROM student_courses")
+    frame = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+    conn.close()
+    return frame
+
+def test_score_record_matches_score_frame(enrollments):
+    """单条评分与批量评分使用同一组公式，逐条结果一致"""
+    # 补充缺失值和边界情况：没有购买记录、缺少出勤率、已过期和没有到期时间
+    edge_cases = pd.DataFrame([
+        {'purchased_amount': 0, 'gifted_amount': 0, 'remaining_amount': 3, 'remaining_fee': 0},
+        {'purchased_amount': 10, 'gifted_amount': 0, 'remaining_amount': 10, 'attendance_rate': None,
+         'course_completion_rate': None, 'expiry_date': '2025-01-01'},
+        {'purchased_amount': 10, 'gifted_amount': 2, 'remaining_amount': 0, 'expiry_date': None},
+        {'purchased_amount': 20, 'gifted_amount': 0, 'remaining_amount': 5, 'remaining_fee': 99999,
+         'attendance_rate': 0.2, 'course_completion_rate': 75, 'expiry_date': '2025-06-01'}
+    ])
+    frame = pd.concat([enrollments, edge_cases], ignore_index=True)
+    batch = score_frame(frame, AS_OF)
+    records = [score_record(record, AS_OF) for record in frame.to_dict('records')]
+    
+    np.testing.assert_allclose([record[0] for record in records], batch['risk_score'], atol=0.01)
+    assert [record[1] for record in records] == batch['risk_level'].tolist()
+    assert [record[2] for record in records] == batch['main_factor'].tolist()
+
+def _scores(url):
+    conn = connect(url)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT enrollment_id, risk_score, risk_level, main_factor FROM {RISK_TABLE} "
+                   f"ORDER BY enrollment_id")
+    scores = pd.DataFrame(cursor.fetchall(), columns=['enrollment_id', 'risk_score', 'risk_level', 'main_factor'])
+    conn.close()
+    return scores
+
+@pytest.mark.parametrize('backend,layout', [('sqlite', 'wide'), ('sqlite', 'normalized'), ('duckdb', 'wide'),
+                                            ('duckdb', 'normalized'), ('mysql', 'wide')])
+def test_import_scores_match_full_refresh(create_database, tmp_path, backend, layout):
+    """导入时只为新增、变化的记录评分并删除消失记录的评分，结果与整表重新计算一致"""
+    first_path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 1500, seed=5)
+    second = pd.read_csv(first_path, dtype=str, keep_default_na=False)
+    second.loc[:199, '缺课次数'] = '40'
+    second = second.drop(index=range(200, 300))
+    second_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    second.to_csv(second_path, index=False, encoding='utf-8')
+    
+    url = create_database(backend, layout)
+    conn = connect(url)
+    cursor = conn.cursor()
+    import_to_mysql(process_csv_file(first_path), conn, cursor, batch_size=400, mode='batch')
+    assert delta_import(process_csv_file(second_path), conn, cursor, datetime(2025, 1, 2), batch_size=400)
+    conn.close()
+    incremental = _scores(url)
+    
+    conn = connect(url)
+    cursor = conn.cursor()
+    refresh_risk_scores(conn, cursor)
+    conn.close()
+    full = _scores(url)
+    
+    assert len(full) > 0
+    pd.testing.assert_frame_equal(incremental, full)
+
+@pytest.mark.parametrize('mode', ['row', 'batch'])
+def test_scores_are_saved_with_each_import_batch(create_database, tmp_path, mode):
+    """逐行模式用 score_record、批量模式用 score_frame 在写入前评分，随每批记录一起提交，与整表重新计算一致"""
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 700, seed=9)
+    url = create_database('sqlite')
+    conn = connect(url)
+    cursor = conn.cursor()
+    assert import_to_mysql(process_csv_file(path), conn, cursor, batch_size=300, mode=mode)
+    cursor.execute("SELECT COUNT(*) FROM student_courses")
+    imported = cursor.fetchone()[0]
+    conn.close()
+    saved = _scores(url)
+    
+    conn = connect(url)
+    cursor = conn.cursor()
+    refresh_risk_scores(conn, cursor)
+    conn.close()
+    
+    assert len(saved) == imported > 0
+    pd.testing.assert_frame_equal(saved, _scores(url))
@@ -0,0 +1,65 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+from advanced_analytics import course_stats_from_sql, daily_stats_from_sql
+from daily_rollup import read_rollup
+from direct_mysql_import import delta_import, process_csv_file
+from risk_scoring import RISK_TABLE
+from storage_backend import connect, parse_database_url
+from student_schema import DB_COLUMNS, DERIVED_DB_COLUMNS, apply_dtypes
+from synthetic_data import generate_export
+
+def test_parse_database_url():
+    """嵌入式数据库地址解析为文件路径，MySQL地址解析为连接参数"""
+    assert parse_database_url('sqlite:///student.db') == {'backend': 'sqlite', 'path': 'student.db'}
+    assert parse_database_url('duckdb:////data/student.duckdb') == {'backend': 'duckdb', 'path': '/data/student.duckdb'}
+    assert parse_database_url('sqlite://') == {'backend': 'sqlite', 'path': ':memory:'}
+    assert parse_database_url('mysql://root:@127.0.0.1:3307/student') == {
+        'backend': 'mysql', 'host': '127.0.0.1', 'port': 3307, 'user': 'root', 'password': '', 'database': 'student'}
+    with pytest.raises(ValueError):
+        parse_database_url('postgresql://localhost/student')
+
+def _snapshot(url):
+    """读取一个数据库中的明细、汇总和评分，统一为相同的类型以便比较"""
+    conn = connect(url)
+    cursor = conn.cursor()
+    columns = ['id'] + DB_COLUMNS + DERIVED_DB_COLUMNS + ['snapshot_time', 'removed_at']
+    cursor.execute(f"SELECT {', '.join(columns)} FROM student_courses ORDER BY id")
+    rows = apply_dtypes(pd.DataFrame(cursor.fetchall(), columns=columns))
+    rows[['snapshot_time', 'removed_at']] = rows[['snapshot_time', 'removed_at']].apply(pd.to_datetime)
+    cursor.execute(f"SELECT enrollment_id, risk_score, risk_level, main_factor FROM {RISK_TABLE} ORDER BY enrollment_id")
+    scores = pd.DataFrame(cursor.fetchall(), columns=['enrollment_id', 'risk_score', 'risk_level', 'main_factor'])
+    snapshot = {
+        'rows': rows,
+        'course_stats': course_stats_from_sql(conn).sort_index().astype(float),
+        'daily_stats': daily_stats_from_sql(conn).astype(float),
+        'rollup': read_rollup(conn).astype(float),
+        'scores': scores.astype({'enrollment_id': 'int64', 'risk_score': 'float64'})
+    }
+    conn.close()
+    return snapshot
+
+@pytest.mark.parametrize('layout', ['wide', 'normalized'])
+def test_sqlite_and_duckdb_store_and_aggregate_alike(create_database, tmp_path, layout):
+    """同样的两个快照增量导入 SQLite 和 DuckDB 后，明细、各项汇总和风险评分一致"""
+    first = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 600, seed=14)
+    second = pd.read_csv(first, dtype=str, keep_default_na=False)
+    second.loc[:99, '消耗数量'] = '3课时'
+    second = second.drop(index=range(100, 160))
+    second_path = str(tmp_path / '学生报读课程20250102000000.csv')
+    second.to_csv(second_path, index=False, encoding='utf-8')
+    
+    snapshots = {}
+    for backend in ('sqlite', 'duckdb'):
+        url = create_database(backend, layout)
+        conn = connect(url)
+        cursor = conn.cursor()
+        assert delta_import(process_csv_file(first), conn, cursor, datetime(2025, 1, 1), batch_size=250)
+        assert delta_import(process_csv_file(second_path), conn, cursor, datetime(2025, 1, 2), batch_size=250)
+        conn.close()
+        snapshots[backend] = _snapshot(url)
+    
+    assert snapshots['sqlite']['rows']['removed_at'].notna().any()
+    for name, expected in snapshots['sqlite'].items():
+        pd.testing.assert_frame_equal(snapshots['duckdb'][name], expected, check_categorical=False,
+                                      check_index_type=False, obj=name)
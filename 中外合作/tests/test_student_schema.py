@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+import advanced_analytics
+from advanced_analytics import load_data, reset_loaded_data
+from direct_mysql_import import import_to_mysql, process_csv_file
+from storage_backend import DATABASE_URL_ENV, connect
+from student_schema import COLUMN_MAPPING, DB_COLUMNS, DTYPES, apply_dtypes
+from synthetic_data import generate_export
+
+@pytest.mark.parametrize('backend', ['sqlite', 'duckdb'])
+def test_schema_round_trip(create_database, tmp_path, monkeypatch, backend):
+    """导入端清洗后的数据经过数据库和本地缓存读回，各列类型与统一定义一致，取值不变"""
+    url = create_database(backend)
+    monkeypatch.setenv(DATABASE_URL_ENV, url)
+    monkeypatch.setattr(advanced_analytics, 'CACHE_DIR', str(tmp_path / 'cache'))
+    path = generate_export(str(tmp_path / '学生报读课程20250101000000.csv'), 500, seed=8)
+    cleaned = process_csv_file(path)
+    conn = connect(url)
+    assert import_to_mysql(cleaned, conn, conn.cursor(), batch_size=200, mode='batch')
+    conn.close()
+    expected = apply_dtypes(cleaned.rename(columns=COLUMN_MAPPING))[DB_COLUMNS]
+    
+    reset_loaded_data()
+    try:
+        from_database = load_data()
+        reset_loaded_data()
+        from_cache = load_data()
+    finally:
+        reset_loaded_data()
+    
+    # 文本列在不同版本的pandas中可能是object或str类型，只检查其余列
+    typed = [col for col in DB_COLUMNS if DTYPES[col] != 'object']
+    for loaded in (from_database, from_cache):
+        assert {col: str(loaded[col].dtype) for col in typed} == {col: DTYPES[col] for col in typed}
+        pd.testing.assert_frame_equal(loaded[DB_COLUMNS], expected, check_categorical=False)